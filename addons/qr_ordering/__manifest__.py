@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 {
     'name': '扫码点餐 / QR Code Ordering',
-    'version': '18.0.1.0.0',
+    'version': '18.0.1.0.1',
     'category': 'Point of Sale',
     'summary': '客户扫描餐桌二维码自助点餐，订单同步到 POS',
     'description': '''
@@ -52,6 +52,7 @@ Features:
         'views/qr_table_views.xml',
         'views/qr_session_views.xml',
         'views/qr_order_views.xml',
+        'views/qr_floor_status_views.xml',
         'views/product_views.xml',
         'views/qr_ordering_menus.xml',
         'views/qr_ordering_templates.xml',
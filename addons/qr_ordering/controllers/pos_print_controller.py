@@ -2,6 +2,8 @@
 
 from odoo import http
 from odoo.http import request
+
+from ..services.request_metrics import instrumented
 import logging
 import json
 
@@ -12,6 +14,7 @@ class PosPrintController(http.Controller):
     """POS 打印任务控制器 - 供 POS 前端轮询和操作打印任务"""
 
     @http.route('/pos/print_jobs/pending', type='json', auth='user', methods=['POST'])
+    @instrumented
     def get_pending_jobs(self, config_id, limit=10, **kwargs):
         """
         获取待打印任务列表
@@ -69,6 +72,7 @@ class PosPrintController(http.Controller):
             }
 
     @http.route('/pos/print_jobs/claim', type='json', auth='user', methods=['POST'])
+    @instrumented
     def claim_job(self, job_id, client_id, **kwargs):
         """
         认领打印任务（原子操作）
@@ -124,7 +128,94 @@ class PosPrintController(http.Controller):
                 'message': str(e)
             }
 
+    @http.route('/pos/print_jobs/claim_next', type='json', auth='user', methods=['POST'])
+    @instrumented
+    def claim_next_jobs(self, config_id, client_id, max_jobs=10, **kwargs):
+        """
+        原子认领一批待打印任务并返回打印数据（一次请求完成拉取 + 认领）
+
+        Args:
+            config_id: POS 配置 ID
+            client_id: 客户端标识（IP/主机名）
+            max_jobs: 最多认领的任务数
+
+        Returns:
+            {
+                'success': True/False,
+                'jobs': [...],
+                'error': '...'
+            }
+        """
+        try:
+            pos_config = request.env['pos.config'].browse(config_id)
+            if not pos_config.exists():
+                return {
+                    'success': False,
+                    'error': 'INVALID_CONFIG',
+                    'message': 'POS 配置不存在'
+                }
+
+            max_jobs = max(1, min(int(max_jobs or 10), 50))
+            jobs = request.env['pos.print.job'].claim_next(config_id, client_id, max_jobs=max_jobs)
+
+            # 打印数据原样返回（JSON 文本），服务端不解析，客户端直接转发给打印代理
+            jobs_data = [{
+                'id': job.id,
+                'name': job.name,
+                'print_type': job.print_type,
+                'print_payload_raw': job.print_payload,
+                'printer_name': job.printer_name,
+                'qr_order_id': job.qr_order_id.id if job.qr_order_id else None,
+                'pos_order_id': job.pos_order_id.id if job.pos_order_id else None,
+                'trace_id': job.trace_id,
+            } for job in jobs]
+
+            return {
+                'success': True,
+                'jobs': jobs_data,
+                'count': len(jobs_data)
+            }
+
+        except Exception as e:
+            _logger.error(f"Failed to claim jobs for config {config_id}: {e}")
+            return {
+                'success': False,
+                'error': 'SERVER_ERROR',
+                'message': str(e)
+            }
+
+    @http.route('/pos/print_jobs/mark_batch', type='json', auth='user', methods=['POST'])
+    @instrumented
+    def mark_jobs_batch(self, client_id, done_ids=None, failed=None, **kwargs):
+        """
+        批量回写打印结果
+
+        Args:
+            client_id: 客户端标识（与认领时相同）
+            done_ids: 打印成功的任务 ID 列表
+            failed: 打印失败的任务 [{'job_id': x, 'error_message': '...'}, ...]
+
+        Returns:
+            {'success': True/False, 'done': n, 'failed': n, 'error': '...'}
+        """
+        try:
+            done_count, failed_count = request.env['pos.print.job'].mark_batch(client_id, done_ids, failed)
+            return {
+                'success': True,
+                'done': done_count,
+                'failed': failed_count,
+            }
+
+        except Exception as e:
+            _logger.error(f"Failed to mark print jobs: {e}")
+            return {
+                'success': False,
+                'error': 'SERVER_ERROR',
+                'message': str(e)
+            }
+
     @http.route('/pos/print_jobs/mark_done', type='json', auth='user', methods=['POST'])
+    @instrumented
     def mark_job_done(self, job_id, **kwargs):
         """
         标记任务完成
@@ -157,6 +248,7 @@ class PosPrintController(http.Controller):
             }
 
     @http.route('/pos/print_jobs/mark_failed', type='json', auth='user', methods=['POST'])
+    @instrumented
     def mark_job_failed(self, job_id, error_message='', **kwargs):
         """
         标记任务失败
@@ -190,6 +282,7 @@ class PosPrintController(http.Controller):
             }
 
     @http.route('/pos/print_jobs/retry', type='json', auth='user', methods=['POST'])
+    @instrumented
     def retry_job(self, job_id, **kwargs):
         """
         重试任务
@@ -221,7 +314,33 @@ class PosPrintController(http.Controller):
                 'message': str(e)
             }
 
+    @http.route('/pos/print_jobs/retry_printer', type='json', auth='user', methods=['POST'])
+    @instrumented
+    def retry_printer_jobs(self, config_id, printer_name, **kwargs):
+        """
+        手动批量重试该打印机的失败 / 死信任务（退避中的任务在打印机恢复后会自动释放）
+
+        Args:
+            config_id: POS 配置 ID
+            printer_name: 打印机名称
+
+        Returns:
+            {'success': True/False, 'count': n, 'error': '...'}
+        """
+        try:
+            count = request.env['pos.print.job'].action_retry_printer(config_id, printer_name)
+            return {'success': True, 'count': count}
+
+        except Exception as e:
+            _logger.error(f"Failed to retry jobs for printer {printer_name}: {e}")
+            return {
+                'success': False,
+                'error': 'SERVER_ERROR',
+                'message': str(e)
+            }
+
     @http.route('/pos/print_jobs/status', type='json', auth='user', methods=['POST'])
+    @instrumented
     def get_job_status(self, config_id, limit=20, **kwargs):
         """
         获取任务状态列表（用于调试面板）
@@ -265,6 +384,7 @@ class PosPrintController(http.Controller):
                     'printed_at': job.printed_at.isoformat() if job.printed_at else None,
                     'error_message': job.error_message,
                     'retry_count': job.retry_count,
+                    'next_attempt_at': job.next_attempt_at.isoformat() if job.next_attempt_at else None,
                     'trace_id': job.trace_id,
                     'qr_order_id': job.qr_order_id.id if job.qr_order_id else None,
                     'pos_order_id': job.pos_order_id.id if job.pos_order_id else None,
@@ -2,19 +2,56 @@
 
 import json
 import logging
-import base64
 import hashlib
 import traceback
-import uuid
-import time
+import os
 from odoo import http
 from odoo.http import request
+from odoo.modules.module import get_manifest
+
+from markupsafe import Markup
+from psycopg2.errors import SerializationFailure
+
+from ..services import hot_log, image_variants
+from ..services.menu_snapshot import menu_snapshot_cache, menu_version
+from ..services.request_metrics import current_trace_id, instrumented, request_metrics
+from ..services.static_assets import asset_manifest
+from ..services.tax_resolver import TaxResolver
 
 _logger = logging.getLogger(__name__)
 
-# QR Ordering Build Version (version + timestamp for cache-busting)
-QR_ORDERING_VERSION = '18.0.1.0.0'
-QR_ORDERING_BUILD = f"{QR_ORDERING_VERSION}-{int(time.time())}"
+_page_log = hot_log.HotLog('page')
+_submit_log = hot_log.HotLog('submit')
+_order_status_log = hot_log.HotLog('order_status')
+_serialize_log = hot_log.HotLog('serialize')
+
+# QR Ordering Build Version（页面显示用，取自 __manifest__.py；资源 URL 按内容哈希生成）
+QR_ORDERING_VERSION = get_manifest('qr_ordering')['version']
+
+# 点餐页面使用的静态资源（static/src/js、static/src/css 下的文件名）
+PAGE_ASSETS = {
+    'qr_ordering.ordering_page': ('qr_ordering.js', 'qr_ordering.css'),
+    'qr_ordering.ordering_page_v2': ('qr_ordering_v2.js', 'qr_ordering_v2.css'),
+}
+
+# 公开图片接口支持的尺寸
+PRODUCT_IMAGE_SIZES = ('128', '256', '512', '1024', '1920')
+
+# 单次批量购物车请求允许的最大操作数
+MAX_CART_BATCH_OPERATIONS = 50
+
+# 点餐页面 service worker（static/src/js 下的文件名）
+SERVICE_WORKER_ASSET = 'qr_service_worker.js'
+
+
+class CartOperationError(Exception):
+    """批量购物车操作失败，用于回滚整个批次"""
+
+    def __init__(self, index, code, message):
+        super().__init__(message)
+        self.index = index
+        self.code = code
+        self.message = message
 
 
 class QrOrderingController(http.Controller):
@@ -23,6 +60,7 @@ class QrOrderingController(http.Controller):
     # ==================== 页面路由 ====================
 
     @http.route('/qr/order/<string:table_token>', type='http', auth='public', website=False)
+    @instrumented
     def qr_ordering_page(self, table_token, **kwargs):
         """
         扫码点餐主页面
@@ -36,14 +74,14 @@ class QrOrderingController(http.Controller):
         - token无效/餐桌禁用：返回错误页面（HTTP 404/410）
         - 系统异常：返回错误页面（HTTP 500）
         """
-        trace_id = str(uuid.uuid4())[:8]
+        trace_id = current_trace_id()
         client_ip = request.httprequest.remote_addr
 
         try:
             # 获取或验证会话
             access_token = request.httprequest.cookies.get('qr_access_token')
 
-            _logger.info(f"[{trace_id}] QR page access: token={table_token[:8]}..., ip={client_ip}")
+            _page_log.info('access', token=lambda: f'{table_token[:8]}...', ip=client_ip)
 
             session, error_code, error_msg = request.env['qr.session'].sudo().validate_access(
                 table_token, access_token, client_ip
@@ -73,7 +111,25 @@ class QrOrderingController(http.Controller):
                 use_v2 = request.env['ir.config_parameter'].sudo().get_param('qr_ordering.menu_ui_v2', 'false') == 'true'
 
             template_name = 'qr_ordering.ordering_page_v2' if use_v2 else 'qr_ordering.ordering_page'
-            _logger.info(f"[{trace_id}] Using template: {template_name}, v2={use_v2}")
+            _page_log.debug('template', template=template_name, v2=use_v2)
+
+            # 内嵌初始化数据：首屏不需要再调用 /qr/api/init（再次验证会话 + 构建菜单）
+            bootstrap_json = None
+            if request.env['ir.config_parameter'].sudo().get_param('qr_ordering.inline_bootstrap', 'true') == 'true':
+                bootstrap_json = self._script_safe_json({
+                    'success': True,
+                    'trace_id': trace_id,
+                    'data': self._build_init_data(session, lang),
+                })
+
+            # 静态资源 URL（内容哈希，可长期缓存）；Build 号取页面 JS 的哈希
+            asset_names = PAGE_ASSETS[template_name]
+            asset_urls = asset_manifest.urls(asset_names, debug=debug_mode)
+            script = asset_manifest.get(asset_names[0])
+            build_version = f"{QR_ORDERING_VERSION}-{script.hash[:8]}" if script else QR_ORDERING_VERSION
+
+            # PWA：离线缓存菜单和页面、购物车操作排队重放（qr_ordering.pwa_enabled=false 时注销）
+            pwa_enabled = request.env['ir.config_parameter'].sudo().get_param('qr_ordering.pwa_enabled', 'true') == 'true'
 
             # 渲染点餐页面
             response = request.render(template_name, {
@@ -81,9 +137,12 @@ class QrOrderingController(http.Controller):
                 'table': session.table_id,
                 'lang': lang,
                 'access_token': session.access_token,
-                'build_version': QR_ORDERING_BUILD,
+                'build_version': build_version,
+                'asset_urls': asset_urls,
+                'service_worker_url': '/qr/sw.js' if pwa_enabled else None,
                 'debug_mode': debug_mode,
                 'trace_id': trace_id,
+                'bootstrap_json': bootstrap_json,
             })
 
             # 设置 cache-control headers（防止 HTML 被缓存）
@@ -109,6 +168,7 @@ class QrOrderingController(http.Controller):
             }, status=500)
 
     @http.route('/qr/print/<string:table_token>', type='http', auth='user')
+    @instrumented
     def print_qr_code(self, table_token, **kwargs):
         """
         打印二维码页面
@@ -143,47 +203,161 @@ class QrOrderingController(http.Controller):
             'barcode_url': barcode_url,
         })
 
+    # ==================== 静态资源 ====================
+
+    @http.route('/qr/assets/<string:filename>', type='http', auth='public', cors='*')
+    @instrumented
+    def static_asset(self, filename, **kwargs):
+        """
+        内容哈希静态资源
+        URL: /qr/assets/{名称}.{哈希}.{js|css}
+
+        - 哈希与当前文件一致：返回压缩内容，immutable 缓存一年
+        - 哈希已过期（页面 HTML 来自旧版本）：返回当前内容，不缓存
+        """
+        asset, hash_matches = asset_manifest.resolve(filename)
+        if not asset:
+            return request.not_found()
+
+        etag = f'"{asset.hash}"'
+        if hash_matches:
+            cache_control = 'public, max-age=31536000, immutable'
+        else:
+            cache_control = 'no-cache'
+        headers = [
+            ('Content-Type', asset.content_type),
+            ('Cache-Control', cache_control),
+            ('ETag', etag),
+        ]
+        if etag in (request.httprequest.headers.get('If-None-Match') or ''):
+            return request.make_response(b'', headers, status=304)
+        headers.append(('Content-Length', len(asset.content)))
+        return request.make_response(asset.content, headers)
+
+    @http.route('/qr/sw.js', type='http', auth='public')
+    @instrumented
+    def service_worker(self, **kwargs):
+        """
+        点餐页面 service worker（作用域 /qr/）
+
+        URL 固定，浏览器按 no-cache 检查更新；内容变化时 service worker 自动升级。
+        """
+        asset = asset_manifest.get(SERVICE_WORKER_ASSET)
+        if not asset:
+            return request.not_found()
+        etag = f'"{asset.hash}"'
+        headers = [
+            ('Content-Type', asset.content_type),
+            ('Cache-Control', 'no-cache'),
+            ('ETag', etag),
+            ('Service-Worker-Allowed', '/qr/'),
+        ]
+        if etag in (request.httprequest.headers.get('If-None-Match') or ''):
+            return request.make_response(b'', headers, status=304)
+        headers.append(('Content-Length', len(asset.content)))
+        return request.make_response(asset.content, headers)
+
+    @http.route('/qr/metrics', type='http', auth='user')
+    def request_metrics(self, reset=None, **kwargs):
+        """
+        路由统计（当前 worker 进程）：次数、错误数、分位耗时、平均 / 最大 SQL 次数、疑似 N+1 次数
+        ?reset=1 清零
+        """
+        if not request.env.user.has_group('point_of_sale.group_pos_manager'):
+            return request.make_response(
+                json.dumps({'success': False, 'error': 'PERMISSION_DENIED', 'message': '无权访问'}),
+                [('Content-Type', 'application/json')], status=403,
+            )
+        data = request_metrics.snapshot()
+        data['pid'] = os.getpid()
+        if reset == '1':
+            request_metrics.reset()
+        return request.make_response(
+            json.dumps({'success': True, 'data': data}),
+            [('Content-Type', 'application/json'), ('Cache-Control', 'no-store')],
+        )
+
     # ==================== 公开图片访问 ====================
 
     @http.route('/qr/image/product/<int:product_id>', type='http', auth='public', cors='*')
+    @instrumented
     def public_product_image(self, product_id, size='256', **kwargs):
         """
         公开访问产品图片
         URL: /qr/image/product/{product_id}?size=256
+
+        - 按 Accept 返回 WebP（支持时）或 JPEG 变体，变体按图片 checksum 缓存在磁盘
+        - 强 ETag，If-None-Match 命中时返回 304，不读取图片
+        - 配置 qr_ordering.image_accel_prefix（nginx internal location）时使用 X-Accel-Redirect，
+          配置 qr_ordering.image_sendfile=true 时使用 X-Sendfile，worker 不读取文件内容
         """
         try:
             product = request.env['product.product'].sudo().browse(product_id)
             if not product.exists():
                 return request.not_found()
             
-            # 获取图片字段名
-            field_name = f'image_{size}' if size in ['128', '256', '512', '1024', '1920'] else 'image_256'
-            
-            # 获取图片数据
-            image_data = getattr(product, field_name, None)
-            if not image_data:
-                # 尝试从模板获取
-                image_data = getattr(product.product_tmpl_id, field_name, None)
-            
-            if not image_data:
+            if size not in PRODUCT_IMAGE_SIZES:
+                size = '256'
+
+            checksum, load_source = self._get_product_image_source(product, size)
+            if not checksum:
                 # 返回默认占位图
                 return request.redirect('/web/static/img/placeholder.png')
-            
-            # 解码 base64 图片
-            image_bytes = base64.b64decode(image_data)
-            
-            # 返回图片
+
+            fmt = image_variants.choose_format(request.httprequest.headers.get('Accept'))
+            etag = image_variants.etag(checksum, size, fmt)
             headers = [
-                ('Content-Type', 'image/png'),
-                ('Content-Length', len(image_bytes)),
+                ('ETag', etag),
                 ('Cache-Control', 'public, max-age=86400'),
+                ('Vary', 'Accept'),
             ]
+            if etag in (request.httprequest.headers.get('If-None-Match') or ''):
+                return request.make_response(b'', headers, status=304)
+
+            dbname = request.env.cr.dbname
+            directory, relative = image_variants.get_variant_path(dbname, checksum, size, fmt, load_source)
+            headers.append(('Content-Type', image_variants.FORMATS[fmt]))
+
+            ICP = request.env['ir.config_parameter'].sudo()
+            accel_prefix = ICP.get_param('qr_ordering.image_accel_prefix')
+            if accel_prefix:
+                headers.append(('X-Accel-Redirect', f"{accel_prefix.rstrip('/')}/{dbname}/{relative}"))
+                return request.make_response(b'', headers)
+            path = os.path.join(directory, relative)
+            if ICP.get_param('qr_ordering.image_sendfile') == 'true':
+                headers.append(('X-Sendfile', path))
+                return request.make_response(b'', headers)
+
+            with open(path, 'rb') as f:
+                image_bytes = f.read()
+            headers.append(('Content-Length', len(image_bytes)))
             return request.make_response(image_bytes, headers)
             
         except Exception as e:
             _logger.error(f"Error serving product image: {e}")
             return request.redirect('/web/static/img/placeholder.png')
 
+    def _get_product_image_source(self, product, size):
+        """
+        查找产品图片的附件 checksum（变体图优先，其次模板图）
+
+        Returns:
+            (checksum, load_source)；没有图片时返回 (None, None)
+        """
+        Attachment = request.env['ir.attachment'].sudo()
+        for res_model, res_id, field_name in (
+            ('product.product', product.id, f'image_variant_{size}'),
+            ('product.template', product.product_tmpl_id.id, f'image_{size}'),
+        ):
+            attachment = Attachment.search([
+                ('res_model', '=', res_model),
+                ('res_field', '=', field_name),
+                ('res_id', '=', res_id),
+            ], limit=1)
+            if attachment and attachment.checksum:
+                return attachment.checksum, lambda attachment=attachment: attachment.raw
+        return None, None
+
     # ==================== API 路由 ====================
 
     def _api_error_response(self, error_code, message, trace_id=None):
@@ -195,6 +369,15 @@ class QrOrderingController(http.Controller):
             'trace_id': trace_id,
         }
 
+    def _run_idempotent(self, session, idempotency_key, endpoint, func):
+        """
+        按客户端幂等键执行请求（离线排队的购物车操作重放时不会重复执行），见 qr.idempotency.key._run
+
+        同一个键的并发重复请求会抛出 SerializationFailure，
+        调用方不能把它当作普通错误返回，要交给 Odoo 重试请求，重试时返回保存的响应。
+        """
+        return request.env['qr.idempotency.key'].sudo()._run(session, idempotency_key, endpoint, func)
+
     def _wrap_api_call(self, func, *args, **kwargs):
         """
         包装API调用，确保：
@@ -202,7 +385,7 @@ class QrOrderingController(http.Controller):
         2. 捕获所有异常
         3. 记录日志（含trace_id）
         """
-        trace_id = str(uuid.uuid4())[:8]
+        trace_id = current_trace_id()
         try:
             return func(trace_id, *args, **kwargs)
         except Exception as e:
@@ -212,6 +395,7 @@ class QrOrderingController(http.Controller):
             return self._api_error_response('SYSTEM_ERROR', '系统繁忙，请稍后重试', trace_id)
 
     @http.route('/qr/api/init', type='json', auth='public', csrf=False)
+    @instrumented
     def api_init(self, table_token, access_token=None, **kwargs):
         """
         初始化点餐数据
@@ -219,7 +403,7 @@ class QrOrderingController(http.Controller):
         """
         def _do_init(trace_id):
             client_ip = request.httprequest.remote_addr
-            _logger.info(f"[{trace_id}] API init: token={table_token[:8] if table_token else 'None'}..., ip={client_ip}")
+            _page_log.info('api_init', token=lambda: f'{table_token[:8]}...' if table_token else None, ip=client_ip)
 
             session, error_code, error_msg = request.env['qr.session'].sudo().validate_access(
                 table_token, access_token, client_ip
@@ -228,24 +412,36 @@ class QrOrderingController(http.Controller):
             if error_code:
                 _logger.warning(f"[{trace_id}] API init error: {error_code} - {error_msg}")
                 return self._api_error_response(error_code, error_msg, trace_id)
+            self._apply_log_debug(session)
 
             lang = kwargs.get('lang', 'zh_CN')
 
             return {
                 'success': True,
                 'trace_id': trace_id,
-                'data': {
-                    'session': self._serialize_session(session),
-                    'table': self._serialize_table(session.table_id),
-                    'menu': self._get_menu_data(session.table_id.pos_config_id, lang),
-                    'current_order': self._get_current_order(session),
-                    'access_token': session.access_token,
-                }
+                'data': self._build_init_data(session, lang),
             }
 
         return self._wrap_api_call(_do_init)
 
+    def _build_init_data(self, session, lang):
+        """初始化数据（/qr/api/init 和页面内嵌共用）"""
+        return {
+            'session': self._serialize_session(session),
+            'table': self._serialize_table(session.table_id),
+            'menu': self._get_menu_data(session.table_id.pos_config_id, lang),
+            'current_order': self._get_current_order(session),
+            'access_token': session.access_token,
+        }
+
+    def _script_safe_json(self, data):
+        """序列化为可直接放入 <script type="application/json"> 的 JSON"""
+        text = json.dumps(data, ensure_ascii=False, default=str)
+        text = text.replace('<', '\\u003c').replace('>', '\\u003e').replace('&', '\\u0026')
+        return Markup(text)
+
     @http.route('/qr/api/menu', type='json', auth='public', csrf=False)
+    @instrumented
     def api_get_menu(self, table_token, access_token, lang='zh_CN', **kwargs):
         """
         获取菜单数据
@@ -260,6 +456,7 @@ class QrOrderingController(http.Controller):
         }
 
     @http.route('/qr/api/cart/add', type='json', auth='public', csrf=False)
+    @instrumented
     def api_add_to_cart(self, table_token, access_token, product_id, qty=1, note='', **kwargs):
         """
         添加菜品到购物车
@@ -268,36 +465,26 @@ class QrOrderingController(http.Controller):
         if error_code:
             return {'success': False, 'error': error_code, 'message': error_msg}
         
-        try:
+        def _do_add():
             # 获取或创建购物车订单
             order = self._get_or_create_cart(session)
-            
-            # 检查是否已有相同产品
-            existing_line = order.line_ids.filtered(
-                lambda l: l.product_id.id == product_id and l.state == 'pending'
-            )
-            
-            if existing_line and not note:
-                # 增加数量
-                existing_line.qty += qty
-            else:
-                # 创建新行
-                request.env['qr.order.line'].sudo().create({
-                    'order_id': order.id,
-                    'product_id': product_id,
-                    'qty': qty,
-                    'note': note,
-                })
-            
+            self._cart_add_line(order, product_id, qty, note)
+
             return {
                 'success': True,
                 'data': self._serialize_order(order)
             }
+
+        try:
+            return self._run_idempotent(session, kwargs.get('idempotency_key'), 'cart/add', _do_add)
+        except SerializationFailure:
+            raise
         except Exception as e:
             _logger.error(f"Add to cart failed: {e}")
             return {'success': False, 'error': 'ADD_FAILED', 'message': str(e)}
 
     @http.route('/qr/api/cart/update', type='json', auth='public', csrf=False)
+    @instrumented
     def api_update_cart(self, table_token, access_token, line_id, qty, **kwargs):
         """
         更新购物车数量
@@ -306,99 +493,165 @@ class QrOrderingController(http.Controller):
         if error_code:
             return {'success': False, 'error': error_code, 'message': error_msg}
         
-        try:
+        def _do_update():
             line = request.env['qr.order.line'].sudo().browse(line_id)
-            
-            # 验证权限
-            if line.order_id.session_id != session:
-                return {'success': False, 'error': 'PERMISSION_DENIED', 'message': '无权操作'}
-            
-            if line.state != 'pending':
-                return {'success': False, 'error': 'LINE_SUBMITTED', 'message': '该菜品已提交，无法修改'}
-            
-            if qty <= 0:
-                line.unlink()
-            else:
-                line.qty = qty
-            
+            order = line.order_id
+
+            error = self._cart_update_line(session, line, qty)
+            if error:
+                return {'success': False, 'error': error[0], 'message': error[1]}
+
             return {
                 'success': True,
-                'data': self._serialize_order(line.order_id)
+                'data': self._serialize_order(order)
             }
+
+        try:
+            return self._run_idempotent(session, kwargs.get('idempotency_key'), 'cart/update', _do_update)
+        except SerializationFailure:
+            raise
         except Exception as e:
             _logger.error(f"Update cart failed: {e}")
             return {'success': False, 'error': 'UPDATE_FAILED', 'message': str(e)}
 
     @http.route('/qr/api/cart/remove', type='json', auth='public', csrf=False)
+    @instrumented
     def api_remove_from_cart(self, table_token, access_token, line_id, **kwargs):
         """
         从购物车移除菜品
         """
-        return self.api_update_cart(table_token, access_token, line_id, 0)
+        return self.api_update_cart(table_token, access_token, line_id, 0, **kwargs)
+
+    @http.route('/qr/api/cart/batch', type='json', auth='public', csrf=False)
+    @instrumented
+    def api_cart_batch(self, table_token, access_token, operations, **kwargs):
+        """
+        批量修改购物车（客户端防抖后合并提交）
+        operations: [
+            {'op': 'add', 'product_id': x, 'qty': y, 'note': z},
+            {'op': 'update', 'line_id': x, 'qty': y},
+            {'op': 'remove', 'line_id': x},
+        ]
+
+        只验证一次会话、只取一次购物车、最后只序列化一次订单。
+        所有操作在同一个 savepoint 内执行，任一操作失败则全部回滚。
+        带 idempotency_key 时按幂等键去重（service worker 离线重放）。
+        """
+        session, error_code, error_msg = self._validate_session(table_token, access_token)
+        if error_code:
+            return {'success': False, 'error': error_code, 'message': error_msg}
+
+        if not isinstance(operations, list) or not operations:
+            return {'success': False, 'error': 'INVALID_OPERATIONS', 'message': '操作列表为空'}
+        if len(operations) > MAX_CART_BATCH_OPERATIONS:
+            return {'success': False, 'error': 'TOO_MANY_OPERATIONS', 'message': '操作过多，请稍后重试'}
+
+        def _do_batch():
+            with request.env.cr.savepoint():
+                order = self._get_or_create_cart(session)
+                for index, operation in enumerate(operations):
+                    error = self._apply_cart_operation(session, order, operation)
+                    if error:
+                        raise CartOperationError(index, *error)
+
+            return {
+                'success': True,
+                'data': self._serialize_order(order)
+            }
+
+        try:
+            return self._run_idempotent(session, kwargs.get('idempotency_key'), 'cart/batch', _do_batch)
+        except CartOperationError as e:
+            return {'success': False, 'error': e.code, 'message': e.message, 'index': e.index}
+        except SerializationFailure:
+            raise
+        except Exception as e:
+            _logger.error(f"Cart batch failed: {e}")
+            return {'success': False, 'error': 'BATCH_FAILED', 'message': str(e)}
 
     @http.route('/qr/api/order/submit', type='json', auth='public', csrf=False)
+    @instrumented
     def api_submit_order(self, table_token, access_token, note='', **kwargs):
         """
         提交订单
+
+        - 同一餐桌的下单按 advisory lock 串行执行（在 try 之外：并发时抛出的
+          SerializationFailure 需要交给 Odoo 重试请求）
+        - 带 idempotency_key 时，重复提交直接返回第一次的结果
         """
         session, error_code, error_msg = self._validate_session(table_token, access_token)
         if error_code:
             return {'success': False, 'error': error_code, 'message': error_msg}
 
+        session._lock_for_ordering()
         try:
-            # 获取购物车订单
-            order = request.env['qr.order'].sudo().search([
-                ('session_id', '=', session.id),
-                ('state', '=', 'cart'),
-            ], limit=1)
+            return self._run_idempotent(
+                session, kwargs.get('idempotency_key'), 'order/submit',
+                lambda: self._submit_cart(session, note),
+            )
+        except SerializationFailure:
+            raise
+        except Exception as e:
+            _logger.error(f"Submit order failed: {e}")
+            _logger.error(traceback.format_exc())
+            return {'success': False, 'error': 'SUBMIT_FAILED', 'message': str(e)}
 
-            if not order:
-                return {'success': False, 'error': 'NO_CART', 'message': '购物车为空'}
+    def _submit_cart(self, session, note=''):
+        """提交会话的购物车订单（调用方已持有餐桌锁）"""
+        # 获取购物车订单
+        order = request.env['qr.order'].sudo().search([
+            ('session_id', '=', session.id),
+            ('state', '=', 'cart'),
+        ], limit=1)
 
-            _logger.warning(f"[Submit] QR Order {order.name} (id={order.id}) for session {session.id}, table {session.table_id.name}")
-            _logger.warning(f"[Submit] Order lines: {[(l.product_name, l.qty) for l in order.line_ids]}")
+        if not order:
+            return {'success': False, 'error': 'NO_CART', 'message': '购物车为空'}
 
-            if note:
-                order.note = note
+        _submit_log.debug(
+            'cart', order=order.name, order_id=order.id, session_id=session.id,
+            table=lambda: session.table_id.name,
+            lines=lambda: [(l.product_name, l.qty) for l in order.line_ids],
+        )
 
-            # 提交订单（返回结构化响应）
-            result = order.action_submit_order()
+        if note:
+            order.note = note
 
-            if not result.get('success'):
-                # 订单提交失败（如 POS Session 未开启）
-                return {
-                    'success': False,
-                    'error': result.get('error_code', 'SUBMIT_FAILED'),
-                    'message': result.get('error_message', '订单提交失败')
-                }
+        # 提交订单（返回结构化响应）
+        result = order.action_submit_order()
 
-            # 更新会话状态
-            session.state = 'ordering'
+        if not result.get('success'):
+            # 订单提交失败（如 POS Session 未开启）
+            return {
+                'success': False,
+                'error': result.get('error_code', 'SUBMIT_FAILED'),
+                'message': result.get('error_message', '订单提交失败')
+            }
 
-            # 重新加载订单以获取最新的 pos_order_id
-            order.invalidate_recordset(['pos_order_id'])
-            _logger.warning(f"[Submit] After submit: QR Order {order.name} -> POS Order {order.pos_order_id.name if order.pos_order_id else 'None'} (id={order.pos_order_id.id if order.pos_order_id else 'None'})")
+        # 更新会话状态
+        session.state = 'ordering'
 
-            if order.pos_order_id:
-                pos_order = order.pos_order_id
-                _logger.warning(f"[Submit] POS Order {pos_order.name}: amount_total={pos_order.amount_total}, amount_tax={pos_order.amount_tax}, lines={len(pos_order.lines)}")
-                for pl in pos_order.lines:
-                    _logger.warning(f"[Submit]   - {pl.full_product_name} x{pl.qty} = {pl.price_subtotal_incl}")
+        # 重新加载订单以获取最新的 pos_order_id
+        order.invalidate_recordset(['pos_order_id'])
+        pos_order = order.pos_order_id
+        _submit_log.debug(
+            'pos_order', order=order.name, pos_order=pos_order.name, pos_order_id=pos_order.id,
+            amount_total=lambda: pos_order.amount_total, amount_tax=lambda: pos_order.amount_tax,
+            lines=lambda: [(pl.full_product_name, pl.qty, pl.price_subtotal_incl) for pl in pos_order.lines],
+        )
 
-            serialized = self._serialize_order(order)
-            _logger.warning(f"[Submit] Returning: name={serialized.get('name')}, pos_order_name={serialized.get('pos_order_name')}, amount_total_incl={serialized.get('amount_total_incl')}, lines={len(serialized.get('lines', []))}")
+        serialized = self._serialize_order(order)
+        _submit_log.info(
+            'submitted', order=order.name, session_id=session.id, pos_order=serialized.get('pos_order_name'),
+            amount_total_incl=serialized.get('amount_total_incl'), lines=len(serialized.get('lines', [])),
+        )
 
-            return {
-                'success': True,
-                'data': serialized
-            }
-        except Exception as e:
-            _logger.error(f"Submit order failed: {e}")
-            import traceback
-            _logger.error(traceback.format_exc())
-            return {'success': False, 'error': 'SUBMIT_FAILED', 'message': str(e)}
+        return {
+            'success': True,
+            'data': serialized
+        }
 
     @http.route('/qr/api/order/add_items', type='json', auth='public', csrf=False)
+    @instrumented
     def api_add_items(self, table_token, access_token, items, **kwargs):
         """
         加菜
@@ -407,29 +660,37 @@ class QrOrderingController(http.Controller):
         session, error_code, error_msg = self._validate_session(table_token, access_token)
         if error_code:
             return {'success': False, 'error': error_code, 'message': error_msg}
-        
-        try:
+
+        def _do_add_items():
             # 获取当前活跃订单
             order = request.env['qr.order'].sudo().search([
                 ('session_id', '=', session.id),
                 ('state', 'in', ['cooking', 'serving']),
             ], order='create_date desc', limit=1)
-            
+
             if not order:
                 return {'success': False, 'error': 'NO_ORDER', 'message': '没有可加菜的订单'}
-            
+
             # 加菜
             order.action_add_items(items)
-            
+
             return {
                 'success': True,
                 'data': self._serialize_order(order)
             }
+
+        # 与下单共用餐桌锁（加菜也会追加 POS 订单行）
+        session._lock_for_ordering()
+        try:
+            return self._run_idempotent(session, kwargs.get('idempotency_key'), 'order/add_items', _do_add_items)
+        except SerializationFailure:
+            raise
         except Exception as e:
             _logger.error(f"Add items failed: {e}")
             return {'success': False, 'error': 'ADD_ITEMS_FAILED', 'message': str(e)}
 
     @http.route('/qr/api/order/status', type='json', auth='public', csrf=False)
+    @instrumented
     def api_get_order_status(self, table_token, access_token, **kwargs):
         """
         获取订单状态（双向同步）
@@ -458,9 +719,28 @@ class QrOrderingController(http.Controller):
     def _validate_session(self, table_token, access_token):
         """验证会话"""
         client_ip = request.httprequest.remote_addr
-        return request.env['qr.session'].sudo().validate_access(
+        session, error_code, error_msg = request.env['qr.session'].sudo().validate_access(
             table_token, access_token, client_ip
         )
+        if session:
+            self._apply_log_debug(session)
+        return session, error_code, error_msg
+
+    def _apply_log_debug(self, session):
+        """
+        排查用：指定餐桌或带 X-QR-Debug: 1 头的请求输出全部热路径日志
+        餐桌在系统参数 qr_ordering.debug_table_ids 中配置（逗号分隔的 qr.table ID），
+        未配置时不读取餐桌
+        """
+        if request.httprequest.headers.get('X-QR-Debug') == '1':
+            hot_log.force_debug()
+            return
+        debug_tables = request.env['ir.config_parameter'].sudo().get_param('qr_ordering.debug_table_ids')
+        if not debug_tables:
+            return
+        table_ids = {int(t) for t in debug_tables.split(',') if t.strip().isdigit()}
+        if session.table_id.id in table_ids:
+            hot_log.force_debug()
 
     def _detect_language(self):
         """检测语言"""
@@ -485,8 +765,89 @@ class QrOrderingController(http.Controller):
         
         return order
 
+    def _cart_add_line(self, order, product_id, qty=1, note=''):
+        """
+        添加菜品到购物车订单
+        相同菜品且无备注时累加数量；数量减到 0 以下时删除该行
+        """
+        # 检查是否已有相同产品
+        existing_line = order.line_ids.filtered(
+            lambda l: l.product_id.id == product_id and l.state == 'pending'
+        )[:1]
+
+        if existing_line and not note:
+            new_qty = existing_line.qty + qty
+            if new_qty <= 0:
+                existing_line.unlink()
+            else:
+                # 增加数量
+                existing_line.qty = new_qty
+        elif qty > 0:
+            # 创建新行
+            request.env['qr.order.line'].sudo().create({
+                'order_id': order.id,
+                'product_id': product_id,
+                'qty': qty,
+                'note': note,
+            })
+
+    def _cart_update_line(self, session, line, qty):
+        """
+        更新购物车行数量（qty <= 0 时删除）
+        返回: None 或 (error_code, error_message)
+        """
+        if not line.exists():
+            return 'LINE_NOT_FOUND', '菜品不存在'
+
+        # 验证权限
+        if line.order_id.session_id != session:
+            return 'PERMISSION_DENIED', '无权操作'
+
+        if line.state != 'pending':
+            return 'LINE_SUBMITTED', '该菜品已提交，无法修改'
+
+        if qty <= 0:
+            line.unlink()
+        else:
+            line.qty = qty
+        return None
+
+    def _apply_cart_operation(self, session, order, operation):
+        """
+        执行单个批量购物车操作
+        返回: None 或 (error_code, error_message)
+        """
+        op = operation.get('op') if isinstance(operation, dict) else None
+        try:
+            if op == 'add':
+                product_id = int(operation['product_id'])
+                qty = float(operation.get('qty', 1))
+                self._cart_add_line(order, product_id, qty, operation.get('note') or '')
+                return None
+            if op in ('update', 'remove'):
+                line = request.env['qr.order.line'].sudo().browse(int(operation['line_id']))
+                qty = 0 if op == 'remove' else float(operation['qty'])
+                return self._cart_update_line(session, line, qty)
+        except (KeyError, TypeError, ValueError):
+            return 'INVALID_OPERATION', '操作参数错误'
+        return 'INVALID_OPERATION', f'不支持的操作: {op}'
+
     def _get_menu_data(self, pos_config, lang='zh_CN'):
-        """获取菜单数据"""
+        """
+        获取菜单数据（菜单快照缓存）
+
+        返回的 dict 在请求间共享，调用方不得修改。
+        """
+        key = (request.env.cr.dbname, pos_config.id, lang)
+        version = menu_version(request.env)
+        menu = menu_snapshot_cache.get(key, version)
+        if menu is None:
+            menu = self._build_menu_data(pos_config, lang)
+            menu_snapshot_cache.put(key, version, menu)
+        return menu
+
+    def _build_menu_data(self, pos_config, lang='zh_CN'):
+        """构建菜单数据"""
         # 获取 POS 可用的产品
         products = request.env['product.product'].sudo().with_context(lang=lang).search([
             ('available_in_pos', '=', True),
@@ -511,9 +872,13 @@ class QrOrderingController(http.Controller):
                 'parent_id': cat.parent_id.id if cat.parent_id else False,
             })
         
+        # 整个菜单共用一个 TaxResolver：每个产品只映射一次税，相同税/价格只计算一次
+        tax_resolver = TaxResolver.for_pos_config(pos_config).prefetch(products)
         for product in products:
             # 传递 POS 配置以计算含税价格
-            menu['products'].append(product.get_qr_ordering_data(lang, pos_config=pos_config))
+            menu['products'].append(product.get_qr_ordering_data(
+                lang, pos_config=pos_config, tax_resolver=tax_resolver,
+            ))
 
         return menu
 
@@ -524,8 +889,6 @@ class QrOrderingController(http.Controller):
         只返回与当前 QR Session 关联的订单，不再自动显示餐桌上其他 POS 订单
         避免混入前一桌客人的未结账订单
         """
-        _logger.info(f"[GetOrder] Session: id={session.id}, name={session.name}, state={session.state}")
-
         result = []
         processed_pos_ids = set()  # 已处理的 POS 订单 ID，避免重复
 
@@ -535,25 +898,23 @@ class QrOrderingController(http.Controller):
             ('state', '!=', 'cancelled'),
         ], order='create_date desc')
 
-        _logger.info(f"[GetOrder] Found {len(qr_orders)} QR orders for session {session.id}")
-
         for order in qr_orders:
-            _logger.info(f"[GetOrder] QR Order: id={order.id}, state={order.state}, pos_order_id={order.pos_order_id.id if order.pos_order_id else None}")
-
             # 如果这个 QR 订单关联的 POS 订单已经处理过，跳过（避免重复）
             if order.pos_order_id and order.pos_order_id.id in processed_pos_ids:
-                _logger.info(f"[GetOrder] Skipping duplicate POS order {order.pos_order_id.id}")
+                _order_status_log.debug('skip_duplicate', order_id=order.id, pos_order_id=order.pos_order_id.id)
                 continue
 
             serialized = self._serialize_order(order)
             result.append(serialized)
-            _logger.info(f"[GetOrder] Serialized order: lines={len(serialized.get('lines', []))}, amount={serialized.get('amount_total')}")
 
             # 标记 POS 订单已处理
             if order.pos_order_id:
                 processed_pos_ids.add(order.pos_order_id.id)
 
-        _logger.info(f"[GetOrder] Returning {len(result)} orders")
+        _order_status_log.debug(
+            'orders', session_id=session.id, session_state=session.state,
+            orders=lambda: [(o.get('name'), o.get('state'), len(o.get('lines', [])), o.get('amount_total')) for o in result],
+        )
         return result if result else None
 
     def _serialize_session(self, session):
@@ -601,12 +962,21 @@ class QrOrderingController(http.Controller):
             amount_untaxed = amount_total_incl - amount_tax
             total_qty = sum(pos_line.qty for pos_line in pos_order.lines)
 
-            _logger.warning(f"[Serialize] QR Order {order.name} -> POS Order {pos_order.name}: lines={len(lines_data)}, amount_total={amount_total_incl}, amount_tax={amount_tax}")
+            _serialize_log.debug(
+                'pos_order', order=order.name, pos_order=pos_order.name, lines=len(lines_data),
+                amount_total=amount_total_incl, amount_tax=amount_tax,
+            )
         else:
             # ===== 从 QR 订单获取（购物车状态）=====
+            pos_config = order.pos_config_id
+            tax_resolver = None
+            if pos_config:
+                tax_resolver = TaxResolver.for_pos_config(
+                    pos_config, currency=pos_config.company_id.currency_id,
+                ).prefetch(order.line_ids.product_id)
             lines_data = []
             for line in order.line_ids:
-                line_data = self._serialize_order_line(line)
+                line_data = self._serialize_order_line(line, tax_resolver)
                 lines_data.append(line_data)
 
             # 从订单行计算金额
@@ -634,8 +1004,13 @@ class QrOrderingController(http.Controller):
             'lines': lines_data,
         }
 
-    def _serialize_order_line(self, line):
-        """序列化订单行数据（含税信息）"""
+    def _serialize_order_line(self, line, tax_resolver=None):
+        """
+        序列化订单行数据（含税信息）
+
+        Args:
+            tax_resolver: 同一订单的各行共用的 TaxResolver（为空时按订单的 POS 配置创建）
+        """
         subtotal = line.subtotal  # 税前小计
         subtotal_incl = subtotal  # 含税小计（默认同税前）
         tax_amount = 0.0
@@ -645,23 +1020,17 @@ class QrOrderingController(http.Controller):
         if line.product_id and line.product_id.taxes_id:
             try:
                 # 获取公司和税规则
-                session = line.order_id.session_id
-                pos_config = session.pos_config_id if session else None
-                if pos_config:
-                    company = pos_config.company_id
-                    fiscal_position = pos_config.default_fiscal_position_id
-                    taxes = line.product_id.taxes_id.filtered(lambda t: t.company_id == company)
-                    if fiscal_position:
-                        taxes = fiscal_position.map_tax(taxes)
+                if not tax_resolver and line.order_id.pos_config_id:
+                    pos_config = line.order_id.pos_config_id
+                    tax_resolver = TaxResolver.for_pos_config(
+                        pos_config, currency=pos_config.company_id.currency_id,
+                    )
+                if tax_resolver:
+                    taxes, total_excluded, subtotal_incl = tax_resolver.compute(
+                        line.product_id, line.price_unit, line.qty,
+                    )
                     if taxes:
-                        tax_result = taxes.compute_all(
-                            line.price_unit,
-                            currency=company.currency_id,
-                            quantity=line.qty,
-                            product=line.product_id
-                        )
-                        subtotal_incl = tax_result['total_included']
-                        tax_amount = subtotal_incl - tax_result['total_excluded']
+                        tax_amount = subtotal_incl - total_excluded
                         if subtotal > 0:
                             tax_rate = (tax_amount / subtotal) * 100
             except Exception as e:
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Pre-migration script for qr_ordering 18.0.1.0.1
+# 新增唯一约束 pos_table_unique(pos_table_id) 前，清理重复关联同一个 POS 餐桌的 QR 餐桌
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """
+    一个 restaurant.table 只能关联一个 qr.table。
+
+    旧数据中重复关联时，保留一个 QR 餐桌的关联（优先有效的餐桌，其次 ID 最小的），
+    其余 QR 餐桌的 pos_table_id 置空，否则升级时无法创建唯一约束。
+    被置空的餐桌记录到日志，需要在后台重新关联。
+    """
+    if not version:
+        return
+
+    cr.execute("""
+        WITH ranked AS (
+            SELECT id, pos_table_id,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY pos_table_id
+                       ORDER BY COALESCE(active, FALSE) DESC, id
+                   ) AS rank
+            FROM qr_table
+            WHERE pos_table_id IS NOT NULL
+        )
+        UPDATE qr_table t
+        SET pos_table_id = NULL
+        FROM ranked
+        WHERE ranked.id = t.id AND ranked.rank > 1
+        RETURNING t.id, t.name, ranked.pos_table_id
+    """)
+    for table_id, name, pos_table_id in cr.fetchall():
+        _logger.warning(
+            f"qr.table {name} (id={table_id}) unlinked from restaurant.table {pos_table_id}: "
+            "the POS table is already linked to another QR table"
+        )
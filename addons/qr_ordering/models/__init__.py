@@ -7,3 +7,9 @@ from . import product_template
 from . import pos_order
 from . import pos_print_job
 
+from . import qr_kitchen_dispatch
+from . import pos_printer_routing
+from . import qr_menu_version
+from . import restaurant_table
+from . import qr_idempotency_key
+from . import qr_floor_status
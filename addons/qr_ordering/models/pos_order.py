@@ -30,6 +30,13 @@ class PosOrder(models.Model):
         store=True,
         help='是否来自 QR 扫码点餐'
     )
+    # 订单变更序号计数器（KDS 变更号 / 厨房单 Order-XXX），由 qr.order._next_change_sequence 原子递增
+    # 不设默认值：添加字段时不需要回填整张 pos_order 表，NULL 视为 0
+    qr_change_seq = fields.Integer(
+        string='Kitchen Change No. / 变更序号',
+        readonly=True,
+        copy=False,
+    )
 
     @api.depends('qr_order_ids')
     def _compute_qr_order_count(self):
@@ -52,7 +59,7 @@ class PosOrder(models.Model):
         return result
 
     def _sync_state_to_qr_orders(self, pos_state):
-        """同步 POS 订单状态到所有关联的 QR 订单"""
+        """同步 POS 订单状态到所有关联的 QR 订单（整个记录集一次查询、一次写入）"""
         # POS 状态到 QR 状态的映射
         state_mapping = {
             'draft': None,  # draft 状态不同步
@@ -63,18 +70,21 @@ class PosOrder(models.Model):
         }
 
         qr_state = state_mapping.get(pos_state)
-        if not qr_state:
+        if not qr_state or not self:
             return
 
-        for order in self:
-            # 同步到所有关联的 QR 订单
-            for qr_order in order.qr_order_ids:
-                if qr_order.state not in ['paid', 'cancelled']:
-                    try:
-                        qr_order.sudo().write({'state': qr_state})
-                        _logger.info(f"Synced POS order {order.name} state '{pos_state}' -> QR order {qr_order.name} state '{qr_state}'")
-                    except Exception as e:
-                        _logger.warning(f"Failed to sync state to QR order {qr_order.name}: {e}")
+        qr_orders = self.env['qr.order'].sudo().search([
+            ('pos_order_id', 'in', self.ids),
+            ('state', 'not in', ['paid', 'cancelled']),
+        ])
+        if not qr_orders:
+            return
+        try:
+            with self.env.cr.savepoint():
+                qr_orders.write({'state': qr_state})
+            _logger.info(f"Synced POS state '{pos_state}' -> QR state '{qr_state}' for {len(qr_orders)} QR order(s): {', '.join(qr_orders.mapped('name'))}")
+        except Exception as e:
+            _logger.warning(f"Failed to sync state '{qr_state}' to QR orders {qr_orders.ids}: {e}")
 
     def _export_for_ui(self, order):
         """Override to exclude qr fields from POS frontend"""
@@ -89,68 +99,84 @@ class PosOrder(models.Model):
         """支付完成后同步 QR 订单状态并释放餐桌"""
         res = super().action_pos_order_paid()
 
-        for order in self:
-            # 1. 同步所有关联的 QR 订单状态为已支付
-            for qr_order in order.qr_order_ids:
-                try:
-                    qr_order.sudo().write({'state': 'paid'})
-                    _logger.info(f"Synced QR order {qr_order.name} state to 'paid'")
-                except Exception as e:
-                    _logger.warning(f"Failed to sync QR order {qr_order.name} state: {e}")
-
-            # 2. 如果订单关联了餐桌，处理同桌台的所有订单
-            if order.table_id:
-                try:
-                    # 2a. 查找同桌台的其他 draft 订单并取消
-                    other_draft_orders = self.env['pos.order'].sudo().search([
-                        ('table_id', '=', order.table_id.id),
-                        ('session_id', '=', order.session_id.id),
-                        ('state', '=', 'draft'),
-                        ('id', '!=', order.id)
-                    ])
-
-                    if other_draft_orders:
-                        # 先同步这些订单关联的所有 QR 订单状态
-                        for draft_order in other_draft_orders:
-                            for qr_order in draft_order.qr_order_ids:
-                                qr_order.sudo().write({'state': 'paid'})
-
-                        # 取消这些 draft 订单
-                        other_draft_orders.write({'state': 'cancel'})
-                        _logger.info(f"Cancelled {len(other_draft_orders)} other draft orders for table {order.table_id.id}")
-
-                    # 2b. 查找对应的 QR 餐桌并释放
-                    qr_table = self.env['qr.table'].sudo().search([
-                        ('pos_table_id', '=', order.table_id.id)
-                    ], limit=1)
-
-                    if qr_table and qr_table.current_session_id:
-                        # 检查该餐桌是否还有其他未支付的 POS 订单
-                        remaining_unpaid = self.env['pos.order'].sudo().search([
-                            ('table_id', '=', order.table_id.id),
-                            ('state', 'not in', ['paid', 'cancel']),
-                            ('id', '!=', order.id)
-                        ])
-
-                        if not remaining_unpaid:
-                            # 将该会话的所有未完成 QR 订单标记为已支付
-                            qr_orders = self.env['qr.order'].sudo().search([
-                                ('session_id', '=', qr_table.current_session_id.id),
-                                ('state', 'not in', ['paid', 'cancelled'])
-                            ])
-                            if qr_orders:
-                                qr_orders.write({'state': 'paid'})
-                                _logger.info(f"Marked {len(qr_orders)} QR orders as paid")
-
-                            # 关闭会话并释放餐桌
-                            qr_table.current_session_id.sudo().action_close()
-                            qr_table.sudo().write({
-                                'state': 'available',
-                                'current_session_id': False,
-                            })
-                            _logger.info(f"Released QR table {qr_table.name} after payment")
-
-                except Exception as e:
-                    _logger.warning(f"Failed to process table cleanup after payment: {e}")
+        # 1. 同步所有关联的 QR 订单状态为已支付
+        self._mark_qr_orders_paid([('pos_order_id', 'in', self.ids)])
+
+        # 2. 处理有餐桌的订单：同桌其他草稿订单、释放 QR 餐桌
+        tabled_orders = self.filtered('table_id')
+        if tabled_orders:
+            try:
+                with self.env.cr.savepoint():
+                    tabled_orders._release_tables_after_payment()
+            except Exception as e:
+                _logger.warning(f"Failed to process table cleanup after payment: {e}")
 
         return res
+
+    def _mark_qr_orders_paid(self, domain):
+        """将符合条件的未支付 QR 订单一次性标记为已支付"""
+        qr_orders = self.env['qr.order'].sudo().search(domain + [('state', '!=', 'paid')])
+        if qr_orders:
+            qr_orders.write({'state': 'paid'})
+            _logger.info(f"Synced {len(qr_orders)} QR order(s) state to 'paid'")
+        return qr_orders
+
+    def _release_tables_after_payment(self):
+        """
+        支付后按餐桌批量处理（每一步一次查询，与订单数量无关）
+
+        a. 取消同桌台、同 POS 会话的其他 draft 订单（其 QR 订单先标记为已支付）
+        b. 没有未支付 POS 订单的餐桌：QR 订单标记为已支付，关闭会话并释放 QR 餐桌
+        """
+        PosOrder = self.env['pos.order'].sudo()
+        table_ids = self.mapped('table_id').ids
+
+        # 2a. 同桌台、同会话的其他 draft 订单
+        paid_keys = {(order.table_id.id, order.session_id.id) for order in self}
+        other_draft_orders = PosOrder.search([
+            ('table_id', 'in', table_ids),
+            ('session_id', 'in', self.mapped('session_id').ids),
+            ('state', '=', 'draft'),
+            ('id', 'not in', self.ids),
+        ]).filtered(lambda o: (o.table_id.id, o.session_id.id) in paid_keys)
+
+        if other_draft_orders:
+            # 先同步这些订单关联的所有 QR 订单状态
+            self._mark_qr_orders_paid([('pos_order_id', 'in', other_draft_orders.ids)])
+            # 取消这些 draft 订单
+            other_draft_orders.write({'state': 'cancel'})
+            _logger.info(f"Cancelled {len(other_draft_orders)} other draft orders for tables {table_ids}")
+
+        # 2b. 查找对应的 QR 餐桌（缓存的 restaurant.table -> qr.table 映射）
+        qr_tables = self.mapped('table_id').sudo().mapped('qr_table_id').filtered('current_session_id')
+        if not qr_tables:
+            return
+
+        # 仍有未支付 POS 订单的餐桌不释放
+        unpaid_groups = PosOrder._read_group([
+            ('table_id', 'in', qr_tables.mapped('pos_table_id').ids),
+            ('state', 'not in', ['paid', 'cancel']),
+            ('id', 'not in', self.ids),
+        ], groupby=['table_id'])
+        busy_table_ids = {table.id for table, in unpaid_groups}
+        release_tables = qr_tables.filtered(lambda t: t.pos_table_id.id not in busy_table_ids)
+        if not release_tables:
+            return
+
+        # 将这些会话的所有未完成 QR 订单标记为已支付
+        sessions = release_tables.mapped('current_session_id')
+        qr_orders = self.env['qr.order'].sudo().search([
+            ('session_id', 'in', sessions.ids),
+            ('state', 'not in', ['paid', 'cancelled']),
+        ])
+        if qr_orders:
+            qr_orders.write({'state': 'paid'})
+            _logger.info(f"Marked {len(qr_orders)} QR orders as paid")
+
+        # 关闭会话并释放餐桌
+        sessions.action_close()
+        release_tables.write({
+            'state': 'available',
+            'current_session_id': False,
+        })
+        _logger.info(f"Released QR tables {', '.join(release_tables.mapped('name'))} after payment")
@@ -2,11 +2,26 @@
 
 from odoo import models, fields, api
 from odoo.exceptions import UserError
+from odoo.tools.sql import create_index
+from datetime import timedelta
 import logging
 import json
 
 _logger = logging.getLogger(__name__)
 
+# 认领租约：终端认领后超过该时间仍未回写结果（终端崩溃/断网），任务重新变为可认领
+DEFAULT_LEASE_SECONDS = 120
+# 已完成 / 已取消的任务超过该天数后归档
+DEFAULT_ARCHIVE_DAYS = 1
+# 已归档的任务超过该天数后删除
+DEFAULT_RETENTION_DAYS = 30
+# 归档 / 删除时每批处理的行数（每批单独提交）
+RETENTION_BATCH_SIZE = 5000
+# 失败重试：第 n 次失败后等待 RETRY_BASE_SECONDS * 2^(n-1) 秒，最长 RETRY_MAX_DELAY_SECONDS
+DEFAULT_MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 10
+RETRY_MAX_DELAY_SECONDS = 600
+
 
 class PosPrintJob(models.Model):
     """POS 打印任务模型 - 用于 QR 订单的打印任务管理"""
@@ -49,6 +64,7 @@ class PosPrintJob(models.Model):
         ('printing', 'Printing / 打印中'),
         ('done', 'Done / 已完成'),
         ('failed', 'Failed / 失败'),
+        ('dead', 'Dead Letter / 放弃重试'),
         ('cancelled', 'Cancelled / 已取消'),
     ], string='Status / 状态', default='pending', required=True, index=True)
     
@@ -56,7 +72,12 @@ class PosPrintJob(models.Model):
     print_payload = fields.Text(
         string='Print Payload / 打印数据',
         required=True,
-        help='JSON 格式的打印数据，与 POS 点餐打印格式一致'
+        help='JSON 格式的打印数据（紧凑格式），与 POS 点餐打印格式一致'
+    )
+    payload_size = fields.Integer(
+        string='Payload Size / 数据大小',
+        readonly=True,
+        help='打印数据的字节数（UTF-8）'
     )
     
     # 打印信息
@@ -87,6 +108,11 @@ class PosPrintJob(models.Model):
         string='Error Message / 错误信息',
         help='如果打印失败，记录错误信息'
     )
+    next_attempt_at = fields.Datetime(
+        string='Next Attempt / 下次重试',
+        readonly=True,
+        help='失败任务到达该时间后重新可被认领'
+    )
     retry_count = fields.Integer(
         string='Retry Count / 重试次数',
         default=0,
@@ -98,11 +124,51 @@ class PosPrintJob(models.Model):
         string='Trace ID / 追踪ID',
         help='用于追踪和调试'
     )
+    active = fields.Boolean(
+        string='Active / 有效',
+        default=True,
+        help='已完成的任务由定时任务归档'
+    )
 
     _sql_constraints = [
         ('name_unique', 'unique(name)', 'Job name must be unique!'),
     ]
 
+    def init(self):
+        # 认领只查询待打印任务和租约过期的打印中任务，部分索引不随历史数据增长
+        create_index(
+            self.env.cr, 'pos_print_job_pending_idx', self._table,
+            ['pos_config_id', 'create_date', 'id'], where="state = 'pending'",
+        )
+        create_index(
+            self.env.cr, 'pos_print_job_printing_idx', self._table,
+            ['pos_config_id', 'claimed_at'], where="state = 'printing'",
+        )
+        create_index(
+            self.env.cr, 'pos_print_job_retry_idx', self._table,
+            ['pos_config_id', 'next_attempt_at'], where="state = 'failed'",
+        )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        jobs = super().create(vals_list)
+        jobs._notify_jobs_available()
+        return jobs
+
+    def _notify_jobs_available(self):
+        """
+        通过 bus 通知 POS 前端有新的待打印任务
+
+        bus 消息在事务提交后才会投递，前端收到时任务已可见。
+        """
+        for pos_config in self.mapped('pos_config_id'):
+            job_ids = self.filtered(lambda j: j.pos_config_id == pos_config and j.state == 'pending').ids
+            if job_ids:
+                pos_config._notify('QR_PRINT_JOB_AVAILABLE', {
+                    'config_id': pos_config.id,
+                    'job_ids': job_ids,
+                })
+
     @api.model
     def _generate_job_name(self):
         """生成任务名称"""
@@ -137,38 +203,292 @@ class PosPrintJob(models.Model):
             # 任务已被其他客户端认领或状态已改变
             return False, 'Job already claimed or status changed'
 
+    @api.model
+    def claim_next(self, config_id, client_id, max_jobs=10):
+        """
+        原子认领一批待打印任务
+
+        使用 FOR UPDATE SKIP LOCKED：多个终端同时认领时互不等待，
+        也不会认领到同一个任务。认领结果随当前请求的事务提交。
+        租约过期的打印中任务（认领终端崩溃）和到达重试时间的失败任务会被重新认领；
+        重新认领租约过期的任务与 _cron_reclaim_expired_claims 一样计为一次重试，
+        已达到最大次数的不再认领，由定时任务移入死信。
+
+        Args:
+            config_id: POS 配置 ID
+            client_id: 客户端标识（IP/主机名）
+            max_jobs: 最多认领的任务数
+
+        Returns:
+            pos.print.job 记录集（按创建时间排序）
+        """
+        self.env.cr.execute("""
+            UPDATE pos_print_job
+            SET state = 'printing',
+                claimed_by = %s,
+                claimed_at = (NOW() AT TIME ZONE 'UTC'),
+                retry_count = retry_count + CASE WHEN state = 'printing' THEN 1 ELSE 0 END
+            WHERE id IN (
+                SELECT id FROM pos_print_job
+                WHERE pos_config_id = %s
+                AND (
+                    state = 'pending'
+                    OR (state = 'printing'
+                        AND claimed_at < (NOW() AT TIME ZONE 'UTC') - make_interval(secs => %s)
+                        AND retry_count + 1 < %s)
+                    OR (state = 'failed'
+                        AND next_attempt_at <= (NOW() AT TIME ZONE 'UTC'))
+                )
+                ORDER BY create_date, id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id
+        """, (client_id, config_id, self._get_lease_seconds(), self._get_max_attempts(), max_jobs))
+        job_ids = [row[0] for row in self.env.cr.fetchall()]
+        if not job_ids:
+            return self.browse()
+
+        jobs = self.browse(job_ids)
+        jobs.invalidate_recordset(['state', 'claimed_by', 'claimed_at', 'retry_count'])
+        _logger.info(f"{len(job_ids)} job(s) claimed by {client_id} for config {config_id}")
+        return jobs.sorted(lambda j: (j.create_date, j.id))
+
+    @api.model
+    def _get_lease_seconds(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param(
+            'qr_ordering.print_job_lease_seconds', DEFAULT_LEASE_SECONDS
+        ))
+
+    @api.model
+    def _get_max_attempts(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param(
+            'qr_ordering.print_job_max_attempts', DEFAULT_MAX_ATTEMPTS
+        ))
+
+    @api.model
+    def _cron_reclaim_expired_claims(self):
+        """
+        租约过期的打印中任务退回待打印，并通知 POS 终端重新拉取
+
+        租约过期计为一次重试（与 claim_next 重新认领时一致），达到最大次数的任务进入死信。
+        """
+        max_attempts = self._get_max_attempts()
+        self.env.cr.execute("""
+            UPDATE pos_print_job
+            SET state = CASE WHEN retry_count + 1 >= %s THEN 'dead' ELSE 'pending' END,
+                claimed_by = NULL,
+                claimed_at = NULL,
+                next_attempt_at = NULL,
+                error_message = CASE WHEN retry_count + 1 >= %s
+                                     THEN 'Claim lease expired' ELSE error_message END,
+                retry_count = retry_count + 1
+            WHERE state = 'printing'
+            AND claimed_at < (NOW() AT TIME ZONE 'UTC') - make_interval(secs => %s)
+            RETURNING id, state
+        """, (max_attempts, max_attempts, self._get_lease_seconds()))
+        rows = self.env.cr.fetchall()
+        if rows:
+            jobs = self.browse([job_id for job_id, _state in rows])
+            jobs.invalidate_recordset([
+                'state', 'claimed_by', 'claimed_at', 'next_attempt_at', 'error_message', 'retry_count',
+            ])
+            jobs._notify_jobs_available()
+            dead_count = sum(1 for _job_id, state in rows if state == 'dead')
+            _logger.warning(f"Reclaimed {len(rows)} print job(s) with expired lease, {dead_count} moved to dead letter")
+        return len(rows)
+
+    @api.model
+    def _cron_archive_old_jobs(self):
+        """
+        归档已完成的任务并删除过期的归档任务
+
+        直接用 SQL 分批处理，每批提交，避免长事务和大量 ORM 缓存。
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        archive_days = int(ICP.get_param('qr_ordering.print_job_archive_days', DEFAULT_ARCHIVE_DAYS))
+        retention_days = int(ICP.get_param('qr_ordering.print_job_retention_days', DEFAULT_RETENTION_DAYS))
+
+        archived = self._run_in_batches("""
+            UPDATE pos_print_job SET active = FALSE
+            WHERE id IN (
+                SELECT id FROM pos_print_job
+                WHERE active
+                AND state IN ('done', 'cancelled')
+                AND create_date < (NOW() AT TIME ZONE 'UTC') - make_interval(days => %s)
+                LIMIT %s
+            )
+        """, archive_days)
+        deleted = self._run_in_batches("""
+            DELETE FROM pos_print_job
+            WHERE id IN (
+                SELECT id FROM pos_print_job
+                WHERE NOT active
+                AND create_date < (NOW() AT TIME ZONE 'UTC') - make_interval(days => %s)
+                LIMIT %s
+            )
+        """, retention_days)
+
+        if archived or deleted:
+            self.invalidate_model(['active'])
+            _logger.info(f"Print job retention: archived {archived}, deleted {deleted}")
+        return archived, deleted
+
+    @api.model
+    def _run_in_batches(self, query, days):
+        total = 0
+        while True:
+            self.env.cr.execute(query, (days, RETENTION_BATCH_SIZE))
+            count = self.env.cr.rowcount
+            self.env.cr.commit()
+            total += count
+            if count < RETENTION_BATCH_SIZE:
+                return total
+
+    @api.model
+    def mark_batch(self, client_id, done_ids=None, failed=None):
+        """
+        批量回写打印结果
+
+        只回写 client_id 认领且仍在打印中的任务
+        （租约过期后被其他终端重新认领、或已被回收 / 重试的任务不覆盖）。
+
+        Args:
+            client_id: 客户端标识（与认领时相同）
+            done_ids: 打印成功的任务 ID 列表
+            failed: 打印失败的任务 [{'job_id': x, 'error_message': '...'}, ...]
+
+        Returns:
+            (成功数, 失败数)
+        """
+        def _claimed(job):
+            return job.state == 'printing' and job.claimed_by == client_id
+
+        done_jobs = self.browse(done_ids or []).exists().filtered(_claimed)
+        done_jobs.action_mark_done()
+
+        failed_count = 0
+        for item in failed or []:
+            job = self.browse(item.get('job_id')).exists()
+            if job and _claimed(job):
+                job.action_mark_failed(item.get('error_message') or 'Unknown error')
+                failed_count += 1
+        return len(done_jobs), failed_count
+
     def action_mark_done(self):
         """标记任务完成"""
-        self.ensure_one()
+        if not self:
+            return
         self.write({
             'state': 'done',
             'printed_at': fields.Datetime.now(),
         })
-        _logger.info(f"Job {self.name} marked as done")
+        _logger.info(f"Job(s) {', '.join(self.mapped('name'))} marked as done")
+        self._release_recovered_printers()
+
+    def _release_recovered_printers(self):
+        """
+        打印成功说明打印机已恢复：该打印机正在退避等待的失败任务立即退回待打印
+
+        不论由哪个终端打印成功都会触发，不需要手动调用 action_retry_printer。
+        保留重试计数（仍受最大次数限制，不会因为其他任务打印成功而无限重试），
+        死信任务仍需手动或按打印机批量重试。
+
+        Returns:
+            退回待打印的任务数
+        """
+        printers = {(job.pos_config_id.id, job.printer_name) for job in self if job.printer_name}
+        if not printers:
+            return 0
+        waiting = self.search([
+            ('state', '=', 'failed'),
+            ('pos_config_id', 'in', list({config_id for config_id, _name in printers})),
+            ('printer_name', 'in', list({name for _config_id, name in printers})),
+        ]).filtered(lambda j: (j.pos_config_id.id, j.printer_name) in printers)
+        if waiting:
+            waiting.write({
+                'state': 'pending',
+                'next_attempt_at': False,
+            })
+            waiting._notify_jobs_available()
+            _logger.info(f"Printer(s) {', '.join(sorted({name for _config_id, name in printers}))} recovered, "
+                         f"released {len(waiting)} failed job(s)")
+        return len(waiting)
 
     def action_mark_failed(self, error_message):
-        """标记任务失败"""
-        self.ensure_one()
-        self.write({
-            'state': 'failed',
-            'error_message': error_message,
-            'retry_count': self.retry_count + 1,
-        })
-        _logger.warning(f"Job {self.name} marked as failed: {error_message}")
+        """
+        标记任务失败
+
+        按指数退避安排自动重试（到期后 claim_next 会重新认领；同一打印机有任务打印成功时
+        立即退回待打印，见 _release_recovered_printers），
+        达到最大次数后进入死信状态，只能手动或按打印机批量重试。
+        """
+        max_attempts = self._get_max_attempts()
+        now = fields.Datetime.now()
+        for job in self:
+            retry_count = job.retry_count + 1
+            if retry_count >= max_attempts:
+                job.write({
+                    'state': 'dead',
+                    'error_message': error_message,
+                    'retry_count': retry_count,
+                    'next_attempt_at': False,
+                })
+                _logger.error(f"Job {job.name} moved to dead letter after {retry_count} attempts: {error_message}")
+                continue
+
+            delay = min(RETRY_BASE_SECONDS * 2 ** (retry_count - 1), RETRY_MAX_DELAY_SECONDS)
+            job.write({
+                'state': 'failed',
+                'error_message': error_message,
+                'retry_count': retry_count,
+                'next_attempt_at': now + timedelta(seconds=delay),
+            })
+            _logger.warning(f"Job {job.name} marked as failed, retry in {delay}s: {error_message}")
 
     def action_retry(self):
         """重试任务"""
         self.ensure_one()
-        if self.state not in ['failed', 'cancelled']:
+        if self.state not in ['failed', 'dead', 'cancelled']:
             raise UserError('只能重试失败或已取消的任务')
         
+        self._requeue()
+        _logger.info(f"Job {self.name} retried")
+
+    @api.model
+    def action_retry_printer(self, pos_config_id, printer_name):
+        """
+        手动重新排队该打印机所有失败 / 死信任务（重置重试计数）
+
+        退避中的失败任务在该打印机打印成功时已自动释放（_release_recovered_printers），
+        这里用于修好打印机后一并重试死信任务。
+
+        Returns:
+            重新排队的任务数
+        """
+        jobs = self.search([
+            ('pos_config_id', '=', pos_config_id),
+            ('printer_name', '=', printer_name),
+            ('state', 'in', ['failed', 'dead']),
+        ])
+        jobs._requeue()
+        if jobs:
+            _logger.info(f"Requeued {len(jobs)} job(s) for printer {printer_name}")
+        return len(jobs)
+
+    def _requeue(self):
+        """退回待打印并重置重试计数"""
+        if not self:
+            return
         self.write({
             'state': 'pending',
             'claimed_by': False,
             'claimed_at': False,
             'error_message': False,
+            'next_attempt_at': False,
+            'retry_count': 0,
         })
-        _logger.info(f"Job {self.name} retried")
+        self._notify_jobs_available()
 
     @api.model
     def get_pending_jobs(self, pos_config_id, limit=10):
@@ -196,13 +516,15 @@ class PosPrintJob(models.Model):
         # 准备打印 payload（需要与 POS 点餐打印格式一致）
         # TODO: 这里需要根据实际的 YLHC Recorder payload 格式来构建
         print_payload = self._prepare_print_payload(qr_order, pos_order, print_type)
+        payload_text = json.dumps(print_payload, ensure_ascii=False, separators=(',', ':'))
         
         job = self.create({
             'pos_config_id': qr_order.pos_config_id.id,
             'pos_order_id': pos_order.id if pos_order else False,
             'qr_order_id': qr_order.id,
             'print_type': print_type,
-            'print_payload': json.dumps(print_payload, ensure_ascii=False),
+            'print_payload': payload_text,
+            'payload_size': len(payload_text.encode('utf-8')),
             'printer_name': self._get_printer_name(qr_order.pos_config_id, print_type),
             'trace_id': f"QR-{qr_order.name}",
         })
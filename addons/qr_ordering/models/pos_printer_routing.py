@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# 厨房打印机路由表
+#
+# 按 POS 配置缓存 "POS 分类 -> 负责该分类的打印机"，父分类已展开到所有子分类，
+# 拆单时每行只需一次字典查找。pos.category / pos.printer 中路由读取的字段、pos.config 打印机 /
+# ylhc.printer 修改时清除 ormcache（Odoo 会通知其他 worker）。
+
+from odoo import models, api, tools
+
+
+class PosConfig(models.Model):
+    _inherit = 'pos.config'
+
+    @api.model
+    @tools.ormcache('config_id')
+    def _get_qr_printer_routing(self, config_id):
+        """
+        返回 POS 配置的厨房打印机路由表（缓存，调用方不得修改）
+
+        Returns:
+            dict:
+            - printers: ((pos_printer_id, ylhc_printer_id, has_categories), ...)，
+              顺序与 printer_ids 一致；ylhc_printer_id 为 False 表示不是云打印机
+            - categ_printers: {pos_category_id: frozenset(pos_printer_id)}，
+              包含打印机分类的所有子分类
+        """
+        config = self.browse(config_id).sudo()
+        Category = self.env['pos.category'].sudo()
+        printers = []
+        categ_printers = {}
+        for printer in config.printer_ids:
+            printers.append((printer.id, self._resolve_ylhc_printer_id(printer), bool(printer.product_categories_ids)))
+            if not printer.product_categories_ids:
+                continue
+            # 产品分类是打印机分类的子分类时同样匹配
+            categs = Category.search([('id', 'child_of', printer.product_categories_ids.ids)])
+            for categ_id in categs.ids:
+                categ_printers.setdefault(categ_id, set()).add(printer.id)
+
+        return {
+            'printers': tuple(printers),
+            'categ_printers': {categ_id: frozenset(ids) for categ_id, ids in categ_printers.items()},
+        }
+
+    @api.model
+    def _resolve_ylhc_printer_id(self, printer):
+        """pos.printer 对应的 ylhc.printer ID（没有时返回 False）"""
+        if hasattr(printer, 'ylhc_printer_id') and printer.ylhc_printer_id:
+            return printer.ylhc_printer_id.id
+        if hasattr(printer, 'printer_type') and printer.printer_type == 'cloud_printer':
+            # 尝试通过名称匹配 ylhc.printer
+            ylhc_printer = self.env['ylhc.printer'].sudo().search([
+                ('name', '=', printer.name),
+                ('active', '=', True),
+            ], limit=1)
+            return ylhc_printer.id
+        return False
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'printer_ids' in vals:
+            self.env.registry.clear_cache()
+        return res
+
+
+class PosPrinter(models.Model):
+    _inherit = 'pos.printer'
+
+    # 路由表读取的字段
+    _qr_routing_fields = frozenset({'name', 'printer_type', 'product_categories_ids', 'ylhc_printer_id'})
+
+    # 新建的打印机要加入 pos.config.printer_ids 后才参与路由，由 PosConfig.write 清除缓存
+
+    def write(self, vals):
+        res = super().write(vals)
+        if not self._qr_routing_fields.isdisjoint(vals):
+            self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        # 删除时 Odoo 直接删除 printer_ids 关联行，不经过 PosConfig.write
+        in_use = self and self.env['pos.config'].sudo().with_context(active_test=False).search_count(
+            [('printer_ids', 'in', self.ids)], limit=1,
+        )
+        res = super().unlink()
+        if in_use:
+            self.env.registry.clear_cache()
+        return res
+
+
+class PosCategory(models.Model):
+    _inherit = 'pos.category'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        # 新子分类需要加入父分类打印机的路由
+        if any(vals.get('parent_id') for vals in vals_list):
+            self.env.registry.clear_cache()
+        return records
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'parent_id' in vals:
+            self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env.registry.clear_cache()
+        return res
+
+
+class YlhcPrinter(models.Model):
+    _inherit = 'ylhc.printer'
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'name' in vals or 'active' in vals:
+            self.env.registry.clear_cache()
+        return res
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return records
+
+    def unlink(self):
+        res = super().unlink()
+        self.env.registry.clear_cache()
+        return res
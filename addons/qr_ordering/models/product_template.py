@@ -2,6 +2,9 @@
 
 from odoo import models, fields, api
 
+from ..services import image_variants
+from ..services.tax_resolver import TaxResolver
+
 import logging
 _logger = logging.getLogger(__name__)
 
@@ -84,12 +87,21 @@ class ProductProduct(models.Model):
     """产品变体扩展"""
     _inherit = 'product.product'
 
-    def get_qr_ordering_data(self, lang='zh_CN', pos_config=None):
+    @api.model
+    def _cron_purge_qr_image_variants(self):
+        """定时任务：删除长期未访问的扫码点餐图片变体文件"""
+        removed = image_variants.purge_stale(self.env.cr.dbname)
+        if removed:
+            _logger.info(f"Purged {removed} stale QR image variant(s)")
+        return removed
+
+    def get_qr_ordering_data(self, lang='zh_CN', pos_config=None, tax_resolver=None):
         """获取扫码点餐数据
 
         Args:
             lang: 语言代码
             pos_config: POS 配置，用于获取税率和财务位置
+            tax_resolver: 可选，批量序列化菜单时共用的 TaxResolver
         """
         self.ensure_one()
 
@@ -103,18 +115,13 @@ class ProductProduct(models.Model):
         # 如果提供了 POS 配置，计算含税价格
         price_with_tax = price
         tax_rate = 0.0
-        if pos_config:
-            company = pos_config.company_id
-            fiscal_position = pos_config.default_fiscal_position_id
-            taxes = self.taxes_id.filtered(lambda t: t.company_id == company)
-            if fiscal_position:
-                taxes = fiscal_position.map_tax(taxes)
-            if taxes:
-                # 计算含税价格
-                tax_result = taxes.compute_all(price, product=self)
-                price_with_tax = tax_result['total_included']
-                if price > 0:
-                    tax_rate = (price_with_tax - price) / price * 100
+        if pos_config and not tax_resolver:
+            tax_resolver = TaxResolver.for_pos_config(pos_config)
+        if tax_resolver:
+            # 计算含税价格
+            taxes, _excluded, price_with_tax = tax_resolver.compute(self, price)
+            if taxes and price > 0:
+                tax_rate = (price_with_tax - price) / price * 100
 
         return {
             'id': self.id,
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# 楼面状态 - 每张餐桌的当前会话、订单数、未结金额、最后活动时间
+#
+# 员工的餐桌列表原来依赖 qr.table.order_count、qr.session.order_count 等逐条计算的字段，
+# 每张餐桌各查询一次。这里用一个 SQL 视图一次性汇总所有餐桌：
+# - 数据直接来自 qr_table / qr_session / qr_order，订单或会话变化后立即反映，无需刷新
+# - 只统计餐桌当前会话（current_session_id）中的订单，关台后清零
+# - qr_order.session_id 有索引，每张餐桌的汇总是一次索引扫描
+
+from odoo import models, fields, tools
+
+
+class QrFloorStatus(models.Model):
+    """楼面状态（只读 SQL 视图）"""
+    _name = 'qr.floor.status'
+    _description = 'QR Floor Status / 楼面状态'
+    _auto = False
+    _order = 'pos_config_id, sequence, name'
+    # 视图读取的列：这些字段写入后 ORM 会刷新到数据库并失效本模型缓存
+    _depends = {
+        'qr.table': ['name', 'sequence', 'pos_config_id', 'state', 'current_session_id', 'active'],
+        'qr.session': ['state', 'create_date', 'write_date'],
+        'qr.order': ['session_id', 'state', 'total_qty', 'total_amount', 'write_date'],
+    }
+
+    table_id = fields.Many2one('qr.table', string='Table / 餐桌', readonly=True)
+    name = fields.Char(string='Table Name / 餐桌名称', readonly=True)
+    sequence = fields.Integer(string='Sequence / 排序', readonly=True)
+    pos_config_id = fields.Many2one('pos.config', string='POS Config / POS配置', readonly=True)
+    table_state = fields.Selection([
+        ('available', 'Available / 空闲'),
+        ('occupied', 'Occupied / 使用中'),
+        ('reserved', 'Reserved / 已预订'),
+    ], string='Table Status / 餐桌状态', readonly=True)
+    session_id = fields.Many2one('qr.session', string='Session / 会话', readonly=True)
+    session_state = fields.Selection([
+        ('active', 'Active / 活跃'),
+        ('ordering', 'Ordering / 点餐中'),
+        ('waiting', 'Waiting / 等待上菜'),
+        ('serving', 'Serving / 用餐中'),
+        ('closed', 'Closed / 已关闭'),
+    ], string='Session Status / 会话状态', readonly=True)
+    session_start = fields.Datetime(string='Seated At / 开台时间', readonly=True)
+    order_count = fields.Integer(string='Orders / 订单数', readonly=True)
+    cart_qty = fields.Float(string='Cart Qty / 购物车数量', readonly=True)
+    unpaid_amount = fields.Float(string='Unpaid / 未结金额', readonly=True)
+    last_activity = fields.Datetime(string='Last Activity / 最后活动', readonly=True)
+
+    def init(self):
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute(f"""
+            CREATE OR REPLACE VIEW {self._table} AS (
+                SELECT
+                    t.id AS id,
+                    t.id AS table_id,
+                    t.name AS name,
+                    t.sequence AS sequence,
+                    t.pos_config_id AS pos_config_id,
+                    t.state AS table_state,
+                    s.id AS session_id,
+                    s.state AS session_state,
+                    s.create_date AS session_start,
+                    COALESCE(o.order_count, 0) AS order_count,
+                    COALESCE(o.cart_qty, 0) AS cart_qty,
+                    COALESCE(o.unpaid_amount, 0) AS unpaid_amount,
+                    GREATEST(s.write_date, o.last_write) AS last_activity
+                FROM qr_table t
+                LEFT JOIN qr_session s
+                    ON s.id = t.current_session_id AND s.state != 'closed'
+                LEFT JOIN LATERAL (
+                    SELECT
+                        COUNT(*) FILTER (WHERE qo.state NOT IN ('cart', 'cancelled')) AS order_count,
+                        SUM(qo.total_qty) FILTER (WHERE qo.state = 'cart') AS cart_qty,
+                        SUM(qo.total_amount) FILTER (
+                            WHERE qo.state NOT IN ('cart', 'cancelled', 'paid')
+                        ) AS unpaid_amount,
+                        MAX(qo.write_date) AS last_write
+                    FROM qr_order qo
+                    WHERE qo.session_id = s.id
+                ) o ON TRUE
+                WHERE t.active
+            )
+        """)
+
+    def action_open_table(self):
+        """打开餐桌表单"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': 'qr.table',
+            'res_id': self.table_id.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
+
+    def action_view_orders(self):
+        """查看当前会话的订单"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': f'Orders - {self.name}',
+            'res_model': 'qr.order',
+            'view_mode': 'list,form',
+            'domain': [('session_id', '=', self.session_id.id)],
+        }
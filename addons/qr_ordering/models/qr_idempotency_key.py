@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# 请求幂等键
+#
+# 点餐页面离线时，service worker 把购物车操作排队，网络恢复后重放。
+# 请求可能已经在服务端执行、只是响应在网络中断时丢失，重放时不能再执行一次。
+# 客户端为每个操作生成幂等键，服务端按 (会话, 幂等键) 记录成功的响应：
+# - 第一次请求：INSERT 占用幂等键，执行操作，保存响应（与操作在同一事务中提交）
+# - 重复请求：INSERT 冲突，直接返回保存的响应
+# - 并发的重复请求：INSERT 等待前一个事务结束。前一个事务提交后，
+#   REPEATABLE READ 快照看不到新提交的行，PostgreSQL 抛出 SerializationFailure，
+#   由 Odoo 用新的事务重试请求，重试时按“重复请求”返回保存的响应；
+#   前一个事务回滚时 INSERT 直接成功
+# - 操作失败时回滚占用，客户端可以用同一个键重试
+
+import json
+import logging
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+# 幂等键保留时间（小时），超过后由 cron 删除
+RETENTION_HOURS = 24
+PURGE_BATCH_SIZE = 5000
+# 客户端幂等键最大长度（UUID 为 36）
+MAX_KEY_LENGTH = 64
+
+
+class IdempotentCallFailed(Exception):
+    """幂等请求执行失败，用于回滚幂等键占用"""
+
+    def __init__(self, result):
+        super().__init__(result.get('error'))
+        self.result = result
+
+
+class QrIdempotencyKey(models.Model):
+    """请求幂等键 - 记录已执行请求的响应，用于重放去重"""
+    _name = 'qr.idempotency.key'
+    _description = 'QR Idempotency Key / 请求幂等键'
+    _order = 'id desc'
+
+    session_id = fields.Many2one(
+        'qr.session',
+        string='Session / 会话',
+        required=True,
+        ondelete='cascade',
+    )
+    key = fields.Char(string='Key / 幂等键', required=True)
+    endpoint = fields.Char(string='Endpoint / 接口')
+    response = fields.Json(string='Response / 响应')
+
+    _sql_constraints = [
+        ('session_key_unique', 'unique(session_id, key)', 'Idempotency key must be unique per session!'),
+    ]
+
+    @api.model
+    def _run(self, session, key, endpoint, func):
+        """
+        按幂等键执行 func（返回 {'success': ..., ...} 的无参函数）
+
+        - 没有幂等键时直接执行
+        - 首次请求：执行 func，只保存成功的响应
+        - 重复请求：不执行 func，返回保存的响应并加上 replayed=True
+        - func 返回失败或抛出异常时回滚幂等键占用，客户端可以用同一个键重试
+          （异常继续向上抛出）
+        """
+        if not key:
+            return func()
+        if not isinstance(key, str) or len(key) > MAX_KEY_LENGTH:
+            return {'success': False, 'error': 'INVALID_IDEMPOTENCY_KEY', 'message': '请求参数错误'}
+
+        try:
+            with self.env.cr.savepoint():
+                key_id, stored = self._claim(session.id, key, endpoint)
+                if not key_id:
+                    if stored is None:
+                        return {'success': False, 'error': 'REQUEST_IN_PROGRESS', 'message': '请求处理中，请稍后'}
+                    _logger.info(f"Replayed idempotent request {endpoint} key={key}")
+                    return dict(stored, replayed=True)
+
+                result = func()
+                if not result.get('success'):
+                    raise IdempotentCallFailed(result)
+                self._store_response(key_id, result)
+                return result
+        except IdempotentCallFailed as e:
+            return e.result
+
+    @api.model
+    def _claim(self, session_id, key, endpoint):
+        """
+        占用幂等键
+
+        同一个键的请求正在另一个事务中执行时，INSERT 会等待它结束；
+        它提交后抛出 SerializationFailure（不在这里捕获，调用方也不能吞掉，
+        由 Odoo 重试整个请求）。
+
+        Returns:
+            (key_id, None)：首次请求，调用方执行操作后调用 _store_response
+            (None, response)：重复请求，response 为保存的响应
+            （已提交的键总是带有响应，response 为 None 只是防御性分支）
+        """
+        self.env.cr.execute("""
+            INSERT INTO qr_idempotency_key
+                (session_id, key, endpoint, create_uid, create_date, write_uid, write_date)
+            VALUES (%s, %s, %s, %s, NOW() AT TIME ZONE 'UTC', %s, NOW() AT TIME ZONE 'UTC')
+            ON CONFLICT (session_id, key) DO NOTHING
+            RETURNING id
+        """, (session_id, key, endpoint, self.env.uid, self.env.uid))
+        row = self.env.cr.fetchone()
+        if row:
+            return row[0], None
+
+        self.env.cr.execute("""
+            SELECT response FROM qr_idempotency_key
+            WHERE session_id = %s AND key = %s
+        """, (session_id, key))
+        row = self.env.cr.fetchone()
+        return None, row[0] if row else None
+
+    @api.model
+    def _store_response(self, key_id, response):
+        self.env.cr.execute(
+            "UPDATE qr_idempotency_key SET response = %s WHERE id = %s",
+            (json.dumps(response, default=str), key_id),
+        )
+
+    @api.model
+    def _cron_purge(self):
+        """删除过期的幂等键（分批提交）"""
+        total = 0
+        while True:
+            self.env.cr.execute("""
+                DELETE FROM qr_idempotency_key
+                WHERE id IN (
+                    SELECT id FROM qr_idempotency_key
+                    WHERE create_date < (NOW() AT TIME ZONE 'UTC') - make_interval(hours => %s)
+                    LIMIT %s
+                )
+            """, (RETENTION_HOURS, PURGE_BATCH_SIZE))
+            count = self.env.cr.rowcount
+            self.env.cr.commit()
+            total += count
+            if count < PURGE_BATCH_SIZE:
+                break
+        if total:
+            _logger.info(f"Purged {total} expired idempotency keys")
+        return total
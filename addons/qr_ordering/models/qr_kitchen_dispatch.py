@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# 厨房分发队列
+#
+# 下单 / 加菜时不再在请求内创建 KDS 变更、生成 ESC/POS、创建并处理打印任务，
+# 只写入一条队列记录并触发 ir.cron。POS 订单提交后请求立即返回，
+# 打印服务慢或暂时不可用不会影响顾客。
+#
+# - 队列记录与 POS 订单在同一事务中创建：回滚时不会产生多余的厨房单
+# - 每条任务单独提交，失败时按指数退避重试，超过 MAX_ATTEMPTS 标记为失败
+# - 同一 QR 订单的任务按创建顺序处理，前一条未完成时后一条等待（保证 KDS 序号顺序）
+
+from datetime import timedelta
+import logging
+import time
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 10
+# 单次 cron 运行的时间上限，超过后重新触发自己，避免长期占用 cron 线程
+RUN_TIME_LIMIT_SECONDS = 50
+
+
+class QrKitchenDispatch(models.Model):
+    """厨房分发任务 - KDS 变更和厨房打印的异步队列"""
+    _name = 'qr.kitchen.dispatch'
+    _description = 'QR Kitchen Dispatch / 厨房分发任务'
+    _order = 'id'
+
+    qr_order_id = fields.Many2one(
+        'qr.order',
+        string='QR Order / QR订单',
+        required=True,
+        index=True,
+        ondelete='cascade',
+    )
+    pos_order_id = fields.Many2one(
+        'pos.order',
+        string='POS Order / POS订单',
+        required=True,
+        ondelete='cascade',
+    )
+    is_batch = fields.Boolean(
+        string='Add Items / 加菜',
+        help='加菜批次只打印 line_ids 中的商品'
+    )
+    line_ids = fields.Many2many(
+        'qr.order.line',
+        string='Lines / 订单行',
+        help='加菜批次的订单行；整单下单时为空，表示 QR 订单的全部行'
+    )
+    state = fields.Selection([
+        ('pending', 'Pending / 待处理'),
+        ('done', 'Done / 已完成'),
+        ('failed', 'Failed / 失败'),
+    ], string='Status / 状态', default='pending', required=True, index=True)
+    attempt_count = fields.Integer(string='Attempts / 尝试次数', default=0)
+    next_attempt_at = fields.Datetime(string='Next Attempt / 下次尝试', index=True)
+    done_at = fields.Datetime(string='Done At / 完成时间')
+    error_message = fields.Text(string='Error / 错误信息')
+
+    @api.model
+    def _enqueue(self, qr_order, pos_order, lines=None):
+        """
+        加入厨房分发队列（在当前事务中创建，提交后由 cron 处理）
+
+        Args:
+            qr_order: qr.order 记录
+            pos_order: pos.order 记录
+            lines: 加菜批次的订单行；为 None 时表示整单
+
+        Returns:
+            qr.kitchen.dispatch 记录
+        """
+        job = self.sudo().create({
+            'qr_order_id': qr_order.id,
+            'pos_order_id': pos_order.id,
+            'is_batch': lines is not None,
+            'line_ids': [(6, 0, lines.ids)] if lines is not None else False,
+        })
+
+        cron = self.env.ref('qr_ordering.ir_cron_kitchen_dispatch', raise_if_not_found=False)
+        if cron and cron.active:
+            cron.sudo()._trigger()
+        else:
+            # cron 被删除或停用时退回同步处理，保证厨房仍能收到订单；
+            # 失败时不影响下单，任务保留为待重试 / 失败状态
+            _logger.warning(f"Kitchen dispatch cron unavailable, dispatching {qr_order.name} inline")
+            job._process()
+        return job
+
+    def _process(self):
+        """执行一条任务：成功时标记完成，失败时回滚本次处理并按退避安排重试（由调用方提交）"""
+        self.ensure_one()
+        try:
+            with self.env.cr.savepoint():
+                self._dispatch()
+                self.write({
+                    'state': 'done',
+                    'done_at': fields.Datetime.now(),
+                    'attempt_count': self.attempt_count + 1,
+                    'error_message': False,
+                })
+        except Exception as e:
+            _logger.exception(f"Kitchen dispatch {self.id} for {self.qr_order_id.name} failed")
+            self._schedule_retry(str(e))
+
+    def _dispatch(self):
+        """执行 KDS 变更和厨房打印（KDS 或打印失败时抛出异常）"""
+        self.ensure_one()
+        qr_order = self.qr_order_id
+        pos_order = self.pos_order_id
+        # KDS 变更和厨房单标题使用同一个序号
+        change_sequence = qr_order._next_change_sequence(pos_order)
+        if self.is_batch:
+            qr_order._create_kds_change_for_batch(pos_order, self.line_ids, change_sequence)
+            qr_order._send_print_notification_for_batch(pos_order, self.line_ids)
+        else:
+            qr_order._create_kds_change(pos_order, change_sequence)
+            qr_order._send_print_notification(pos_order)
+
+    @api.model
+    def _cron_process_queue(self, limit=200):
+        """
+        Cron 入口：逐条处理到期的待处理任务
+
+        每条任务在独立事务中处理并提交，单条失败不影响其他任务。
+        """
+        started = time.monotonic()
+        processed = 0
+        while processed < limit:
+            if time.monotonic() - started > RUN_TIME_LIMIT_SECONDS:
+                self.env.ref('qr_ordering.ir_cron_kitchen_dispatch')._trigger()
+                break
+
+            job = self._claim_next()
+            if not job:
+                break
+            processed += 1
+
+            job._process()
+            self.env.cr.commit()
+
+        if processed:
+            _logger.info(f"Kitchen dispatch processed {processed} job(s)")
+        return processed
+
+    @api.model
+    def _claim_next(self):
+        """锁定下一条可处理的任务（同一 QR 订单中更早的任务未完成时跳过）"""
+        self.env.cr.execute("""
+            SELECT d.id
+              FROM qr_kitchen_dispatch d
+             WHERE d.state = 'pending'
+               AND (d.next_attempt_at IS NULL OR d.next_attempt_at <= (now() AT TIME ZONE 'UTC'))
+               AND NOT EXISTS (
+                   SELECT 1 FROM qr_kitchen_dispatch p
+                    WHERE p.qr_order_id = d.qr_order_id
+                      AND p.state = 'pending'
+                      AND p.id < d.id
+               )
+             ORDER BY d.id
+             LIMIT 1
+               FOR UPDATE SKIP LOCKED
+        """)
+        row = self.env.cr.fetchone()
+        return self.browse(row[0]) if row else self.browse()
+
+    def _schedule_retry(self, error_message):
+        """按指数退避安排重试，超过最大次数标记为失败"""
+        self.ensure_one()
+        attempts = self.attempt_count + 1
+        if attempts >= MAX_ATTEMPTS:
+            self.write({
+                'state': 'failed',
+                'attempt_count': attempts,
+                'error_message': error_message,
+            })
+            _logger.error(f"Kitchen dispatch {self.id} for {self.qr_order_id.name} failed after {attempts} attempts")
+            return
+
+        next_attempt_at = fields.Datetime.now() + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+        self.write({
+            'attempt_count': attempts,
+            'next_attempt_at': next_attempt_at,
+            'error_message': error_message,
+        })
+        cron = self.env.ref('qr_ordering.ir_cron_kitchen_dispatch', raise_if_not_found=False)
+        if cron and cron.active:
+            cron.sudo()._trigger(next_attempt_at)
+
+    def action_retry(self):
+        """手动重试失败的任务"""
+        self.filtered(lambda j: j.state == 'failed').write({
+            'state': 'pending',
+            'attempt_count': 0,
+            'next_attempt_at': False,
+        })
+        self.env.ref('qr_ordering.ir_cron_kitchen_dispatch')._trigger()
+        return True
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# 菜单版本号 - 影响扫码点餐菜单的数据变化时使菜单快照失效
+#
+# 菜单快照（services/menu_snapshot.py）按版本号失效。原来每次请求都对六张表取
+# max(write_date)，没有索引可用，每次都顺序扫描产品表，且删除记录不会改变版本号。
+# 这里在创建 / 删除记录以及修改菜单读取的字段时增加版本号；库存、成本等其他字段的
+# 写入不影响菜单，不增加版本号（也不清除 ormcache）。
+
+from odoo import models, api
+
+from ..services.menu_snapshot import bump_menu_version
+
+
+class QrMenuVersionMixin(models.AbstractModel):
+    """修改后增加菜单版本号"""
+    _name = 'qr.menu.version.mixin'
+    _description = 'QR Menu Version Mixin / 菜单版本号'
+
+    # 菜单读取的字段；None 表示任何字段的修改都影响菜单
+    _qr_menu_fields = None
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        bump_menu_version(self.env)
+        return records
+
+    def write(self, vals):
+        res = super().write(vals)
+        if self and (self._qr_menu_fields is None or not self._qr_menu_fields.isdisjoint(vals)):
+            bump_menu_version(self.env)
+        return res
+
+    def unlink(self):
+        if self:
+            bump_menu_version(self.env)
+        return super().unlink()
+
+
+class ProductTemplate(models.Model):
+    _name = 'product.template'
+    _inherit = ['product.template', 'qr.menu.version.mixin']
+
+    _qr_menu_fields = frozenset({
+        'name', 'active', 'list_price', 'taxes_id', 'available_in_pos', 'pos_categ_ids',
+        'description_sale', 'qr_short_desc', 'qr_available', 'qr_sold_out', 'qr_highlight',
+        'qr_pinned', 'qr_pinned_sequence', 'qr_tags', 'qr_video', 'qr_video_url',
+    })
+
+
+class ProductProduct(models.Model):
+    _name = 'product.product'
+    _inherit = ['product.product', 'qr.menu.version.mixin']
+
+    # 模板字段经 _inherits 写入 product.template，由模板触发
+    _qr_menu_fields = frozenset({'active', 'lst_price', 'product_template_attribute_value_ids'})
+
+
+class PosCategory(models.Model):
+    _name = 'pos.category'
+    _inherit = ['pos.category', 'qr.menu.version.mixin']
+
+    _qr_menu_fields = frozenset({'name', 'sequence', 'parent_id'})
+
+
+class QrProductTag(models.Model):
+    _name = 'qr.product.tag'
+    _inherit = ['qr.product.tag', 'qr.menu.version.mixin']
+
+    _qr_menu_fields = frozenset({'name', 'sequence', 'color'})
+
+
+class AccountTax(models.Model):
+    _name = 'account.tax'
+    _inherit = ['account.tax', 'qr.menu.version.mixin']
+
+
+class PosConfig(models.Model):
+    _name = 'pos.config'
+    _inherit = ['pos.config', 'qr.menu.version.mixin']
+
+    _qr_menu_fields = frozenset({'company_id', 'default_fiscal_position_id'})
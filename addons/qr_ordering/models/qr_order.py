@@ -8,8 +8,13 @@ from datetime import datetime, timedelta
 from odoo import models, fields, api
 from odoo.exceptions import UserError, ValidationError
 
+from ..services import escpos_layout, hot_log
+from ..services.escpos_renderer import KitchenTicket, TicketLine, get_ticket_template
+from ..services.tax_resolver import TaxResolver
+
 import logging
 _logger = logging.getLogger(__name__)
+_sync_log = hot_log.HotLog('sync')
 
 
 class QrOrder(models.Model):
@@ -33,6 +38,7 @@ class QrOrder(models.Model):
         'qr.session',
         string='Session / 会话',
         required=True,
+        index=True,
         ondelete='cascade'
     )
     table_id = fields.Many2one(
@@ -191,7 +197,7 @@ class QrOrder(models.Model):
             'order_time': fields.Datetime.now(),
         })
 
-        # 同步到 POS（包含 POS Session 验证、KDS 通知、厨房打印）
+        # 同步到 POS（包含 POS Session 验证，KDS 通知和厨房打印进入分发队列）
         success, error_code, error_message = self._sync_to_pos()
         if not success:
             # 同步失败，回滚状态
@@ -287,23 +293,21 @@ class QrOrder(models.Model):
                 for qr_order in session_qr_orders:
                     if qr_order.pos_order_id.state == 'draft':
                         existing_pos_order = qr_order.pos_order_id
-                        _logger.warning(f"[Sync] Found existing POS order {existing_pos_order.name} from current QR session")
                         break
 
-            if not existing_pos_order:
-                _logger.warning(f"[Sync] No existing POS order linked to current QR session, will create new one")
-
         if existing_pos_order:
             # 3a. 追加订单行到现有 POS 订单
-            _logger.info(f"Found existing POS order {existing_pos_order.name} for table {restaurant_table.table_number}, appending lines")
+            _sync_log.debug(
+                'append', order=self.name, pos_order=existing_pos_order.name,
+                table=lambda: restaurant_table.table_number,
+            )
             self._append_lines_to_pos_order(existing_pos_order, pos_session)
             pos_order = existing_pos_order
         else:
             # 3b. 创建新的 POS 订单
             order_data = self._prepare_pos_order_data(pos_session)
-            _logger.info(f"Creating new POS order for QR Order {self.name}")
             pos_order = self.env['pos.order'].create(order_data)
-            _logger.info(f"Created POS Order {pos_order.name} for QR Order {self.name}")
+            _sync_log.debug('create', order=self.name, pos_order=pos_order.name, pos_order_id=pos_order.id)
 
         # 4. 更新 QR 订单的 POS 关联和幂等性字段
         self.write({
@@ -314,66 +318,109 @@ class QrOrder(models.Model):
             'last_print_time': fields.Datetime.now(),
         })
 
-        # 5. 创建 KDS 变更记录并发送通知
-        self._create_kds_change(pos_order)
+        # 5. KDS 变更和厨房打印加入分发队列，提交后由 cron 异步处理
+        # 打印服务慢或不可用时不阻塞顾客下单
+        self.env['qr.kitchen.dispatch']._enqueue(self, pos_order)
 
-        # 6. 发送打印通知到 POS 前端
-        # 打印代理运行在 POS 主机上，只有 POS 前端才能触发实际打印
-        self._send_print_notification(pos_order)
-
-        _logger.info(f"QR Order {self.name} synced to POS Order {pos_order.name} with idempotency_key {new_idempotency_key}")
+        _sync_log.info(
+            'synced', order=self.name, pos_order=pos_order.name,
+            appended=bool(existing_pos_order), idempotency_key=new_idempotency_key,
+        )
         return True, None, None
 
     def _append_lines_to_pos_order(self, pos_order, pos_session):
         """将当前 QR 订单的商品行追加到现有 POS 订单"""
-        for line in self.line_ids:
-            product = line.product_id
-            # 获取产品的税率配置
-            fiscal_position = pos_session.config_id.default_fiscal_position_id
-            taxes = product.taxes_id.filtered(lambda t: t.company_id == pos_session.company_id)
-            if fiscal_position:
-                taxes = fiscal_position.map_tax(taxes)
-
-            # 计算含税/不含税价格
-            price_unit = line.price_unit
-            if taxes:
-                tax_result = taxes.compute_all(
-                    price_unit,
-                    currency=pos_session.currency_id,
-                    quantity=line.qty,
-                    product=product,
-                )
-                price_subtotal = tax_result['total_excluded']
-                price_subtotal_incl = tax_result['total_included']
-            else:
-                price_subtotal = price_unit * line.qty
-                price_subtotal_incl = price_subtotal
+        # 不添加 [QR:xxx] 前缀，保持收据格式与 POS 一致
+        # QR 已通过 YLHC Print Manager 发送厨房打印，POS 可以选择再次发送或忽略
+        new_amount_total, new_amount_tax = self._create_pos_order_lines(pos_order, pos_session, self.line_ids)
+        _sync_log.debug(
+            'appended', order=self.name, pos_order=pos_order.name, lines=len(self.line_ids),
+            amount_total=new_amount_total, amount_tax=new_amount_tax,
+        )
+
+    def _prepare_pos_line_vals(self, pos_session, lines, note_prefix=None):
+        """
+        构建 POS 订单行数据 - 新建订单、追加订单、加菜三个同步入口共用
+
+        Args:
+            pos_session: pos.session，决定公司、财务位置和币种
+            lines: qr.order.line 记录集
+            note_prefix: 可选的 customer_note 前缀（如加菜批次标记）
 
-            self.env['pos.order.line'].create({
-                'order_id': pos_order.id,
+        Returns:
+            (vals_list, amount_total, amount_tax)
+        """
+        tax_resolver = self._get_pos_tax_resolver(pos_session, lines)
+        results = tax_resolver.compute_many(
+            (line.product_id, line.price_unit, line.qty) for line in lines
+        )
+
+        vals_list = []
+        amount_total = 0.0
+        amount_tax = 0.0
+        for line, (taxes, price_subtotal, price_subtotal_incl) in zip(lines, results):
+            product = line.product_id
+            amount_total += price_subtotal_incl
+            amount_tax += price_subtotal_incl - price_subtotal
+            note = line.note or ''
+            vals_list.append({
                 'product_id': product.id,
                 'qty': line.qty,
-                'price_unit': price_unit,
+                'price_unit': line.price_unit,
                 'price_subtotal': price_subtotal,
                 'price_subtotal_incl': price_subtotal_incl,
                 'full_product_name': product.name,
-                'customer_note': line.note or '',  # 不添加 [QR:xxx] 前缀，保持收据格式与 POS 一致
+                'customer_note': f"{note_prefix} {note}" if note_prefix else note,
                 'tax_ids': [(6, 0, taxes.ids)] if taxes else [],
                 # 注意：不设置 skip_change，让 POS 前端正常处理订单
-                # QR 已通过 YLHC Print Manager 发送厨房打印，POS 可以选择再次发送或忽略
             })
+        return vals_list, amount_total, amount_tax
 
-        # 重新计算 POS 订单总金额
-        pos_order._onchange_amount_all()
+    def _create_pos_order_lines(self, pos_order, pos_session, lines, note_prefix=None):
+        """
+        一次 create(vals_list) 批量创建 POS 订单行，并只重新计算一次订单金额
 
-        # 强制重新计算并保存金额（确保数据库中的值是最新的）
-        new_amount_total = sum(line.price_subtotal_incl for line in pos_order.lines)
-        new_amount_tax = sum(line.price_subtotal_incl - line.price_subtotal for line in pos_order.lines)
+        Returns:
+            (amount_total, amount_tax) 更新后的 POS 订单金额
+        """
+        vals_list, _total, _tax = self._prepare_pos_line_vals(pos_session, lines, note_prefix)
+        for vals in vals_list:
+            vals['order_id'] = pos_order.id
+        self.env['pos.order.line'].create(vals_list)
+        return self._recompute_pos_order_amounts(pos_order)
+
+    def _recompute_pos_order_amounts(self, pos_order):
+        """
+        用一次聚合查询重新计算并保存 POS 订单金额
+
+        替代 _onchange_amount_all：后者会对每一行重新执行税计算，
+        而订单行的含税/不含税小计在创建时已经算好
+        """
+        self.env['pos.order.line'].flush_model(['order_id', 'price_subtotal', 'price_subtotal_incl'])
+        self.env.cr.execute("""
+            SELECT COALESCE(SUM(price_subtotal), 0), COALESCE(SUM(price_subtotal_incl), 0)
+            FROM pos_order_line
+            WHERE order_id = %s
+        """, (pos_order.id,))
+        amount_untaxed, amount_total = self.env.cr.fetchone()
+        currency = pos_order.currency_id
+        amount_untaxed = currency.round(amount_untaxed) if currency else amount_untaxed
+        amount_total = currency.round(amount_total) if currency else amount_total
+        amount_tax = amount_total - amount_untaxed
         pos_order.write({
-            'amount_total': new_amount_total,
-            'amount_tax': new_amount_tax,
+            'amount_total': amount_total,
+            'amount_tax': amount_tax,
         })
-        _logger.warning(f"Appended {len(self.line_ids)} lines to POS order {pos_order.name}, new total={new_amount_total}, tax={new_amount_tax}")
+        return amount_total, amount_tax
+
+    def _get_pos_tax_resolver(self, pos_session, lines=None):
+        """创建本次同步共用的 TaxResolver（POS 会话的公司、默认财务位置和币种）"""
+        lines = self.line_ids if lines is None else lines
+        return TaxResolver(
+            pos_session.company_id,
+            pos_session.config_id.default_fiscal_position_id,
+            pos_session.currency_id,
+        ).prefetch(lines.product_id)
 
     def _get_active_pos_session(self):
         """获取活跃的 POS 会话"""
@@ -384,57 +431,14 @@ class QrOrder(models.Model):
 
     def _prepare_pos_order_data(self, pos_session):
         """准备 POS 订单数据"""
-        lines = []
-        total_tax = 0.0
-        total_amount = 0.0
-
-        for line in self.line_ids:
-            product = line.product_id
-            # 获取产品的税率配置（使用 POS 会话的财务位置）
-            fiscal_position = pos_session.config_id.default_fiscal_position_id
-            taxes = product.taxes_id.filtered(lambda t: t.company_id == pos_session.company_id)
-            if fiscal_position:
-                taxes = fiscal_position.map_tax(taxes)
-
-            # 计算含税/不含税价格
-            price_unit = line.price_unit
-            if taxes:
-                # 计算税额
-                tax_result = taxes.compute_all(
-                    price_unit,
-                    currency=pos_session.currency_id,
-                    quantity=line.qty,
-                    product=product,
-                )
-                price_subtotal = tax_result['total_excluded']
-                price_subtotal_incl = tax_result['total_included']
-                line_tax = price_subtotal_incl - price_subtotal
-            else:
-                price_subtotal = price_unit * line.qty
-                price_subtotal_incl = price_subtotal
-                line_tax = 0.0
-
-            total_tax += line_tax
-            total_amount += price_subtotal_incl
-
-            lines.append((0, 0, {
-                'product_id': product.id,
-                'qty': line.qty,
-                'price_unit': price_unit,
-                'price_subtotal': price_subtotal,
-                'price_subtotal_incl': price_subtotal_incl,
-                'full_product_name': product.name,
-                'customer_note': line.note or '',
-                'tax_ids': [(6, 0, taxes.ids)] if taxes else [],
-                # 注意：不设置 skip_change，让 POS 前端正常处理订单
-            }))
+        vals_list, total_amount, total_tax = self._prepare_pos_line_vals(pos_session, self.line_ids)
+        lines = [(0, 0, vals) for vals in vals_list]
 
         # 生成 pos_reference（格式：Order {session_id}-{sequence}）
         # 注意：不要使用 "QR"、"Self-Order"、"Kiosk" 等前缀，否则 POS 前端可能会将其识别为自助点餐订单并隐藏
-        sequence = self.env['pos.order'].search_count([
-            ('session_id', '=', pos_session.id)
-        ]) + 1
-        pos_reference = f"Order {pos_session.id:05d}-{sequence:04d}"
+        # 序号来自 ir.sequence（PostgreSQL 序列，不加锁）：并发下单不会得到相同的序号
+        sequence = self.env['ir.sequence'].sudo().next_by_code('qr_ordering.pos_reference')
+        pos_reference = f"Order {pos_session.id:05d}-{sequence}"
 
         # 获取 POS 配置的价格表（确保收据格式与 POS 直接下单一致）
         pricelist_id = pos_session.config_id.pricelist_id.id if pos_session.config_id.pricelist_id else False
@@ -479,44 +483,11 @@ class QrOrder(models.Model):
         # 获取新批次的订单行
         new_lines = self.line_ids.filtered(lambda l: l.batch_number == batch_number)
 
-        for line in new_lines:
-            product = line.product_id
-            # 获取产品的税率配置
-            fiscal_position = pos_session.config_id.default_fiscal_position_id
-            taxes = product.taxes_id.filtered(lambda t: t.company_id == pos_session.company_id)
-            if fiscal_position:
-                taxes = fiscal_position.map_tax(taxes)
-
-            # 计算含税/不含税价格
-            price_unit = line.price_unit
-            if taxes:
-                tax_result = taxes.compute_all(
-                    price_unit,
-                    currency=pos_session.currency_id,
-                    quantity=line.qty,
-                    product=product,
-                )
-                price_subtotal = tax_result['total_excluded']
-                price_subtotal_incl = tax_result['total_included']
-            else:
-                price_subtotal = price_unit * line.qty
-                price_subtotal_incl = price_subtotal
-
-            self.env['pos.order.line'].create({
-                'order_id': self.pos_order_id.id,
-                'product_id': product.id,
-                'qty': line.qty,
-                'price_unit': price_unit,
-                'price_subtotal': price_subtotal,
-                'price_subtotal_incl': price_subtotal_incl,
-                'full_product_name': product.name,
-                'customer_note': f"[加菜 Batch {batch_number}] {line.note or ''}",
-                'tax_ids': [(6, 0, taxes.ids)] if taxes else [],
-                # 注意：不设置 skip_change，让 POS 前端正常处理订单
-            })
-
-        # 更新 POS 订单总金额（会自动重新计算税额）
-        self.pos_order_id._onchange_amount_all()
+        # 批量创建 POS 订单行并更新订单总金额
+        self._create_pos_order_lines(
+            self.pos_order_id, pos_session, new_lines,
+            note_prefix=f"[加菜 Batch {batch_number}]",
+        )
 
         # 更新幂等性字段
         self.write({
@@ -525,145 +496,149 @@ class QrOrder(models.Model):
             'last_print_time': fields.Datetime.now(),
         })
 
-        # 创建 KDS 变更记录（仅包含新批次的商品）
-        self._create_kds_change_for_batch(self.pos_order_id, new_lines)
-
-        # 发送打印通知到 POS 前端（打印代理在 POS 主机上）
-        self._send_print_notification_for_batch(self.pos_order_id, new_lines)
+        # KDS 变更和加菜打印（仅包含新批次的商品）加入分发队列
+        self.env['qr.kitchen.dispatch']._enqueue(self, self.pos_order_id, lines=new_lines)
 
         _logger.info(f"Added {len(new_lines)} items (batch {batch_number}) to POS order {self.pos_order_id.name} with idempotency_key {new_idempotency_key}")
         return True
 
-    def _create_kds_change_for_batch(self, pos_order, lines):
-        """为指定的订单行创建 KDS 变更记录"""
-        try:
-            if 'ab_pos.order.change' not in self.env:
-                return
-
-            existing_changes = self.env['ab_pos.order.change'].sudo().search([
-                ('order_id', '=', pos_order.id)
-            ])
-            next_sequence = len(existing_changes) + 1
-
-            change = self.env['ab_pos.order.change'].sudo().create({
-                'order_id': pos_order.id,
-                'sequence_number': next_sequence,
-                'created_at': fields.Datetime.now(),
-            })
+    def _next_change_sequence(self, pos_order):
+        """
+        分配下一个订单变更序号（一次 UPDATE ... RETURNING，行锁保证并发加菜不会重号）
 
-            for line in lines:
-                self.env['ab_pos.order.change.line'].sudo().create({
-                    'change_id': change.id,
-                    'product_id': line.product_id.id,
-                    'qty': line.qty,
-                    'note': line.note or '',
-                    'state': 'cooking',
-                })
+        安装了 KDS 时同时参考已有变更的最大序号，POS 前端创建的变更不会与之重号。
+        """
+        if 'ab_pos.order.change' in self.env:
+            Change = self.env['ab_pos.order.change']
+            Change.flush_model(['order_id', 'sequence_number'])
+            self.env.cr.execute(f"""
+                UPDATE pos_order
+                SET qr_change_seq = GREATEST(
+                    COALESCE(qr_change_seq, 0),
+                    (SELECT COALESCE(MAX(sequence_number), 0) FROM {Change._table} WHERE order_id = %s)
+                ) + 1
+                WHERE id = %s
+                RETURNING qr_change_seq
+            """, (pos_order.id, pos_order.id))
+        else:
+            self.env.cr.execute("""
+                UPDATE pos_order
+                SET qr_change_seq = COALESCE(qr_change_seq, 0) + 1
+                WHERE id = %s
+                RETURNING qr_change_seq
+            """, (pos_order.id,))
+        sequence = self.env.cr.fetchone()[0]
+        pos_order.invalidate_recordset(['qr_change_seq'])
+        return sequence
+
+    def _create_kds_change_for_batch(self, pos_order, lines, next_sequence):
+        """
+        为指定的订单行创建 KDS 变更记录（next_sequence 由 _next_change_sequence 分配）
+        失败时抛出异常，由厨房分发队列重试
+        """
+        if 'ab_pos.order.change' not in self.env:
+            return
 
-            pos_order.sudo().note_order_change()
-            _logger.info(f"Created KDS change #{next_sequence} for batch with {len(lines)} lines")
+        change = self.env['ab_pos.order.change'].sudo().create({
+            'order_id': pos_order.id,
+            'sequence_number': next_sequence,
+            'created_at': fields.Datetime.now(),
+        })
 
-        except Exception as e:
-            _logger.error(f"Failed to create KDS change for batch: {e}")
+        for line in lines:
+            self.env['ab_pos.order.change.line'].sudo().create({
+                'change_id': change.id,
+                'product_id': line.product_id.id,
+                'qty': line.qty,
+                'note': line.note or '',
+                'state': 'cooking',
+            })
+
+        pos_order.sudo().note_order_change()
+        _logger.info(f"Created KDS change #{next_sequence} for batch with {len(lines)} lines")
 
-    def _create_kds_change(self, pos_order):
+    def _create_kds_change(self, pos_order, next_sequence):
         """
-        创建 KDS 变更记录并发送通知
+        创建 KDS 变更记录并发送通知（next_sequence 由 _next_change_sequence 分配）
         这个方法模拟 POS 前端的 sendOrderInPreparationUpdateLastChange 行为
+        失败时抛出异常，由厨房分发队列重试
         """
         self.ensure_one()
-        try:
-            # 检查 ab_pos.order.change 模型是否存在
-            if 'ab_pos.order.change' not in self.env:
-                _logger.warning("KDS module (ab_pos.order.change) not installed, skipping KDS notification")
-                return
-
-            # 计算下一个序列号
-            existing_changes = self.env['ab_pos.order.change'].sudo().search([
-                ('order_id', '=', pos_order.id)
-            ])
-            next_sequence = len(existing_changes) + 1
-
-            # 创建变更记录
-            change = self.env['ab_pos.order.change'].sudo().create({
-                'order_id': pos_order.id,
-                'sequence_number': next_sequence,
-                'created_at': fields.Datetime.now(),
-            })
+        # 检查 ab_pos.order.change 模型是否存在
+        if 'ab_pos.order.change' not in self.env:
+            _logger.warning("KDS module (ab_pos.order.change) not installed, skipping KDS notification")
+            return
 
-            # 为每个订单行创建变更行
-            for line in self.line_ids:
-                self.env['ab_pos.order.change.line'].sudo().create({
-                    'change_id': change.id,
-                    'product_id': line.product_id.id,
-                    'qty': line.qty,
-                    'note': line.note or '',
-                    'state': 'cooking',
-                })
+        # 创建变更记录
+        change = self.env['ab_pos.order.change'].sudo().create({
+            'order_id': pos_order.id,
+            'sequence_number': next_sequence,
+            'created_at': fields.Datetime.now(),
+        })
 
-            # 发送 KDS 通知（通过 pos.order 的 note_order_change 方法）
-            pos_order.sudo().note_order_change()
+        # 为每个订单行创建变更行
+        for line in self.line_ids:
+            self.env['ab_pos.order.change.line'].sudo().create({
+                'change_id': change.id,
+                'product_id': line.product_id.id,
+                'qty': line.qty,
+                'note': line.note or '',
+                'state': 'cooking',
+            })
 
-            _logger.info(f"Created KDS change #{next_sequence} for POS order {pos_order.name} with {len(self.line_ids)} lines")
+        # 发送 KDS 通知（通过 pos.order 的 note_order_change 方法）
+        pos_order.sudo().note_order_change()
 
-        except Exception as e:
-            _logger.error(f"Failed to create KDS change for order {self.name}: {e}")
+        _logger.info(f"Created KDS change #{next_sequence} for POS order {pos_order.name} with {len(self.line_ids)} lines")
 
-    def _filter_lines_by_categories(self, printer_categ_ids, lines=None):
+    def _route_lines_to_printers(self, pos_config, lines=None):
         """
-        按产品分类过滤订单行
+        按产品分类把订单行分配到厨房打印机
 
         复制 POS 的 filterChangeByCategories 逻辑：
-        - 如果打印机没有配置分类（printer_categ_ids 为空），则返回所有行
-        - 否则，只返回产品的 pos_categ_ids 与打印机分类匹配的行
-        - 支持父分类匹配（如果产品分类是打印机分类的子分类，也匹配）
+        - 打印机没有配置分类时，打印所有行
+        - 否则只打印产品 pos_categ_ids（或其父分类）与打印机分类匹配的行
+        - 产品没有 POS 分类时，不分配给有分类的打印机
+
+        路由表由 pos.config._get_qr_printer_routing 缓存，每行只需一次字典查找。
 
         Args:
-            printer_categ_ids: set of pos.category IDs that the printer handles
-            lines: (optional) recordset of qr.order.line to filter, defaults to self.line_ids
+            pos_config: pos.config 记录
+            lines: (optional) 要分配的 qr.order.line，默认 self.line_ids
 
         Returns:
-            recordset of qr.order.line that match the printer's categories
+            list of (ylhc.printer, qr.order.line recordset)，顺序与 printer_ids 一致，
+            只包含有匹配行的云打印机
         """
         self.ensure_one()
+        lines_to_route = lines if lines is not None else self.line_ids
+        routing = pos_config._get_qr_printer_routing(pos_config.id)
+        categ_printers = routing['categ_printers']
 
-        # 使用提供的 lines 或默认 self.line_ids
-        lines_to_filter = lines if lines is not None else self.line_ids
-
-        # 如果打印机没有配置分类，返回所有行
-        if not printer_categ_ids:
-            return lines_to_filter
-
-        # 获取所有相关分类的父分类（用于子分类匹配）
-        def get_parent_categ_ids(categ):
-            """递归获取分类及其所有父分类的 ID"""
-            ids = set()
-            while categ:
-                ids.add(categ.id)
-                categ = categ.parent_id
-            return ids
-
-        matched_lines = self.env['qr.order.line']
-        for line in lines_to_filter:
+        # pos_printer_id -> 匹配的行 ID
+        printer_line_ids = {printer_id: [] for printer_id, _ylhc_id, _has_categ in routing['printers']}
+        for line in lines_to_route:
             product = line.product_id
             if not product:
                 continue
-
-            # 获取产品的 POS 分类
-            product_categs = product.pos_categ_ids
-            if not product_categs:
-                # 产品没有 POS 分类，跳过（不分配给任何打印机）
+            matched = set()
+            for categ_id in product.pos_categ_ids.ids:
+                matched |= categ_printers.get(categ_id, frozenset())
+            for printer_id, _ylhc_id, has_categ in routing['printers']:
+                if not has_categ or printer_id in matched:
+                    printer_line_ids[printer_id].append(line.id)
+
+        Line = self.env['qr.order.line']
+        YlhcPrinter = self.env['ylhc.printer'].sudo()
+        routes = []
+        for printer_id, ylhc_printer_id, _has_categ in routing['printers']:
+            line_ids = printer_line_ids[printer_id]
+            if not line_ids:
+                _logger.debug(f"No matching lines for pos.printer {printer_id}")
                 continue
-
-            # 检查是否有任何分类（包括父分类）与打印机分类匹配
-            for categ in product_categs:
-                categ_and_parents = get_parent_categ_ids(categ)
-                if categ_and_parents & printer_categ_ids:
-                    # 找到匹配，添加到结果中
-                    matched_lines |= line
-                    break
-
-        return matched_lines
+            if ylhc_printer_id:
+                routes.append((YlhcPrinter.browse(ylhc_printer_id), Line.browse(line_ids)))
+        return routes
 
     def _send_print_notification(self, pos_order):
         """
@@ -676,57 +651,33 @@ class QrOrder(models.Model):
         2. 按打印机的 product_categories_ids 过滤订单行
         3. 为每个打印机生成对应的打印任务（只包含该打印机负责的产品）
         4. 使用与 POS OrderChangeReceipt 相同的数据格式
+
+        创建打印任务失败时回退到通知 POS 前端；回退也失败时抛出异常，由厨房分发队列重试
         """
         self.ensure_one()
-        try:
-            pos_config = pos_order.config_id
-            if not pos_config:
-                _logger.warning(f"No POS config for order {pos_order.name}")
-                return
+        pos_config = pos_order.config_id
+        if not pos_config:
+            _logger.warning(f"No POS config for order {pos_order.name}")
+            return
 
-            # 查找 POS 配置的厨房打印机
-            printers_sent = 0
-            for printer in pos_config.printer_ids:
-                # 获取该打印机的产品分类
-                printer_categ_ids = set(printer.product_categories_ids.ids) if printer.product_categories_ids else set()
-
-                # 按分类过滤订单行
-                filtered_lines = self._filter_lines_by_categories(printer_categ_ids)
-
-                if not filtered_lines:
-                    _logger.debug(f"No matching lines for printer {printer.name} (categories: {printer_categ_ids})")
-                    continue
-
-                # 检查是否是云打印机且有关联的 YLHC 打印机
-                ylhc_printer = None
-                if hasattr(printer, 'ylhc_printer_id') and printer.ylhc_printer_id:
-                    ylhc_printer = printer.ylhc_printer_id
-                elif hasattr(printer, 'printer_type') and printer.printer_type == 'cloud_printer':
-                    # 尝试通过名称匹配 ylhc.printer
-                    ylhc_printer = self.env['ylhc.printer'].sudo().search([
-                        ('name', '=', printer.name),
-                        ('active', '=', True),
-                    ], limit=1)
-
-                if ylhc_printer:
+        try:
+            with self.env.cr.savepoint():
+                # 按分类把订单行分配到 POS 配置的厨房打印机
+                printers_sent = 0
+                for ylhc_printer, filtered_lines in self._route_lines_to_printers(pos_config):
                     # 使用过滤后的行创建打印任务
                     self._create_kitchen_print_job(ylhc_printer, pos_order, is_batch=False, qr_lines=filtered_lines)
                     printers_sent += 1
                     _logger.info(f"Created print job for QR order {self.name} on printer {ylhc_printer.name} with {len(filtered_lines)} lines")
-
-            if printers_sent == 0:
-                # 没有找到 YLHC 打印机，回退到旧方式（通知 POS 前端）
-                self._send_print_notification_to_pos(pos_order)
-            else:
-                _logger.info(f"Sent print jobs to {printers_sent} printer(s) for QR order {self.name}")
-
         except Exception as e:
-            _logger.error(f"Failed to send print notification for order {self.name}: {e}")
-            # 出错时回退到旧方式
-            try:
-                self._send_print_notification_legacy(pos_order)
-            except Exception as e2:
-                _logger.error(f"Legacy print notification also failed: {e2}")
+            _logger.warning(f"Failed to create print jobs for order {self.name}, falling back to POS notification: {e}")
+            printers_sent = 0
+
+        if printers_sent == 0:
+            # 没有找到 YLHC 打印机或创建失败，回退到旧方式（通知 POS 前端）
+            self._send_print_notification_legacy(pos_order)
+        else:
+            _logger.info(f"Sent print jobs to {printers_sent} printer(s) for QR order {self.name}")
 
     def _send_print_notification_legacy(self, pos_order):
         """
@@ -775,43 +726,45 @@ class QrOrder(models.Model):
             pos_order: pos.order 记录
             is_batch: 是否为加菜批次打印
             qr_lines: 加菜时指定的订单行（为 None 时打印所有行）
-        """
-        try:
-            table_name = self.table_id.name if self.table_id else ''
-            lines_to_print = qr_lines if qr_lines else self.line_ids
-
-            # 生成 ESC/POS 命令
-            escpos_commands = self._generate_escpos_commands(pos_order, lines_to_print, is_batch)
-            escpos_base64 = base64.b64encode(escpos_commands).decode('utf-8')
-
-            # 生成小票元数据
-            receipt_data = self._generate_receipt_data(pos_order, lines_to_print, is_batch)
-            # 添加 ESC/POS 命令到元数据
-            receipt_data['escpos_commands'] = escpos_base64
-
-            # 创建打印任务
-            # 使用 pos_receipt_print 类型，因为 YLHC Service 只处理这种类型
-            job_vals = {
-                'name': f'QR厨房单 - {table_name} - {self.name}' if not is_batch else f'QR加菜单 - {table_name} - {self.name}',
-                'printer_id': ylhc_printer.id,
-                'type': 'pos_receipt_print',  # 使用 POS 打印类型，YLHC Service 可以识别
-                'is_test': False,
-                'copies': 1,
-                'priority': 10,  # 高优先级
-                'metadata': json.dumps(receipt_data, ensure_ascii=False),
-            }
-
-            job = self.env['ylhc.print.job'].sudo().create(job_vals)
-            job.action_process()
 
-            _logger.info(f"Created kitchen print job {job.job_id} for QR order {self.name} on printer {ylhc_printer.name}")
-            return job
+        生成小票或创建任务失败时抛出异常
+        """
+        table_name = self.table_id.name if self.table_id else ''
+        lines_to_print = qr_lines if qr_lines else self.line_ids
+
+        # 生成 ESC/POS 命令
+        escpos_commands = self._generate_escpos_commands(pos_order, lines_to_print, is_batch, ylhc_printer=ylhc_printer)
+        escpos_base64 = base64.b64encode(escpos_commands).decode('utf-8')
+
+        # 生成小票元数据
+        receipt_data = self._generate_receipt_data(pos_order, lines_to_print, is_batch)
+        # 添加 ESC/POS 命令到元数据
+        receipt_data['escpos_commands'] = escpos_base64
+
+        # 创建打印任务
+        # 使用 pos_receipt_print 类型，因为 YLHC Service 只处理这种类型
+        job_vals = {
+            'name': f'QR厨房单 - {table_name} - {self.name}' if not is_batch else f'QR加菜单 - {table_name} - {self.name}',
+            'printer_id': ylhc_printer.id,
+            'type': 'pos_receipt_print',  # 使用 POS 打印类型，YLHC Service 可以识别
+            'is_test': False,
+            'copies': 1,
+            'priority': 10,  # 高优先级
+            'metadata': json.dumps(receipt_data, ensure_ascii=False),
+        }
 
+        job = self.env['ylhc.print.job'].sudo().create(job_vals)
+        try:
+            with self.env.cr.savepoint():
+                job.action_process()
         except Exception as e:
-            _logger.error(f"Failed to create kitchen print job: {e}")
-            return None
+            # 任务记录已创建，可在打印管理器中重发；这里抛出会让分发重试并重复出单
+            _logger.warning(f"Print job {job.job_id} for QR order {self.name} created but not processed yet: {e}")
 
-    def _generate_escpos_commands(self, pos_order, lines, is_batch=False):
+        _logger.info(f"Created kitchen print job {job.job_id} for QR order {self.name} on printer {ylhc_printer.name}")
+        return job
+
+    def _generate_escpos_commands(self, pos_order, lines, is_batch=False, ylhc_printer=None):
         """
         生成 ESC/POS 打印命令 - 统一 KDS 模板格式
 
@@ -825,191 +778,94 @@ class QrOrder(models.Model):
         - ORDERED 分组 (新增的商品)
         - 每个商品: 数量 + 名称，备注单独一行
 
+        固定控制序列由 services.escpos_renderer 按 (码页, 纸宽) 预编译缓存。
+
+        Args:
+            ylhc_printer: (optional) 目标打印机，用于确定纸宽
+
         Returns:
             bytes: ESC/POS 命令字节序列
         """
+        ticket = self._prepare_kitchen_ticket(pos_order, lines)
+        return self._get_kitchen_ticket_template(ticket, ylhc_printer).render(ticket)
+
+    def _get_kitchen_ticket_template(self, ticket, ylhc_printer=None):
+        """
+        选择厨房单模板
+
+        码页由 qr_ordering.escpos_codepage 配置（gbk / shift_jis / auto，默认 gbk）；
+        auto 时按小票内容选择能完整编码的码页。
+        """
+        codepage = self.env['ir.config_parameter'].sudo().get_param(
+            'qr_ordering.escpos_codepage', escpos_layout.DEFAULT_CODEPAGE
+        )
+        if codepage == 'auto':
+            texts = [ticket.table_name] + list(ticket.customer_lines) + list(ticket.address_lines)
+            for line in ticket.canceled + ticket.ordered:
+                texts.extend([line.name, line.note] + list(line.types))
+            codepage = escpos_layout.select_codepage(texts)
+
+        paper_width = None
+        if ylhc_printer and hasattr(ylhc_printer, 'paper_width'):
+            paper_width = ylhc_printer.paper_width
+        return get_ticket_template(codepage, escpos_layout.columns_for_paper(paper_width))
+
+    def _prepare_kitchen_ticket(self, pos_order, lines):
+        """读取厨房单需要的数据（渲染时不再访问数据库）"""
         from datetime import timezone, timedelta as td
 
-        # ESC/POS 命令常量
-        ESC = b'\x1b'
-        GS = b'\x1d'
-
-        # 初始化命令
-        INIT = ESC + b'@'                    # ESC @ - 初始化打印机
-        CN_MODE = ESC + b'R\x0f'             # 选择字符集（中文）
-        ALIGN_CENTER = ESC + b'a\x01'        # 居中对齐
-        ALIGN_LEFT = ESC + b'a\x00'          # 左对齐
-        BOLD_ON = ESC + b'E\x01'             # 粗体开
-        BOLD_OFF = ESC + b'E\x00'            # 粗体关
-        DOUBLE_HEIGHT = GS + b'!\x10'        # 双倍高度
-        DOUBLE_WIDTH = GS + b'!\x20'         # 双倍宽度
-        DOUBLE_SIZE = GS + b'!\x30'          # 双倍尺寸（宽+高）
-        NORMAL_SIZE = GS + b'!\x00'          # 正常尺寸
-        FEED_LINES = ESC + b'd\x03'          # 走纸 3 行
-        PARTIAL_CUT = GS + b'V\x01'          # 半切
-
-        # 构建打印内容
-        commands = bytearray()
-        commands.extend(INIT)
-        commands.extend(CN_MODE)
-
-        # 注意：不添加额外的页边距，打印机初始化后直接开始打印
-
-        # === 标题：订单变更名称（缩小字体）===
-        commands.extend(ALIGN_CENTER)
-        commands.extend(NORMAL_SIZE)  # 使用正常尺寸，不要双倍
-        commands.extend(BOLD_ON)
         # 计算变更序号（类似 KDS 的 change.name）
         change_seq = self._get_change_sequence(pos_order)
-        change_name = f'Order-{change_seq:03d}'
-        commands.extend(change_name.encode('gbk', errors='replace'))
-        commands.extend(b'\n')
-
-        # === 订单号 (UID) ===
-        order_uid = pos_order.pos_reference or pos_order.name or self.name
-        commands.extend(order_uid.encode('gbk', errors='replace'))
-        commands.extend(b'\n')
-        commands.extend(BOLD_OFF)
-
-        # === 桌号 + 时间 (同一行，两端对齐，桌号放大) ===
-        commands.extend(ALIGN_LEFT)
-        commands.extend(DOUBLE_SIZE)  # 桌号使用双倍尺寸
-        commands.extend(BOLD_ON)
-        table_name = self.table_id.name if self.table_id else ''
         # 时间转换为日本时间 (JST = UTC+9)
         jst = timezone(td(hours=9))
-        order_time = datetime.now(jst).strftime('%H:%M')
-        # 16字符宽度（双倍宽度下有效宽度减半）
-        table_time_line = self._format_two_columns(table_name, order_time, 16)
-        commands.extend(table_time_line.encode('gbk', errors='replace'))
-        commands.extend(b'\n')
-        commands.extend(NORMAL_SIZE)
-        commands.extend(BOLD_OFF)
-
-        # === 客户信息 (如有) ===
+
+        customer_lines = []
+        address_lines = []
         partner = pos_order.partner_id if pos_order.partner_id else None
         if partner:
-            commands.extend(b'\n')
-            commands.extend(ALIGN_CENTER)
-            commands.extend(BOLD_ON)
-            commands.extend('CUSTOMER DETAILS'.encode('gbk', errors='replace'))
-            commands.extend(b'\n')
-            commands.extend(BOLD_OFF)
-            commands.extend(ALIGN_LEFT)
-
-            if partner.name:
-                commands.extend(f'{partner.name}\n'.encode('gbk', errors='replace'))
-            if partner.phone:
-                commands.extend(f'{partner.phone}\n'.encode('gbk', errors='replace'))
-            if partner.email:
-                commands.extend(f'{partner.email}\n'.encode('gbk', errors='replace'))
-
-        # === 配送地址 (如有，且为配送订单) ===
-        service_type = getattr(pos_order, 'ab_service_type', None)
-        if partner and service_type == 'delivery':
-            has_address = partner.street or partner.city or partner.zip
-            if has_address:
-                commands.extend(b'\n')
-                commands.extend(ALIGN_CENTER)
-                commands.extend(BOLD_ON)
-                commands.extend('DELIVERY ADDRESS'.encode('gbk', errors='replace'))
-                commands.extend(b'\n')
-                commands.extend(BOLD_OFF)
-                commands.extend(ALIGN_LEFT)
-
-                if partner.street:
-                    commands.extend(f'{partner.street}\n'.encode('gbk', errors='replace'))
-                if partner.city:
-                    commands.extend(f'{partner.city}\n'.encode('gbk', errors='replace'))
-                if partner.zip:
-                    commands.extend(f'{partner.zip}\n'.encode('gbk', errors='replace'))
-
-        # === 分组：CANCELED 和 ORDERED ===
+            customer_lines = [v for v in (partner.name, partner.phone, partner.email) if v]
+            # 配送地址 (如有，且为配送订单)
+            service_type = getattr(pos_order, 'ab_service_type', None)
+            if service_type == 'delivery':
+                address_lines = [v for v in (partner.street, partner.city, partner.zip) if v]
+
         # 对于 QR 订单，通常只有 ORDERED（新增商品）
         # 但保留 CANCELED 分组以支持未来的取消功能
-        canceled_lines = [l for l in lines if l.qty <= 0 or l.state == 'cancelled']
-        ordered_lines = [l for l in lines if l.qty > 0 and l.state != 'cancelled']
-
-        # CANCELED 分组
-        if canceled_lines:
-            commands.extend(b'\n')
-            commands.extend(ALIGN_CENTER)
-            commands.extend(BOLD_ON)
-            commands.extend('CANCELED'.encode('gbk', errors='replace'))
-            commands.extend(b'\n')
-            commands.extend(BOLD_OFF)
-            commands.extend(ALIGN_LEFT)
-
-            for line in canceled_lines:
-                self._append_order_line(commands, line, is_canceled=True)
-
-        # ORDERED 分组
-        if ordered_lines:
-            commands.extend(b'\n')
-            commands.extend(ALIGN_CENTER)
-            commands.extend(BOLD_ON)
-            commands.extend('ORDERED'.encode('gbk', errors='replace'))
-            commands.extend(b'\n')
-            commands.extend(BOLD_OFF)
-            commands.extend(ALIGN_LEFT)
-
-            for line in ordered_lines:
-                self._append_order_line(commands, line, is_canceled=False)
-
-        # 走纸和切纸
-        commands.extend(FEED_LINES)
-        commands.extend(PARTIAL_CUT)
-
-        return bytes(commands)
-
-    def _get_change_sequence(self, pos_order):
-        """获取订单变更序号"""
-        if 'ab_pos.order.change' in self.env:
-            changes = self.env['ab_pos.order.change'].sudo().search([
-                ('order_id', '=', pos_order.id)
-            ])
-            return len(changes) + 1
-        return 1
-
-    def _format_two_columns(self, left, right, width=32):
-        """格式化两列文本（左对齐 + 右对齐）"""
-        left = str(left) if left else ''
-        right = str(right) if right else ''
-        # 计算中文字符宽度（每个中文字符占2个位置）
-        left_width = sum(2 if ord(c) > 127 else 1 for c in left)
-        right_width = sum(2 if ord(c) > 127 else 1 for c in right)
-        spaces = max(1, width - left_width - right_width)
-        return left + ' ' * spaces + right
-
-    def _append_order_line(self, commands, line, is_canceled=False):
-        """添加订单行到打印命令"""
-        # ESC/POS 命令
-        GS = b'\x1d'
-        DOUBLE_HEIGHT = GS + b'!\x10'        # 双倍高度
-        NORMAL_SIZE = GS + b'!\x00'          # 正常尺寸
-
+        canceled = []
+        ordered = []
+        for line in lines:
+            if line.qty <= 0 or line.state == 'cancelled':
+                canceled.append(self._prepare_ticket_line(line))
+            else:
+                ordered.append(self._prepare_ticket_line(line))
+
+        return KitchenTicket(
+            change_name=f'Order-{change_seq:03d}',
+            order_uid=pos_order.pos_reference or pos_order.name or self.name,
+            table_name=self.table_id.name if self.table_id else '',
+            order_time=datetime.now(jst).strftime('%H:%M'),
+            customer_lines=customer_lines,
+            address_lines=address_lines,
+            canceled=canceled,
+            ordered=ordered,
+        )
+
+    def _prepare_ticket_line(self, line):
         product = line.product_id
-        product_name = product.name or ''
         qty = abs(int(line.qty) if line.qty == int(line.qty) else line.qty)
 
-        # 格式: 数量 + 商品名称（放大显示）
-        commands.extend(DOUBLE_HEIGHT)  # 商品名称使用双倍高度
-        line_text = f'{qty}   {product_name}\n'
-        commands.extend(line_text.encode('gbk', errors='replace'))
-        commands.extend(NORMAL_SIZE)  # 恢复正常尺寸
-
         # 商品属性 (TYPE) - 如果有
+        attr_names = []
         if hasattr(product, 'attribute_line_ids') and product.attribute_line_ids:
-            attr_names = []
             for attr_line in product.attribute_line_ids:
                 if attr_line.value_ids:
                     attr_names.extend([v.name for v in attr_line.value_ids])
-            if attr_names:
-                commands.extend(f'TYPE: {", ".join(attr_names)}\n'.encode('gbk', errors='replace'))
 
-        # 备注 (NOTE) - 单独一行
-        if line.note:
-            commands.extend(f'NOTE: {line.note}\n'.encode('gbk', errors='replace'))
+        return TicketLine(qty=qty, name=product.name or '', types=attr_names, note=line.note or '')
+
+    def _get_change_sequence(self, pos_order):
+        """获取订单当前的变更序号（分发任务已先调用 _next_change_sequence 分配）"""
+        return pos_order.qr_change_seq or 1
 
     def _generate_receipt_data(self, pos_order, lines, is_batch=False):
         """
@@ -1139,55 +995,33 @@ class QrOrder(models.Model):
 
         通过 ylhc_print_manager 发送，与 _send_print_notification 类似
         但标记为 is_batch=True，小票标题显示"加菜单"
+
+        创建打印任务失败时回退到通知 POS 前端；回退也失败时抛出异常，由厨房分发队列重试
         """
         self.ensure_one()
-        try:
-            pos_config = pos_order.config_id
-            if not pos_config:
-                _logger.warning(f"No POS config for order {pos_order.name}")
-                return
+        pos_config = pos_order.config_id
+        if not pos_config:
+            _logger.warning(f"No POS config for order {pos_order.name}")
+            return
 
-            # 查找 POS 配置的厨房打印机
-            printers_sent = 0
-            for printer in pos_config.printer_ids:
-                # 获取该打印机的产品分类
-                printer_categ_ids = set(printer.product_categories_ids.ids) if printer.product_categories_ids else set()
-
-                # 按分类过滤订单行（只过滤传入的 qr_lines）
-                filtered_lines = self._filter_lines_by_categories(printer_categ_ids, lines=qr_lines)
-
-                if not filtered_lines:
-                    _logger.debug(f"No matching lines for printer {printer.name} (categories: {printer_categ_ids})")
-                    continue
-
-                # 检查是否是云打印机且有关联的 YLHC 打印机
-                ylhc_printer = None
-                if hasattr(printer, 'ylhc_printer_id') and printer.ylhc_printer_id:
-                    ylhc_printer = printer.ylhc_printer_id
-                elif hasattr(printer, 'printer_type') and printer.printer_type == 'cloud_printer':
-                    ylhc_printer = self.env['ylhc.printer'].sudo().search([
-                        ('name', '=', printer.name),
-                        ('active', '=', True),
-                    ], limit=1)
-
-                if ylhc_printer:
+        try:
+            with self.env.cr.savepoint():
+                # 按分类把加菜行（只分配传入的 qr_lines）分配到厨房打印机
+                printers_sent = 0
+                for ylhc_printer, filtered_lines in self._route_lines_to_printers(pos_config, lines=qr_lines):
                     # 使用过滤后的行创建打印任务
                     self._create_kitchen_print_job(ylhc_printer, pos_order, is_batch=True, qr_lines=filtered_lines)
                     printers_sent += 1
                     _logger.info(f"Created batch print job for QR order {self.name} on printer {ylhc_printer.name} with {len(filtered_lines)} lines")
-
-            if printers_sent == 0:
-                # 回退到旧方式
-                self._send_print_notification_for_batch_legacy(pos_order, qr_lines)
-            else:
-                _logger.info(f"Sent batch print jobs to {printers_sent} printer(s) for QR order {self.name}")
-
         except Exception as e:
-            _logger.error(f"Failed to send batch print notification: {e}")
-            try:
-                self._send_print_notification_for_batch_legacy(pos_order, qr_lines)
-            except Exception as e2:
-                _logger.error(f"Legacy batch print notification also failed: {e2}")
+            _logger.warning(f"Failed to create batch print jobs for order {self.name}, falling back to POS notification: {e}")
+            printers_sent = 0
+
+        if printers_sent == 0:
+            # 回退到旧方式
+            self._send_print_notification_for_batch_legacy(pos_order, qr_lines)
+        else:
+            _logger.info(f"Sent batch print jobs to {printers_sent} printer(s) for QR order {self.name}")
 
     def _send_print_notification_for_batch_legacy(self, pos_order, qr_lines):
         """
@@ -2,12 +2,23 @@
 
 import secrets
 from datetime import datetime, timedelta
+from functools import partial
+from psycopg2.errors import SerializationFailure
+
 from odoo import models, fields, api
 from odoo.exceptions import UserError, ValidationError
 
+from ..services.session_cache import session_cache
+
 import logging
 _logger = logging.getLogger(__name__)
 
+# 过期会话清理每批关闭的数量（每批单独提交）
+CLEANUP_BATCH_SIZE = 1000
+
+# 下单 / 加菜 advisory lock 的命名空间（pg_advisory_xact_lock(命名空间, 餐桌ID)）
+ORDER_LOCK_NAMESPACE = 0x5152  # 'QR'
+
 
 class QrSession(models.Model):
     """点餐会话模型 - 用于防恶意点餐和状态管理"""
@@ -100,9 +111,12 @@ class QrSession(models.Model):
         return f"QRS-{fields.Datetime.now().strftime('%Y%m%d%H%M%S')}-{secrets.token_hex(4).upper()}"
 
     def _compute_order_count(self):
-        """计算订单数量"""
+        """计算订单数量（整个记录集一次分组查询）"""
+        counts = dict(self.env['qr.order']._read_group(
+            [('session_id', 'in', self.ids)], groupby=['session_id'], aggregates=['__count'],
+        ))
         for record in self:
-            record.order_count = len(record.order_ids)
+            record.order_count = counts.get(record, 0)
 
     @api.depends('order_ids.total_amount')
     def _compute_total_amount(self):
@@ -110,23 +124,52 @@ class QrSession(models.Model):
         for record in self:
             record.total_amount = sum(record.order_ids.mapped('total_amount'))
 
+    def write(self, vals):
+        cache_fields = 'state' in vals or 'expire_time' in vals
+        if cache_fields:
+            session_cache.invalidate(self.env.cr, self.mapped('table_id.qr_token'))
+        result = super().write(vals)
+        if cache_fields:
+            # 状态变化（如下单后变为 ordering）后重新缓存仍为当前会话的记录，
+            # 否则本进程要等到下一次未命中才会重新填充
+            for session in self:
+                table = session.table_id
+                if session.state != 'closed' and table.current_session_id == session:
+                    self._cache_session_after_commit(table, session)
+        return result
+
+    def unlink(self):
+        session_cache.invalidate(self.env.cr, self.mapped('table_id.qr_token'))
+        return super().unlink()
+
     def action_close(self):
-        """关闭会话"""
-        for record in self:
-            record.state = 'closed'
-            record.end_time = fields.Datetime.now()
-            
-            # 清除餐桌的当前会话引用
-            if record.table_id.current_session_id == record:
-                record.table_id.current_session_id = False
-                # 如果没有未完成订单，将餐桌状态设为可用
-                if not record.order_ids.filtered(lambda o: o.state not in ['cancelled', 'paid']):
-                    record.table_id.state = 'available'
-                    
-                    # 注意：Odoo 18 中 restaurant.table 没有 state 字段
-                    # POS 通过检查是否有 draft 状态的 pos.order 来判断餐桌是否被占用
-                    # 当 POS 订单支付后，POS 端会自动显示餐桌空闲
-                    _logger.info(f"QR session closed for table {record.table_id.name}")
+        """关闭会话（整个记录集分组写入）"""
+        if not self:
+            return True
+        self.write({
+            'state': 'closed',
+            'end_time': fields.Datetime.now(),
+        })
+
+        # 清除餐桌的当前会话引用
+        current = self.filtered(lambda s: s.table_id.current_session_id == s)
+        if not current:
+            return True
+        current.mapped('table_id').write({'current_session_id': False})
+
+        # 如果没有未完成订单，将餐桌状态设为可用
+        # 注意：Odoo 18 中 restaurant.table 没有 state 字段
+        # POS 通过检查是否有 draft 状态的 pos.order 来判断餐桌是否被占用
+        # 当 POS 订单支付后，POS 端会自动显示餐桌空闲
+        busy_groups = self.env['qr.order'].sudo()._read_group([
+            ('session_id', 'in', current.ids),
+            ('state', 'not in', ['cancelled', 'paid']),
+        ], groupby=['session_id'])
+        busy_session_ids = {session.id for session, in busy_groups}
+        free_tables = current.filtered(lambda s: s.id not in busy_session_ids).mapped('table_id')
+        if free_tables:
+            free_tables.write({'state': 'available'})
+        _logger.info(f"QR session closed for tables {', '.join(current.mapped('table_id.name'))}")
         return True
 
     def action_extend(self, hours=2):
@@ -135,6 +178,27 @@ class QrSession(models.Model):
             record.expire_time = fields.Datetime.now() + timedelta(hours=hours)
         return True
 
+    def _lock_for_ordering(self):
+        """
+        下单 / 加菜临界区的事务级 advisory lock（按餐桌）
+
+        同一餐桌的多位顾客同时下单时，查找 / 创建 POS 订单必须串行执行，
+        否则会各自创建 POS 订单。锁在事务结束时自动释放。
+
+        没有竞争时只有一次 pg_try_advisory_xact_lock。需要等待时，当前事务的快照
+        早于前一个下单的提交（Odoo 使用 REPEATABLE READ），继续执行会读到旧的购物车状态。
+        所以等到前一个下单完成后抛出 SerializationFailure，由 Odoo 用新的事务重试请求，
+        此时还没有写入任何数据，重试的代价很小。
+        """
+        self.ensure_one()
+        params = (ORDER_LOCK_NAMESPACE, self.table_id.id)
+        self.env.cr.execute("SELECT pg_try_advisory_xact_lock(%s, %s)", params)
+        if self.env.cr.fetchone()[0]:
+            return
+        _logger.info(f"Concurrent order submit on table {self.table_id.name}, waiting")
+        self.env.cr.execute("SELECT pg_advisory_xact_lock(%s, %s)", params)
+        raise SerializationFailure(f"Concurrent order submit on table {self.table_id.id}")
+
     @api.model
     def validate_access(self, table_token, access_token, client_ip=None):
         """
@@ -145,7 +209,14 @@ class QrSession(models.Model):
         - 同一个桌台可以有多人同时扫码点餐
         - 所有人共享同一个会话（current_session_id）
         - access_token 用于区分不同客户端，但不阻止新客户加入
+
+        常见情况下命中进程内会话缓存（services/session_cache.py），不查询数据库。
+        缓存以 table_token 为键：同桌所有客户端共享同一会话，access_token 不影响结果。
         """
+        cached = session_cache.get(self.env.cr.dbname, table_token, fields.Datetime.now())
+        if cached:
+            return self.browse(cached.session_id), None, None
+
         # 查找餐桌
         table = self.env['qr.table'].sudo().search([
             ('qr_token', '=', table_token),
@@ -169,16 +240,33 @@ class QrSession(models.Model):
             if access_token:
                 if current_session.access_token == access_token:
                     # token 匹配，返回现有会话
+                    self._cache_session_after_commit(table, current_session)
                     return current_session, None, None
 
             # 多人点餐：允许新客户加入现有会话
             # 直接返回当前会话，让所有人共享
             _logger.info(f"New client joined existing session {current_session.name} for table {table.name}")
+            self._cache_session_after_commit(table, current_session)
             return current_session, None, None
 
         # 没有活跃会话，创建新会话
         return self._create_new_session(table, client_ip)
 
+    def _cache_session_after_commit(self, table, session):
+        """事务提交后写入会话缓存，避免缓存回滚掉的会话"""
+        dbname = self.env.cr.dbname
+        self.env.cr.postcommit.add(partial(
+            session_cache.put,
+            dbname,
+            table.qr_token,
+            session_cache.generation(dbname, table.qr_token),
+            table.id,
+            session.id,
+            session.access_token,
+            session.state,
+            session.expire_time,
+        ))
+
     def _create_new_session(self, table, client_ip=None):
         """创建新的点餐会话"""
         # 关闭餐桌的旧会话
@@ -204,18 +292,82 @@ class QrSession(models.Model):
         # POS 通过检查是否有 draft 状态的 pos.order 来判断餐桌是否被占用
         # QR 订单提交时会自动创建关联到餐桌的 POS 订单，从而在 POS 端显示餐桌被占用
         _logger.info(f"Created QR session {session.name} for table {table.name}")
-        
+
+        self._cache_session_after_commit(table, session)
         return session, None, None
 
     @api.model
     def cleanup_expired_sessions(self):
-        """定时任务：清理过期会话"""
-        expired = self.search([
-            ('state', 'not in', ['closed']),
-            ('expire_time', '<', fields.Datetime.now()),
-        ])
-        for session in expired:
-            _logger.info(f"Closing expired session: {session.name}")
-            session.action_close()
+        """
+        定时任务：清理过期会话
+
+        按批直接用 SQL 关闭（每批一条 UPDATE 关闭会话、一条 UPDATE 释放餐桌），
+        每批提交一次，上千个过期会话也不会形成长事务。
+        """
+        self.env.flush_all()
+        total = 0
+        while True:
+            closed = self._close_expired_batch(CLEANUP_BATCH_SIZE)
+            self.env.cr.commit()
+            total += closed
+            if closed < CLEANUP_BATCH_SIZE:
+                break
+        if total:
+            _logger.info(f"Closed {total} expired QR session(s)")
         return True
 
+    @api.model
+    def _close_expired_batch(self, limit):
+        """关闭一批过期会话，返回关闭的数量"""
+        cr = self.env.cr
+        cr.execute("""
+            SELECT s.id, t.qr_token
+            FROM qr_session s
+            LEFT JOIN qr_table t ON t.id = s.table_id
+            WHERE s.state != 'closed'
+            AND s.expire_time < (NOW() AT TIME ZONE 'UTC')
+            ORDER BY s.id
+            LIMIT %s
+            FOR UPDATE OF s SKIP LOCKED
+        """, (limit,))
+        rows = cr.fetchall()
+        if not rows:
+            return 0
+        session_ids = tuple(row[0] for row in rows)
+
+        # 关闭会话
+        cr.execute("""
+            UPDATE qr_session
+            SET state = 'closed',
+                end_time = (NOW() AT TIME ZONE 'UTC'),
+                write_date = (NOW() AT TIME ZONE 'UTC'),
+                write_uid = %s
+            WHERE id IN %s
+        """, (self.env.uid, session_ids))
+
+        # 清除餐桌的当前会话引用；会话没有未完成订单时餐桌设为可用
+        cr.execute("""
+            WITH busy AS (
+                SELECT session_id
+                FROM qr_order
+                WHERE session_id IN %s
+                AND state NOT IN ('cancelled', 'paid')
+                GROUP BY session_id
+            )
+            UPDATE qr_table t
+            SET current_session_id = NULL,
+                state = CASE WHEN busy.session_id IS NULL THEN 'available' ELSE t.state END,
+                write_date = (NOW() AT TIME ZONE 'UTC'),
+                write_uid = %s
+            FROM qr_table t2
+            LEFT JOIN busy ON busy.session_id = t2.current_session_id
+            WHERE t2.id = t.id
+            AND t.current_session_id IN %s
+        """, (session_ids, self.env.uid, session_ids))
+
+        # SQL 绕过了 ORM，需要手动失效缓存
+        self.env['qr.session'].invalidate_model(['state', 'end_time'])
+        self.env['qr.table'].invalidate_model(['current_session_id', 'state'])
+        session_cache.invalidate(cr, [row[1] for row in rows])
+        return len(rows)
+
@@ -5,9 +5,11 @@ import secrets
 import base64
 from io import BytesIO
 from datetime import datetime, timedelta
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
 from odoo.exceptions import UserError
 
+from ..services.session_cache import session_cache
+
 import logging
 _logger = logging.getLogger(__name__)
 
@@ -40,7 +42,8 @@ class QrTable(models.Model):
         'restaurant.table',
         string='POS Table / POS餐桌',
         ondelete='set null',
-        help='关联的 POS 餐厅餐桌'
+        index=True,
+        help='关联的 POS 餐厅餐桌（一个 POS 餐桌只能关联一个 QR 餐桌）'
     )
     
     # 关联 POS 配置
@@ -105,15 +108,39 @@ class QrTable(models.Model):
     _sql_constraints = [
         ('qr_token_unique', 'unique(qr_token)', 'QR Token must be unique!'),
         ('name_pos_config_unique', 'unique(name, pos_config_id)', 'Table name must be unique per POS config!'),
+        ('pos_table_unique', 'unique(pos_table_id)', 'A POS table can only be linked to one QR table!'),
     ]
 
+    # 这些字段变化会影响 validate_access 的结果，需要失效会话缓存
+    _QR_SESSION_CACHE_FIELDS = {'qr_token', 'active', 'current_session_id'}
+    # 这些字段变化会影响 restaurant.table -> qr.table 映射
+    _POS_TABLE_MAP_FIELDS = {'pos_table_id', 'active'}
+
     @api.model_create_multi
     def create(self, vals_list):
         """创建时自动生成 QR Token（仅一次，永久不变）"""
         for vals in vals_list:
             if not vals.get('qr_token'):
                 vals['qr_token'] = self._generate_qr_token()
-        return super().create(vals_list)
+        records = super().create(vals_list)
+        if records.filtered(lambda t: t.pos_table_id and t.active):
+            self.env.registry.clear_cache()
+        return records
+
+    @api.model
+    @tools.ormcache()
+    def _get_pos_table_map(self):
+        """
+        restaurant.table ID -> 有效 qr.table ID 的映射（缓存）
+
+        映射实际变化时（有效餐桌的 pos_table_id 改变、关联餐桌启用 / 停用 / 删除）
+        才清除缓存（Odoo 会通知其他 worker），其他写入不影响 ormcache。
+        """
+        self.env.cr.execute("""
+            SELECT pos_table_id, id FROM qr_table
+            WHERE pos_table_id IS NOT NULL AND active
+        """)
+        return dict(self.env.cr.fetchall())
 
     def write(self, vals):
         """
@@ -128,7 +155,26 @@ class QrTable(models.Model):
                 "Use action_regenerate_token() or set context allow_regenerate_qr_token=True"
             )
             vals = {k: v for k, v in vals.items() if k != 'qr_token'}
-        return super().write(vals)
+        if self._QR_SESSION_CACHE_FIELDS.intersection(vals):
+            # 使用写入前的 token，重新生成 token 时旧 token 也要失效
+            session_cache.invalidate(self.env.cr, self.mapped('qr_token'))
+        map_before = self._pos_table_map_entries() if self._POS_TABLE_MAP_FIELDS.intersection(vals) else None
+        result = super().write(vals)
+        if map_before is not None and self._pos_table_map_entries() != map_before:
+            self.env.registry.clear_cache()
+        return result
+
+    def unlink(self):
+        session_cache.invalidate(self.env.cr, self.mapped('qr_token'))
+        map_changed = bool(self._pos_table_map_entries())
+        result = super().unlink()
+        if map_changed:
+            self.env.registry.clear_cache()
+        return result
+
+    def _pos_table_map_entries(self):
+        """这些餐桌在 _get_pos_table_map 中的条目 {restaurant.table ID: qr.table ID}"""
+        return {table.pos_table_id.id: table.id for table in self if table.pos_table_id and table.active}
 
     def copy(self, default=None):
         """复制餐桌时，强制生成新的 qr_token"""
@@ -201,11 +247,12 @@ class QrTable(models.Model):
                 record.qr_code_image = False
 
     def _compute_order_count(self):
-        """计算订单数量"""
+        """计算订单数量（整个记录集一次分组查询）"""
+        counts = dict(self.env['qr.order']._read_group(
+            [('table_id', 'in', self.ids)], groupby=['table_id'], aggregates=['__count'],
+        ))
         for record in self:
-            record.order_count = self.env['qr.order'].search_count([
-                ('table_id', '=', record.id)
-            ])
+            record.order_count = counts.get(record, 0)
 
     def action_view_orders(self):
         """查看该餐桌的所有订单"""
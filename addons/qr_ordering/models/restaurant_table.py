@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields
+
+
+class RestaurantTable(models.Model):
+    """继承 restaurant.table，提供到 QR 餐桌的反向关联"""
+    _inherit = 'restaurant.table'
+
+    qr_table_id = fields.Many2one(
+        'qr.table',
+        string='QR Table / QR餐桌',
+        compute='_compute_qr_table_id',
+        help='关联的 QR 餐桌（通过缓存映射查找，不执行搜索）'
+    )
+
+    def _compute_qr_table_id(self):
+        mapping = self.env['qr.table'].sudo()._get_pos_table_map()
+        for table in self:
+            table.qr_table_id = mapping.get(table.id, False)
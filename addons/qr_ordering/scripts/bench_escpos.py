@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+厨房单 ESC/POS 渲染基准测试（不需要 Odoo）
+
+对比原来逐段 encode + bytearray 拼接的写法与预编译模板渲染的耗时。
+
+用法:
+    python3 addons/qr_ordering/scripts/bench_escpos.py [--tickets 2000] [--lines 8] [--codepage gbk]
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+import time
+import unicodedata
+
+SERVICES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'services')
+
+
+def load_services():
+    """直接加载 services 包（不经过依赖 Odoo 的 qr_ordering/__init__.py）"""
+    spec = importlib.util.spec_from_file_location(
+        'qr_ordering_services',
+        os.path.join(SERVICES_DIR, '__init__.py'),
+        submodule_search_locations=[SERVICES_DIR],
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+PRODUCTS = [
+    '麻婆豆腐', '宫保鸡丁', '唐揚げ定食', 'ラーメン（味噌）', 'Caesar Salad',
+    '生ビール 中', '餃子 6個', '担担面', 'Café au lait', 'ハイボール',
+]
+NOTES = ['', '', '少辣', '氷なし', 'no onion', '']
+
+
+def make_tickets(renderer, count, lines_per_ticket):
+    tickets = []
+    for i in range(count):
+        lines = [
+            renderer.TicketLine(
+                qty=(i + j) % 3 + 1,
+                name=PRODUCTS[(i + j) % len(PRODUCTS)],
+                types=['大盛り'] if j % 4 == 0 else [],
+                note=NOTES[(i + j) % len(NOTES)],
+            )
+            for j in range(lines_per_ticket)
+        ]
+        tickets.append(renderer.KitchenTicket(
+            change_name=f'Order-{i % 20 + 1:03d}',
+            order_uid=f'Order 00012-{i:03d}-0001',
+            table_name=f'A{i % 30 + 1}',
+            order_time='12:34',
+            customer_lines=[],
+            address_lines=[],
+            canceled=[],
+            ordered=lines,
+        ))
+    return tickets
+
+
+def render_legacy(ticket, encoding):
+    """原 _generate_escpos_commands / _append_order_line 的写法"""
+    ESC = b'\x1b'
+    GS = b'\x1d'
+    commands = bytearray()
+    commands.extend(ESC + b'@')
+    commands.extend(ESC + b'R\x0f')
+    commands.extend(ESC + b'a\x01')
+    commands.extend(GS + b'!\x00')
+    commands.extend(ESC + b'E\x01')
+    commands.extend(ticket.change_name.encode(encoding, errors='replace'))
+    commands.extend(b'\n')
+    commands.extend(ticket.order_uid.encode(encoding, errors='replace'))
+    commands.extend(b'\n')
+    commands.extend(ESC + b'E\x00')
+    commands.extend(ESC + b'a\x00')
+    commands.extend(GS + b'!\x30')
+    commands.extend(ESC + b'E\x01')
+    left, right = ticket.table_name, ticket.order_time
+    left_width = sum(2 if ord(c) > 127 else 1 for c in left)
+    right_width = sum(2 if ord(c) > 127 else 1 for c in right)
+    line = left + ' ' * max(1, 16 - left_width - right_width) + right
+    commands.extend(line.encode(encoding, errors='replace'))
+    commands.extend(b'\n')
+    commands.extend(GS + b'!\x00')
+    commands.extend(ESC + b'E\x00')
+    commands.extend(b'\n')
+    commands.extend(ESC + b'a\x01')
+    commands.extend(ESC + b'E\x01')
+    commands.extend('ORDERED'.encode(encoding, errors='replace'))
+    commands.extend(b'\n')
+    commands.extend(ESC + b'E\x00')
+    commands.extend(ESC + b'a\x00')
+    for item in ticket.ordered:
+        commands.extend(GS + b'!\x10')
+        commands.extend(f'{item.qty}   {item.name}\n'.encode(encoding, errors='replace'))
+        commands.extend(GS + b'!\x00')
+        if item.types:
+            commands.extend(f'TYPE: {", ".join(item.types)}\n'.encode(encoding, errors='replace'))
+        if item.note:
+            commands.extend(f'NOTE: {item.note}\n'.encode(encoding, errors='replace'))
+    commands.extend(ESC + b'd\x03')
+    commands.extend(GS + b'V\x01')
+    return bytes(commands)
+
+
+def bench(label, func, tickets, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(tickets)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    per_ticket_us = best / len(tickets) * 1e6
+    print(f'{label:<28} {best * 1000:9.2f} ms  {per_ticket_us:8.2f} us/ticket')
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickets', type=int, default=2000)
+    parser.add_argument('--lines', type=int, default=8)
+    parser.add_argument('--codepage', default='gbk', choices=['gbk', 'shift_jis'])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    services = load_services()
+    renderer = services.escpos_renderer
+    layout = services.escpos_layout
+    encoding = layout.get_codepage(args.codepage)['encoding']
+    tickets = make_tickets(renderer, args.tickets, args.lines)
+    template = renderer.get_ticket_template(args.codepage, layout.DEFAULT_COLUMNS)
+
+    print(f'{args.tickets} tickets x {args.lines} lines, codepage={args.codepage}, '
+          f'python {sys.version.split()[0]}, unicodedata {unicodedata.unidata_version}')
+    legacy = bench('legacy bytearray', lambda ts: [render_legacy(t, encoding) for t in ts], tickets, args.repeat)
+    # 第一次调用包含编码缓存预热，取多次中的最好成绩
+    compiled = bench('compiled template', lambda ts: [template.render(t) for t in ts], tickets, args.repeat)
+    print(f'speedup: {legacy / compiled:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+扫码点餐负载模拟基准测试（需要 Odoo 环境和一个测试数据库）
+
+在一个测试数据库中准备一家餐厅（POS 配置、厨房打印机、分类、N 个菜品、M 张餐桌），
+然后用多个线程模拟顾客，按真实顺序调用点餐接口：
+
+    页面 → init → menu → 加购物车 × K → 修改数量 → 下单 → 轮询状态 → 加菜 → 轮询状态
+
+请求在进程内经过完整的 Odoo HTTP 栈（odoo.http.root，werkzeug 测试客户端，每个顾客独立的 cookie），
+不需要启动 Odoo 服务。输出每个接口的次数、错误数、p50 / p95 / p99 耗时、平均 / 最大 SQL 次数
+（来自 services/request_metrics.py）以及总吞吐量。
+
+厨房打印机和 KDS 在进程内替换为桩：仍然生成 ESC/POS 和小票数据（计入分发耗时），
+但不创建 ylhc.print.job、不写 KDS 变更、不通知 POS 前端。--dispatch 在负载结束后
+处理厨房分发队列并输出耗时。
+
+数据库需要已安装 qr_ordering 和会计科目表（POS 会话需要现金日记账）。
+准备的数据按名称复用（"QR Bench"），重复运行不会重复创建；每次访问结束后关台，
+下一位顾客使用新的会话。请不要在生产数据库上运行。
+
+用法（使用 Odoo 的 Python 环境）:
+    python3 addons/qr_ordering/scripts/bench_load.py -c /etc/odoo/odoo.conf -d qr_bench \\
+        [--tables 20] [--products 200] [--visits 5] [--concurrency 20] [--dispatch]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_NAME = 'QR Bench'
+
+# 接口名与 @instrumented 记录的路由名一致，便于合并 SQL 统计
+ENDPOINTS = [
+    ('qr_ordering_page', None),
+    ('api_init', '/qr/api/init'),
+    ('api_get_menu', '/qr/api/menu'),
+    ('api_add_to_cart', '/qr/api/cart/add'),
+    ('api_update_cart', '/qr/api/cart/update'),
+    ('api_submit_order', '/qr/api/order/submit'),
+    ('api_add_items', '/qr/api/order/add_items'),
+    ('api_get_order_status', '/qr/api/order/status'),
+]
+PATHS = dict(ENDPOINTS)
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+# ==================== 数据准备 ====================
+
+def _cash_payment_method(env):
+    method = env['pos.payment.method'].search([('name', '=', f'{BENCH_NAME} Cash')], limit=1)
+    if method:
+        return method
+    journal = env['account.journal'].search([
+        ('type', '=', 'cash'),
+        ('company_id', '=', env.company.id),
+    ], limit=1)
+    if not journal:
+        journal = env['account.journal'].create({'name': f'{BENCH_NAME} Cash', 'type': 'cash', 'code': 'QRBC'})
+    return env['pos.payment.method'].create({'name': f'{BENCH_NAME} Cash', 'journal_id': journal.id})
+
+
+def _ylhc_printers(env, printers):
+    """为每台 pos.printer 创建同名 ylhc.printer（路由按名称匹配）；失败时只使用 POS 前端通知"""
+    for printer in printers:
+        if env['ylhc.printer'].search_count([('name', '=', printer.name)]):
+            continue
+        try:
+            with env.cr.savepoint():
+                env['ylhc.printer'].create({'name': printer.name})
+        except Exception as e:
+            print(f'note: ylhc.printer {printer.name!r} not created ({e}); kitchen routing falls back to POS notification')
+
+
+def seed(env, args):
+    """准备测试餐厅，已存在时复用；返回 (pos.config, qr.table 记录集)"""
+    config = env['pos.config'].search([('name', '=', BENCH_NAME)], limit=1)
+    if config:
+        tables = env['qr.table'].search([('pos_config_id', '=', config.id)], order='id')
+        print(f'reusing {BENCH_NAME!r}: config={config.id}, {len(tables)} tables')
+    else:
+        categories = env['pos.category'].create([
+            {'name': f'{BENCH_NAME} {i + 1:02d}'} for i in range(args.categories)
+        ])
+        printers = env['pos.printer'].create([{
+            'name': f'{BENCH_NAME} Kitchen {i + 1}',
+            'product_categories_ids': [(6, 0, categories[i::args.printers].ids)],
+        } for i in range(args.printers)])
+        _ylhc_printers(env, printers)
+
+        env['product.product'].create([{
+            'name': f'{BENCH_NAME} Dish {i + 1:04d}',
+            'list_price': 300 + (i % 20) * 50,
+            'available_in_pos': True,
+            'pos_categ_ids': [(6, 0, [categories[i % len(categories)].id])],
+            'qr_available': True,
+        } for i in range(args.products)])
+
+        config = env['pos.config'].create({
+            'name': BENCH_NAME,
+            'module_pos_restaurant': True,
+            'is_order_printer': True,
+            'printer_ids': [(6, 0, printers.ids)],
+            'payment_method_ids': [(6, 0, _cash_payment_method(env).ids)],
+        })
+        floor = env['restaurant.floor'].create({
+            'name': BENCH_NAME,
+            'pos_config_ids': [(6, 0, config.ids)],
+        })
+        pos_tables = env['restaurant.table'].create([
+            {'floor_id': floor.id, 'table_number': i + 1, 'seats': 4} for i in range(args.tables)
+        ])
+        tables = env['qr.table'].create([{
+            'name': f'B{i + 1:03d}',
+            'pos_table_id': pos_table.id,
+            'pos_config_id': config.id,
+        } for i, pos_table in enumerate(pos_tables)])
+        print(f'seeded {BENCH_NAME!r}: {args.categories} categories, {args.printers} printers, '
+              f'{args.products} products, {args.tables} tables')
+
+    if not config.current_session_id:
+        config.open_ui()
+    # 上次运行中断时留下的会话
+    for table in tables.filtered('current_session_id'):
+        table.action_close_table()
+    return config, tables[:args.tables]
+
+
+# ==================== 打印机 / KDS 桩 ====================
+
+stub_calls = Counter()
+_stub_lock = threading.Lock()
+
+
+def _count(name):
+    with _stub_lock:
+        stub_calls[name] += 1
+
+
+def install_stubs(registry):
+    """替换注册表中 qr.order 的打印 / KDS 方法（只影响当前进程）"""
+    QrOrder = registry['qr.order']
+
+    def _create_kitchen_print_job(self, ylhc_printer, pos_order, is_batch=False, qr_lines=None):
+        # 保留 ESC/POS 和小票数据生成，跳过打印任务
+        lines = qr_lines if qr_lines else self.line_ids
+        self._generate_escpos_commands(pos_order, lines, is_batch, ylhc_printer=ylhc_printer)
+        self._generate_receipt_data(pos_order, lines, is_batch)
+        _count('kitchen_print_job')
+
+    def _stub(name):
+        def method(self, *args, **kwargs):
+            _count(name)
+        return method
+
+    QrOrder._create_kitchen_print_job = _create_kitchen_print_job
+    for name in (
+        '_create_kds_change',
+        '_create_kds_change_for_batch',
+        '_send_print_notification_legacy',
+        '_send_print_notification_for_batch_legacy',
+    ):
+        if hasattr(QrOrder, name):
+            setattr(QrOrder, name, _stub(name))
+
+
+# ==================== 模拟顾客 ====================
+
+class LoadStats:
+    """客户端侧的每接口耗时"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.error_samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, elapsed_ms, error=None):
+        with self._lock:
+            self.latencies[endpoint].append(elapsed_ms)
+            if error:
+                self.errors[endpoint] += 1
+                self.error_samples.setdefault(endpoint, error)
+
+
+class Diner:
+    """一位顾客：独立的 werkzeug 客户端（cookie）和 access_token"""
+
+    def __init__(self, app, table_token, stats, rng, args):
+        from werkzeug.test import Client
+        self.client = Client(app)
+        self.table_token = table_token
+        self.access_token = None
+        self.stats = stats
+        self.rng = rng
+        self.args = args
+        self._rpc_id = 0
+
+    def _think(self):
+        if self.args.think_ms:
+            time.sleep(self.rng.uniform(0.5, 1.5) * self.args.think_ms / 1000)
+
+    def page(self):
+        started = time.perf_counter()
+        response = self.client.get(f'/qr/order/{self.table_token}', environ_overrides={'REMOTE_ADDR': '127.0.0.1'})
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        error = None if response.status_code == 200 else f'HTTP {response.status_code}'
+        self.stats.add('qr_ordering_page', elapsed_ms, error)
+
+    def call(self, endpoint, idempotent=False, **params):
+        self._rpc_id += 1
+        params['table_token'] = self.table_token
+        if self.access_token:
+            params['access_token'] = self.access_token
+        if idempotent:
+            params['idempotency_key'] = uuid.uuid4().hex
+        payload = {'jsonrpc': '2.0', 'method': 'call', 'params': params, 'id': self._rpc_id}
+
+        started = time.perf_counter()
+        response = self.client.post(PATHS[endpoint], json=payload, environ_overrides={'REMOTE_ADDR': '127.0.0.1'})
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        result = None
+        if response.status_code == 200:
+            body = response.get_json() or {}
+            result = body.get('result')
+            error = None if result and result.get('success') else (
+                (result or {}).get('error') or (body.get('error') or {}).get('message') or 'NO_RESULT'
+            )
+        else:
+            error = f'HTTP {response.status_code}'
+        self.stats.add(endpoint, elapsed_ms, error)
+        self._think()
+        return result if not error else None
+
+    def visit(self):
+        """一次完整的用餐流程"""
+        args = self.args
+        self.page()
+        init = self.call('api_init')
+        if not init:
+            return False
+        data = init['data']
+        self.access_token = data['access_token']
+        product_ids = [p['id'] for p in data['menu']['products']]
+        if not product_ids:
+            raise RuntimeError('menu is empty (no available_in_pos + qr_available products)')
+
+        self.call('api_get_menu', lang='zh_CN')
+
+        cart = None
+        for product_id in self.rng.sample(product_ids, min(args.cart_items, len(product_ids))):
+            cart = self.call('api_add_to_cart', idempotent=True, product_id=product_id, qty=1) or cart
+        if cart and cart['data'].get('lines'):
+            line = self.rng.choice(cart['data']['lines'])
+            self.call('api_update_cart', idempotent=True, line_id=line['id'], qty=2)
+
+        if not self.call('api_submit_order', idempotent=True, note=''):
+            return False
+        for _ in range(args.polls):
+            self.call('api_get_order_status')
+
+        items = [
+            {'product_id': product_id, 'qty': 1, 'note': ''}
+            for product_id in self.rng.sample(product_ids, min(args.add_items, len(product_ids)))
+        ]
+        self.call('api_add_items', idempotent=True, items=items)
+        for _ in range(args.polls):
+            self.call('api_get_order_status')
+        return True
+
+
+def close_table(registry, table_id):
+    """关台，下一位顾客开始新的会话（不计入耗时）"""
+    from odoo import api, SUPERUSER_ID
+    with registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        env['qr.table'].browse(table_id).action_close_table()
+
+
+def run_table(app, registry, table, stats, args, index):
+    rng = random.Random(args.random_seed + index)
+    completed = 0
+    for _ in range(args.visits):
+        diner = Diner(app, table['token'], stats, rng, args)
+        try:
+            if diner.visit():
+                completed += 1
+        finally:
+            close_table(registry, table['id'])
+    return completed
+
+
+# ==================== 报告 ====================
+
+def build_report(stats, metrics_snapshot, wall_seconds, visits, dispatch):
+    routes = metrics_snapshot.get('routes', {})
+    endpoints = []
+    total_requests = 0
+    for endpoint, _path in ENDPOINTS:
+        latencies = sorted(stats.latencies.get(endpoint, []))
+        if not latencies:
+            continue
+        total_requests += len(latencies)
+        server = routes.get(endpoint, {})
+        endpoints.append({
+            'endpoint': endpoint,
+            'count': len(latencies),
+            'errors': stats.errors.get(endpoint, 0),
+            'p50_ms': round(_percentile(latencies, 0.50), 2),
+            'p95_ms': round(_percentile(latencies, 0.95), 2),
+            'p99_ms': round(_percentile(latencies, 0.99), 2),
+            'max_ms': round(latencies[-1], 2),
+            'avg_sql': server.get('avg_sql'),
+            'max_sql': server.get('max_sql'),
+            'avg_sql_ms': server.get('avg_sql_ms'),
+        })
+    return {
+        'wall_seconds': round(wall_seconds, 2),
+        'requests': total_requests,
+        'requests_per_second': round(total_requests / wall_seconds, 2) if wall_seconds else 0,
+        'visits_completed': visits,
+        'visits_per_minute': round(visits / wall_seconds * 60, 2) if wall_seconds else 0,
+        'endpoints': endpoints,
+        'error_samples': dict(stats.error_samples),
+        'stub_calls': dict(stub_calls),
+        'dispatch': dispatch,
+    }
+
+
+def print_report(report):
+    print()
+    print(f'{"endpoint":<22} {"count":>6} {"err":>5} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+          f'{"max ms":>8} {"avg sql":>8} {"max sql":>8}')
+    for row in report['endpoints']:
+        avg_sql = '-' if row['avg_sql'] is None else f'{row["avg_sql"]:.1f}'
+        max_sql = '-' if row['max_sql'] is None else str(row['max_sql'])
+        print(f'{row["endpoint"]:<22} {row["count"]:>6} {row["errors"]:>5} {row["p50_ms"]:>8.1f} '
+              f'{row["p95_ms"]:>8.1f} {row["p99_ms"]:>8.1f} {row["max_ms"]:>8.1f} {avg_sql:>8} {max_sql:>8}')
+    print()
+    print(f'{report["requests"]} requests in {report["wall_seconds"]:.1f} s: '
+          f'{report["requests_per_second"]:.1f} req/s, '
+          f'{report["visits_completed"]} visits ({report["visits_per_minute"]:.1f} / min)')
+    if report['error_samples']:
+        print('errors: ' + ', '.join(f'{k}={v}' for k, v in report['error_samples'].items()))
+    if report['stub_calls']:
+        print('stubbed: ' + ', '.join(f'{k}={v}' for k, v in sorted(report['stub_calls'].items())))
+    if report['dispatch']:
+        dispatch = report['dispatch']
+        print(f'kitchen dispatch: {dispatch["jobs"]} jobs in {dispatch["seconds"]:.2f} s '
+              f'({dispatch["jobs_per_second"]:.1f} jobs/s)')
+
+
+# ==================== 入口 ====================
+
+def init_odoo(args, concurrency):
+    import odoo
+    from odoo.tools import config
+    # 每个工作线程和关台都会打开自己的游标，连接池需要容纳所有线程
+    odoo_args = [
+        '-d', args.database,
+        f'--log-level={args.log_level}',
+        f'--db_maxconn={max(64, concurrency * 2 + 8)}',
+    ]
+    if args.config:
+        odoo_args += ['-c', args.config]
+    if args.addons_path:
+        odoo_args += ['--addons-path', args.addons_path]
+    config.parse_config(odoo_args)
+    odoo.netsvc.init_logger()
+    odoo.service.server.load_server_wide_modules()
+    from odoo.modules.registry import Registry
+    return Registry(args.database)
+
+
+def run_dispatch(registry):
+    from odoo import api, SUPERUSER_ID
+    jobs = 0
+    started = time.perf_counter()
+    with registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        while True:
+            processed = env['qr.kitchen.dispatch']._cron_process_queue(limit=500)
+            jobs += processed
+            if not processed:
+                break
+    seconds = time.perf_counter() - started
+    return {'jobs': jobs, 'seconds': round(seconds, 3), 'jobs_per_second': round(jobs / seconds, 2) if seconds else 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-c', '--config', help='Odoo 配置文件')
+    parser.add_argument('-d', '--database', required=True, help='测试数据库（已安装 qr_ordering）')
+    parser.add_argument('--addons-path')
+    parser.add_argument('--log-level', default='warn')
+    parser.add_argument('--tables', type=int, default=20)
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--categories', type=int, default=8)
+    parser.add_argument('--printers', type=int, default=2)
+    parser.add_argument('--visits', type=int, default=5, help='每张餐桌的顾客数（依次用餐）')
+    parser.add_argument('--concurrency', type=int, default=0, help='并发线程数，默认等于餐桌数')
+    parser.add_argument('--cart-items', type=int, default=4)
+    parser.add_argument('--add-items', type=int, default=2)
+    parser.add_argument('--polls', type=int, default=3, help='下单 / 加菜后各轮询几次状态')
+    parser.add_argument('--think-ms', type=float, default=0, help='每次请求后的平均等待时间')
+    parser.add_argument('--random-seed', type=int, default=1)
+    parser.add_argument('--dispatch', action='store_true', help='负载结束后处理厨房分发队列')
+    parser.add_argument('--json', help='把结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    concurrency = args.concurrency or args.tables
+    registry = init_odoo(args, concurrency)
+    from odoo import api, SUPERUSER_ID
+    from odoo.http import root
+    from odoo.addons.qr_ordering.services.request_metrics import request_metrics
+
+    with registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        _config, qr_tables = seed(env, args)
+        tables = [{'id': t.id, 'token': t.qr_token} for t in qr_tables]
+    if not tables:
+        sys.exit('no tables to run against')
+
+    install_stubs(registry)
+    concurrency = min(concurrency, len(tables))
+    print(f'{len(tables)} tables x {args.visits} visits, concurrency={concurrency}, '
+          f'{args.cart_items} cart items, {args.add_items} add items, {args.polls} polls, '
+          f'think={args.think_ms:g} ms, pid={os.getpid()}')
+
+    stats = LoadStats()
+    request_metrics.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(run_table, root, registry, table, stats, args, index)
+            for index, table in enumerate(tables)
+        ]
+        visits = sum(future.result() for future in futures)
+    wall_seconds = time.perf_counter() - started
+    metrics_snapshot = request_metrics.snapshot()
+
+    dispatch = run_dispatch(registry) if args.dispatch else None
+    report = build_report(stats, metrics_snapshot, wall_seconds, visits, dispatch)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
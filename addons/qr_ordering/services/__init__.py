@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+
+from . import escpos_layout
+from . import escpos_renderer
+from . import hot_log
+from . import image_variants
+from . import menu_snapshot
+from . import request_metrics
+from . import session_cache
+from . import static_assets
+from . import tax_resolver
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# ESC/POS 文本排版 - 按东亚字符宽度计算列宽
+#
+# 热敏打印机在 GBK / Shift-JIS 模式下，全角字符（汉字、假名、全角符号）占 2 列，
+# 半角字符占 1 列。原来按 ord(c) > 127 判断，带重音的拉丁字母和半角片假名会算错。
+# 这里使用 unicodedata.east_asian_width：W / F / A（歧义宽度，在 CJK 码页中按全角打印）
+# 占 2 列，组合字符占 0 列，其余占 1 列。
+
+import unicodedata
+from functools import lru_cache
+
+# 码页：Python 编码名 + 打印机初始化命令
+# gbk 与原模板一致（ESC R 15 选择中国字符集）
+# shift_jis：ESC R 8 选择日本字符集，FS C 1 选择 Shift-JIS，FS & 进入汉字模式
+CODEPAGES = {
+    'gbk': {
+        'encoding': 'gbk',
+        'init': b'\x1bR\x0f',
+    },
+    'shift_jis': {
+        'encoding': 'shift_jis',
+        'init': b'\x1bR\x08\x1cC\x01\x1c&',
+    },
+}
+DEFAULT_CODEPAGE = 'gbk'
+
+# 纸宽 -> 标准字体 (Font A) 每行列数
+PAPER_COLUMNS = {
+    '58mm': 32,
+    '80mm': 48,
+}
+# 未知纸宽时使用 32 列，与原模板一致
+DEFAULT_COLUMNS = 32
+
+
+@lru_cache(maxsize=8192)
+def char_width(char):
+    """单个字符在 CJK 码页下占用的列数"""
+    if unicodedata.combining(char):
+        return 0
+    if unicodedata.east_asian_width(char) in ('W', 'F', 'A'):
+        return 2
+    return 1
+
+
+def text_width(text):
+    """文本占用的列数"""
+    if text.isascii():
+        return len(text)
+    return sum(char_width(c) for c in text)
+
+
+def two_columns(left, right, width):
+    """左对齐 + 右对齐的两列文本，至少保留一个空格"""
+    left = str(left) if left else ''
+    right = str(right) if right else ''
+    spaces = max(1, width - text_width(left) - text_width(right))
+    return left + ' ' * spaces + right
+
+
+def get_codepage(name):
+    """返回码页配置，未知名称时使用默认码页"""
+    return CODEPAGES.get(name) or CODEPAGES[DEFAULT_CODEPAGE]
+
+
+def select_codepage(texts, preferred=DEFAULT_CODEPAGE):
+    """
+    选择能完整编码所有文本的码页
+
+    优先使用 preferred；如果其中有字符无法编码而另一个码页可以，则切换。
+    都无法完整编码时返回 preferred（无法编码的字符打印为 ?）。
+    """
+    candidates = [preferred] + [name for name in CODEPAGES if name != preferred]
+    for name in candidates:
+        encoding = get_codepage(name)['encoding']
+        try:
+            for text in texts:
+                if text:
+                    text.encode(encoding)
+        except UnicodeEncodeError:
+            continue
+        return name
+    return preferred
+
+
+def columns_for_paper(paper_width):
+    """纸宽对应的列数"""
+    return PAPER_COLUMNS.get(paper_width, DEFAULT_COLUMNS)
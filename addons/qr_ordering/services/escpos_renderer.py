@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# 厨房单 ESC/POS 模板渲染
+#
+# 模板格式与 POS KDS (OrderChangePrint.vue) 保持一致。固定的控制序列和分组标题
+# 按 (码页, 列数) 预编译为字节段并缓存；动态文本的编码结果也做 LRU 缓存，
+# 相同菜名 / 备注只编码一次。渲染只拼接字节段，不访问数据库。
+
+from collections import namedtuple
+from functools import lru_cache
+
+from . import escpos_layout
+
+ESC = b'\x1b'
+GS = b'\x1d'
+
+INIT = ESC + b'@'                    # ESC @ - 初始化打印机
+ALIGN_CENTER = ESC + b'a\x01'        # 居中对齐
+ALIGN_LEFT = ESC + b'a\x00'          # 左对齐
+BOLD_ON = ESC + b'E\x01'             # 粗体开
+BOLD_OFF = ESC + b'E\x00'            # 粗体关
+DOUBLE_HEIGHT = GS + b'!\x10'        # 双倍高度
+DOUBLE_SIZE = GS + b'!\x30'          # 双倍尺寸（宽+高）
+NORMAL_SIZE = GS + b'!\x00'          # 正常尺寸
+FEED_LINES = ESC + b'd\x03'          # 走纸 3 行
+PARTIAL_CUT = GS + b'V\x01'          # 半切
+
+# 厨房单数据（纯数据，不含记录集）
+KitchenTicket = namedtuple('KitchenTicket', [
+    'change_name',      # Order-XXX
+    'order_uid',        # 订单号
+    'table_name',
+    'order_time',       # HH:MM
+    'customer_lines',   # 客户信息行（无则为空）
+    'address_lines',    # 配送地址行（无则为空）
+    'canceled',         # [TicketLine]
+    'ordered',          # [TicketLine]
+])
+TicketLine = namedtuple('TicketLine', ['qty', 'name', 'types', 'note'])
+
+
+@lru_cache(maxsize=8192)
+def encode_text(text, encoding):
+    return text.encode(encoding, errors='replace')
+
+
+class KitchenTicketTemplate:
+    """预编译的厨房单模板"""
+
+    def __init__(self, codepage=escpos_layout.DEFAULT_CODEPAGE, columns=escpos_layout.DEFAULT_COLUMNS):
+        codepage_info = escpos_layout.get_codepage(codepage)
+        self.codepage = codepage
+        self.encoding = codepage_info['encoding']
+        self.columns = columns
+
+        # 标题前：初始化 + 码页 + 居中粗体
+        self.header = INIT + codepage_info['init'] + ALIGN_CENTER + NORMAL_SIZE + BOLD_ON
+        # 订单号之后：桌号行使用双倍尺寸
+        self.table_start = BOLD_OFF + ALIGN_LEFT + DOUBLE_SIZE + BOLD_ON
+        self.table_end = NORMAL_SIZE + BOLD_OFF
+        self.sections = {
+            title: b'\n' + ALIGN_CENTER + BOLD_ON + self.encode(title) + b'\n' + BOLD_OFF + ALIGN_LEFT
+            for title in ('CUSTOMER DETAILS', 'DELIVERY ADDRESS', 'CANCELED', 'ORDERED')
+        }
+        self.footer = FEED_LINES + PARTIAL_CUT
+
+    def encode(self, text):
+        return encode_text(text, self.encoding)
+
+    def render(self, ticket):
+        """
+        渲染厨房单
+
+        Args:
+            ticket: KitchenTicket
+
+        Returns:
+            bytes: ESC/POS 命令字节序列
+        """
+        encode = self.encode
+        parts = [
+            self.header,
+            encode(ticket.change_name), b'\n',
+            encode(ticket.order_uid), b'\n',
+            self.table_start,
+            # 双倍宽度下有效列数减半
+            encode(escpos_layout.two_columns(ticket.table_name, ticket.order_time, self.columns // 2)), b'\n',
+            self.table_end,
+        ]
+
+        if ticket.customer_lines:
+            parts.append(self.sections['CUSTOMER DETAILS'])
+            parts.extend(encode(f'{text}\n') for text in ticket.customer_lines)
+        if ticket.address_lines:
+            parts.append(self.sections['DELIVERY ADDRESS'])
+            parts.extend(encode(f'{text}\n') for text in ticket.address_lines)
+
+        if ticket.canceled:
+            parts.append(self.sections['CANCELED'])
+            for line in ticket.canceled:
+                self._render_line(parts, line)
+        if ticket.ordered:
+            parts.append(self.sections['ORDERED'])
+            for line in ticket.ordered:
+                self._render_line(parts, line)
+
+        parts.append(self.footer)
+        return b''.join(parts)
+
+    def _render_line(self, parts, line):
+        # 格式: 数量 + 商品名称（双倍高度），属性和备注各占一行
+        parts.append(DOUBLE_HEIGHT)
+        parts.append(self.encode(f'{line.qty}   {line.name}\n'))
+        parts.append(NORMAL_SIZE)
+        if line.types:
+            parts.append(self.encode(f'TYPE: {", ".join(line.types)}\n'))
+        if line.note:
+            parts.append(self.encode(f'NOTE: {line.note}\n'))
+
+
+@lru_cache(maxsize=64)
+def get_ticket_template(codepage=escpos_layout.DEFAULT_CODEPAGE, columns=escpos_layout.DEFAULT_COLUMNS):
+    """按 (码页, 列数) 缓存的模板，即每种打印机配置只编译一次"""
+    return KitchenTicketTemplate(codepage, columns)
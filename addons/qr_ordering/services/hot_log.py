@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# 热路径结构化日志 - 延迟格式化、按分类设置级别、采样
+#
+# 下单、订单状态轮询、订单序列化每次请求都会执行。原来这些位置用 _logger.warning(f"...")
+# 输出明细（包括遍历所有订单行的列表推导），即使日志被过滤掉，f-string 和推导式也已经执行。
+#
+# HotLog('order_status').debug('order', order_id=lambda: order.id, lines=lambda: len(lines))
+# - 字段可以是无参函数，只有真正输出时才求值；消息为 key=value 格式
+# - 每个分类对应 logger odoo.addons.qr_ordering.hot.<分类>，级别用 Odoo 的 --log-handler 单独设置，
+#   例如 --log-handler=odoo.addons.qr_ordering.hot.order_status:DEBUG
+# - INFO / DEBUG 按分类采样（SAMPLE_RATES，可在配置文件中用 qr_ordering_log_sample_<分类> 覆盖），
+#   WARNING 及以上不采样
+# - force_debug()：当前请求（按 trace_id）输出全部明细，不受级别和采样限制，
+#   用于排查指定餐桌（系统参数 qr_ordering.debug_table_ids）或带 X-QR-Debug 头的请求
+
+import logging
+import random
+import threading
+
+from .request_metrics import active_trace_id
+
+LOGGER_PREFIX = 'odoo.addons.qr_ordering.hot'
+
+# 分类 -> INFO / DEBUG 日志的采样率（未列出的分类为 1.0，即全部输出）
+SAMPLE_RATES = {
+    'order_status': 0.01,   # 订单状态轮询，每桌每几秒一次
+    'page': 0.1,            # 点餐页面 / api/init，每位顾客扫码都会访问
+    'serialize': 0.01,      # 订单序列化，每次状态轮询 / 购物车操作都会调用
+    'submit': 1.0,          # 下单（业务事件，数量少）
+    'sync': 1.0,            # 同步到 POS
+}
+
+_local = threading.local()
+
+
+def force_debug():
+    """当前请求输出全部热路径明细"""
+    trace_id = active_trace_id()
+    if trace_id:
+        _local.forced_trace_id = trace_id
+
+
+def debug_forced():
+    trace_id = active_trace_id()
+    return bool(trace_id) and getattr(_local, 'forced_trace_id', None) == trace_id
+
+
+def _configured_sample_rate(category):
+    from odoo.tools import config
+    value = config.get(f'qr_ordering_log_sample_{category}')
+    if value in (None, ''):
+        return SAMPLE_RATES.get(category, 1.0)
+    try:
+        return min(1.0, max(0.0, float(value)))
+    except (TypeError, ValueError):
+        return SAMPLE_RATES.get(category, 1.0)
+
+
+class _LazyMessage:
+    """输出时才格式化的 key=value 消息"""
+
+    __slots__ = ('category', 'event', 'fields', 'sample_rate')
+
+    def __init__(self, category, event, fields, sample_rate):
+        self.category = category
+        self.event = event
+        self.fields = fields
+        self.sample_rate = sample_rate
+
+    def __str__(self):
+        parts = [f'qr.{self.category}.{self.event}']
+        trace_id = active_trace_id()
+        if trace_id:
+            parts.append(f'trace_id={trace_id}')
+        for key, value in self.fields.items():
+            if callable(value):
+                try:
+                    value = value()
+                except Exception as e:
+                    value = f'<error: {e}>'
+            parts.append(f'{key}={value}')
+        if self.sample_rate < 1.0:
+            parts.append(f'sample={self.sample_rate:g}')
+        return ' '.join(parts)
+
+
+class HotLog:
+    """热路径日志分类"""
+
+    def __init__(self, category):
+        self.category = category
+        self.logger = logging.getLogger(f'{LOGGER_PREFIX}.{category}')
+        self._sample_rate = None
+
+    @property
+    def sample_rate(self):
+        if self._sample_rate is None:
+            self._sample_rate = _configured_sample_rate(self.category)
+        return self._sample_rate
+
+    def debug(self, event, **fields):
+        self.log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self.log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self.log(logging.WARNING, event, fields)
+
+    def log(self, level, event, fields):
+        if debug_forced():
+            # 强制输出：绕过 logger 级别，至少按 INFO 输出
+            message = _LazyMessage(self.category, event, fields, 1.0)
+            record = self.logger.makeRecord(
+                self.logger.name, max(level, logging.INFO), '(hot_log)', 0, '%s', (message,), None,
+            )
+            self.logger.handle(record)
+            return
+
+        if not self.logger.isEnabledFor(level):
+            return
+        sample_rate = 1.0 if level >= logging.WARNING else self.sample_rate
+        if sample_rate < 1.0 and random.random() >= sample_rate:
+            return
+        self.logger.log(level, '%s', _LazyMessage(self.category, event, fields, sample_rate))
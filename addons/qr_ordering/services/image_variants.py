@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# 菜品图片派生变体存储
+#
+# /qr/image/product 原来每次请求都读取 base64 图片、解码并以 image/png 返回，
+# 没有 ETag，菜单每次加载都重新下载全部缩略图。
+# 这里按 (图片 checksum, 尺寸, 格式) 在 data_dir 下生成 WebP / JPEG 变体文件：
+# - checksum 来自 ir.attachment，图片不变时 ETag 不变，浏览器可以 304
+# - 变体文件只生成一次，之后直接读文件，或交给 nginx (X-Accel-Redirect) / X-Sendfile 发送
+# - 图片修改后 checksum 变化，自动生成新变体（旧文件由 purge_stale 清理）
+
+import io
+import logging
+import os
+import tempfile
+import time
+
+_logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+}
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+CACHE_DIR_NAME = 'qr_ordering_images'
+
+
+def cache_dir(dbname):
+    """变体文件目录：{data_dir}/qr_ordering_images/{dbname}"""
+    from odoo.tools import config
+    return os.path.join(config['data_dir'], CACHE_DIR_NAME, dbname)
+
+
+def variant_name(checksum, size, fmt):
+    # checksum 前两位作为子目录，避免单目录文件过多
+    return os.path.join(checksum[:2], f'{checksum}_{size}.{fmt}')
+
+
+def etag(checksum, size, fmt):
+    """强 ETag：图片内容、尺寸、格式都相同时才相同"""
+    return f'"{checksum}-{size}-{fmt}"'
+
+
+def choose_format(accept_header):
+    """按 Accept 头选择格式：支持 WebP 时用 WebP，否则 JPEG
+
+    只看请求头，命中缓存时不需要解码原图。
+    """
+    if 'image/webp' in (accept_header or ''):
+        return 'webp'
+    return 'jpeg'
+
+
+def render_variant(source_bytes, fmt):
+    """把原图转码为指定格式，返回 bytes"""
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(source_bytes))
+    output = io.BytesIO()
+    if fmt == 'webp':
+        image.save(output, format='WEBP', quality=WEBP_QUALITY, method=4)
+    else:
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # JPEG 不支持透明，铺白色背景
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        elif image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(output, format='JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def get_variant_path(dbname, checksum, size, fmt, load_source):
+    """
+    返回变体文件路径，不存在时生成
+
+    Args:
+        load_source: 无参函数，返回原图 bytes（只在需要生成变体时调用）
+
+    Returns:
+        (directory, relative_path)
+    """
+    directory = cache_dir(dbname)
+    relative = variant_name(checksum, size, fmt)
+    path = os.path.join(directory, relative)
+    if os.path.exists(path):
+        return directory, relative
+
+    data = render_variant(load_source(), fmt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 先写临时文件再原子替换，并发生成同一变体时不会读到半个文件
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    _logger.debug(f"Generated image variant {relative} ({len(data)} bytes)")
+    return directory, relative
+
+
+def purge_stale(dbname, max_age_days=30):
+    """删除超过 max_age_days 天未访问的变体文件，返回删除数量"""
+    directory = cache_dir(dbname)
+    if not os.path.isdir(directory):
+        return 0
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for root, _dirs, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+                if max(stat.st_atime, stat.st_mtime) < cutoff:
+                    os.unlink(path)
+                    removed += 1
+            except OSError:
+                continue
+    return removed
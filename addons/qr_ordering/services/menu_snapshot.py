@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# 菜单快照缓存 - (dbname, pos_config_id, lang) -> 序列化后的菜单
+#
+# 每次进入点餐页面 / 调用 /qr/api/init 都要搜索全部 POS 产品、计算含税价格并序列化。
+# 同一门店同一语言的菜单对所有顾客相同，这里在进程内缓存序列化结果。
+#
+# 失效策略：缓存条目带版本号。版本号保存在系统参数 qr_ordering.menu_version 中，
+# 产品 / 分类 / 标签 / 税 / POS 配置中影响菜单的字段被修改、记录被创建或删除时加一
+# （models/qr_menu_version.py）。系统参数由 ormcache 缓存，读取版本号不执行查询；
+# 修改时 Odoo 清除 ormcache 并通知其他 worker，它们下次读取时取得新版本号并重建。
+# TTL 作为兜底（例如 pricelist 等未纳入版本号的数据）。
+
+import threading
+import time
+from collections import OrderedDict
+
+SNAPSHOT_CACHE_SIZE = 256
+SNAPSHOT_TTL_SECONDS = 300
+
+MENU_VERSION_PARAM = 'qr_ordering.menu_version'
+
+
+def menu_version(env):
+    """菜单版本号（系统参数，ormcache 命中时不查询数据库）"""
+    return env['ir.config_parameter'].sudo().get_param(MENU_VERSION_PARAM, '0')
+
+
+def bump_menu_version(env):
+    """菜单版本号加一（随当前事务提交；并发修改时由 Odoo 重试）"""
+    params = env['ir.config_parameter'].sudo()
+    params.set_param(MENU_VERSION_PARAM, str(int(params.get_param(MENU_VERSION_PARAM, '0') or 0) + 1))
+
+
+class MenuSnapshotCache:
+    """进程内菜单快照缓存（值为只读，调用方不得修改）"""
+
+    def __init__(self, size=SNAPSHOT_CACHE_SIZE, ttl=SNAPSHOT_TTL_SECONDS):
+        self._entries = OrderedDict()
+        self._size = size
+        self._ttl = ttl
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            cached_version, cached_at, menu = entry
+            if cached_version != version or time.monotonic() - cached_at > self._ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return menu
+
+    def put(self, key, version, menu):
+        with self._lock:
+            self._entries[key] = (version, time.monotonic(), menu)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+menu_snapshot_cache = MenuSnapshotCache()
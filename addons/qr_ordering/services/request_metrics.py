@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+# 路由级请求指标 - 耗时、SQL 次数、SQL 耗时
+#
+# 用法：在 @http.route 下方加 @instrumented，每个请求结束时：
+# - 输出一行结构化日志（key=value，便于 grep / 日志平台解析）
+#   qr.request route=api_init trace_id=1a2b3c4d status=ok ms=38.2 sql=14 sql_ms=9.7
+#   慢请求（超过 SLOW_REQUEST_MS）和失败请求为 INFO，其余为 DEBUG（图片等高频路由不刷日志），
+#   需要全部输出时：--log-handler=odoo.addons.qr_ordering.services.request_metrics:DEBUG
+# - SQL 次数超过阈值时额外输出 WARNING（疑似 N+1）
+# - 累计到进程内统计，/qr/metrics 返回每个路由的次数、分位耗时、平均 SQL 次数
+#
+# SQL 次数和耗时来自 Odoo 在请求线程上维护的 query_count / query_time（包含本线程所有游标），
+# 不需要改动游标，也不额外执行查询。统计是每个 worker 进程各自的，跨进程汇总请使用日志。
+
+import functools
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+
+_logger = logging.getLogger(__name__)
+
+# 单个请求 SQL 次数超过该值时输出 N+1 警告
+SQL_WARN_THRESHOLD = 50
+# 超过该耗时的请求按 INFO 输出
+SLOW_REQUEST_MS = 500
+# 每个路由保留最近多少次请求的耗时（用于分位数）
+LATENCY_WINDOW = 512
+
+_local = threading.local()
+
+
+def new_trace_id():
+    return str(uuid.uuid4())[:8]
+
+
+def current_trace_id():
+    """当前请求的 trace_id（由 @instrumented 设置；不在请求中时生成新的）"""
+    return getattr(_local, 'trace_id', None) or new_trace_id()
+
+
+def active_trace_id():
+    """当前请求的 trace_id，不在 @instrumented 请求中时返回 None"""
+    return getattr(_local, 'trace_id', None)
+
+
+def _thread_sql_counters():
+    thread = threading.current_thread()
+    return getattr(thread, 'query_count', 0), getattr(thread, 'query_time', 0.0)
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class RouteStats:
+    """单个路由的累计统计"""
+
+    __slots__ = ('count', 'errors', 'total_ms', 'max_ms', 'total_sql', 'max_sql', 'total_sql_ms', 'n_plus_one', 'latencies')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.total_sql = 0
+        self.max_sql = 0
+        self.total_sql_ms = 0.0
+        self.n_plus_one = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def add(self, elapsed_ms, sql_count, sql_ms, error, flagged):
+        self.count += 1
+        self.errors += int(error)
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.total_sql += sql_count
+        self.max_sql = max(self.max_sql, sql_count)
+        self.total_sql_ms += sql_ms
+        self.n_plus_one += int(flagged)
+        self.latencies.append(elapsed_ms)
+
+    def as_dict(self):
+        latencies = sorted(self.latencies)
+        count = self.count or 1
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'avg_ms': round(self.total_ms / count, 2),
+            'p50_ms': round(_percentile(latencies, 0.50), 2),
+            'p95_ms': round(_percentile(latencies, 0.95), 2),
+            'p99_ms': round(_percentile(latencies, 0.99), 2),
+            'max_ms': round(self.max_ms, 2),
+            'avg_sql': round(self.total_sql / count, 2),
+            'max_sql': self.max_sql,
+            'avg_sql_ms': round(self.total_sql_ms / count, 2),
+            'n_plus_one': self.n_plus_one,
+        }
+
+
+class RequestMetrics:
+    """进程内路由统计"""
+
+    def __init__(self, sql_warn_threshold=SQL_WARN_THRESHOLD):
+        self.sql_warn_threshold = sql_warn_threshold
+        self._routes = {}
+        self._lock = threading.Lock()
+        self._started = time.time()
+
+    def record(self, route, trace_id, elapsed_ms, sql_count, sql_ms, error=False):
+        flagged = sql_count > self.sql_warn_threshold
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = RouteStats()
+            stats.add(elapsed_ms, sql_count, sql_ms, error, flagged)
+
+        level = logging.INFO if error or elapsed_ms > SLOW_REQUEST_MS else logging.DEBUG
+        _logger.log(
+            level,
+            "qr.request route=%s trace_id=%s status=%s ms=%.1f sql=%d sql_ms=%.1f",
+            route, trace_id, 'error' if error else 'ok', elapsed_ms, sql_count, sql_ms,
+        )
+        if flagged:
+            _logger.warning(
+                "qr.request.n_plus_one route=%s trace_id=%s sql=%d threshold=%d",
+                route, trace_id, sql_count, self.sql_warn_threshold,
+            )
+
+    def snapshot(self):
+        with self._lock:
+            routes = {route: stats.as_dict() for route, stats in self._routes.items()}
+        return {
+            'since': self._started,
+            'sql_warn_threshold': self.sql_warn_threshold,
+            'routes': routes,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self._started = time.time()
+
+
+request_metrics = RequestMetrics()
+
+
+def _is_error(result):
+    # API 路由返回 {'success': False, ...}；HTTP 路由按状态码判断
+    if isinstance(result, dict):
+        return result.get('success') is False
+    status = getattr(result, 'status_code', None)
+    return bool(status and status >= 500)
+
+
+def instrumented(func):
+    """
+    路由装饰器：记录耗时、SQL 次数和 SQL 耗时
+
+    放在 @http.route 下方。请求期间 current_trace_id() 返回同一个 trace_id，
+    与 API 响应中的 trace_id 和日志中的 [trace_id] 一致。
+    """
+    route = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        previous_trace_id = getattr(_local, 'trace_id', None)
+        trace_id = previous_trace_id or new_trace_id()
+        _local.trace_id = trace_id
+        sql_count_start, sql_time_start = _thread_sql_counters()
+        started = time.perf_counter()
+        error = True
+        try:
+            result = func(*args, **kwargs)
+            error = _is_error(result)
+            return result
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            sql_count_end, sql_time_end = _thread_sql_counters()
+            _local.trace_id = previous_trace_id
+            request_metrics.record(
+                route, trace_id, elapsed_ms,
+                sql_count_end - sql_count_start,
+                (sql_time_end - sql_time_start) * 1000,
+                error,
+            )
+
+    return wrapper
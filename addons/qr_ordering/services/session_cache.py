@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+# 扫码点餐会话缓存 - table_token -> 当前会话
+#
+# 每次 QR API 调用都要经过 qr.session.validate_access，原来每次都要按 qr_token
+# 查 qr.table、读取 current_session_id 再比较过期时间。这里用进程内 LRU 缓存
+# 命中时直接返回会话 ID，不访问数据库。
+#
+# 失效策略：
+# - 本进程：写入 qr.table / qr.session 时立即失效
+# - 跨 worker：事务提交后通过 postgres 库的连接发送 NOTIFY（与 bus.bus 相同），
+#   每个 worker 的监听线程在 postgres 库上 LISTEN，收到后失效对应条目（回滚时不发送）。
+#   NOTIFY 只投递给同一数据库上的监听者，所以不能在业务库的游标上发送
+# - 兜底：条目有 TTL，监听线程异常时最多陈旧 CACHE_TTL_SECONDS 秒
+
+import json
+import logging
+import os
+import select
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import partial
+
+_logger = logging.getLogger(__name__)
+
+CACHE_SIZE = 4096
+CACHE_TTL_SECONDS = 60
+NOTIFY_CHANNEL = 'qr_session_cache'
+LISTEN_TIMEOUT = 50
+
+CachedSession = namedtuple('CachedSession', [
+    'table_id', 'session_id', 'access_token', 'state', 'expire_time', 'cached_at',
+])
+
+
+class SessionCache:
+    """进程内会话缓存，键为 (dbname, table_token)"""
+
+    def __init__(self, size=CACHE_SIZE, ttl=CACHE_TTL_SECONDS):
+        self._entries = OrderedDict()
+        # 每个键的失效次数，用于丢弃失效之前计划的写入
+        self._generations = {}
+        self._size = size
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
+
+    def get(self, dbname, table_token, now):
+        """返回仍然有效的缓存会话，否则返回 None
+
+        Args:
+            now: 当前 UTC 时间（naive datetime，与 fields.Datetime 一致）
+        """
+        self._ensure_listener()
+        key = (dbname, table_token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry.cached_at > self._ttl or entry.expire_time < now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def generation(self, dbname, table_token):
+        return self._generations.get((dbname, table_token), 0)
+
+    def put(self, dbname, table_token, generation, table_id, session_id,
+            access_token, state, expire_time):
+        """缓存餐桌的当前会话（应在事务提交后调用）
+
+        Args:
+            generation: 计划写入时 generation() 的返回值；
+                之后若该键被失效过，则放弃写入
+        """
+        if not table_token or state == 'closed':
+            return
+        entry = CachedSession(
+            table_id=table_id,
+            session_id=session_id,
+            access_token=access_token,
+            state=state,
+            expire_time=expire_time,
+            cached_at=time.monotonic(),
+        )
+        key = (dbname, table_token)
+        with self._lock:
+            if self._generations.get(key, 0) != generation:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+
+    def discard(self, dbname, table_tokens):
+        """仅失效本进程的条目"""
+        with self._lock:
+            for token in table_tokens:
+                if token:
+                    key = (dbname, token)
+                    self._entries.pop(key, None)
+                    self._generations[key] = self._generations.get(key, 0) + 1
+
+    def invalidate(self, cr, table_tokens):
+        """失效本进程条目，并在事务提交后通知其他 worker"""
+        tokens = [t for t in set(table_tokens) if t]
+        if not tokens:
+            return
+        self.discard(cr.dbname, tokens)
+        # 同一事务中的失效合并为一条通知
+        pending = cr.postcommit.data.get(NOTIFY_CHANNEL)
+        if pending is None:
+            pending = cr.postcommit.data[NOTIFY_CHANNEL] = set()
+            cr.postcommit.add(partial(self._publish, cr.dbname, pending))
+        pending.update(tokens)
+
+    def _publish(self, dbname, tokens):
+        """在 postgres 库上发送失效通知（监听线程也在该库上 LISTEN）"""
+        from odoo.sql_db import db_connect
+
+        with db_connect('postgres').cursor() as cr:
+            cr.execute("SELECT pg_notify(%s, %s)", (
+                NOTIFY_CHANNEL,
+                json.dumps({'db': dbname, 'tokens': sorted(tokens)}),
+            ))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            # 同时作废所有已计划的写入
+            self._generations = {key: gen + 1 for key, gen in self._generations.items()}
+
+    # ==================== 跨 worker 监听 ====================
+
+    def _ensure_listener(self):
+        """每个进程启动一个监听线程（prefork 后 pid 变化会重新启动）"""
+        pid = os.getpid()
+        if self._listener_pid == pid:
+            return
+        with self._listener_lock:
+            if self._listener_pid == pid:
+                return
+            # fork 前的条目可能已过期，新进程从空缓存开始
+            self.clear()
+            thread = threading.Thread(
+                target=self._listen_loop,
+                name=f'{__name__}.listener',
+                daemon=True,
+            )
+            thread.start()
+            self._listener_pid = pid
+
+    def _listen_loop(self):
+        from odoo.sql_db import db_connect
+
+        while True:
+            try:
+                with db_connect('postgres').cursor() as cr:
+                    conn = cr._cnx
+                    cr.execute(f'LISTEN {NOTIFY_CHANNEL}')
+                    cr.commit()
+                    # 重连期间可能漏掉通知，清空本进程缓存
+                    self.clear()
+                    while True:
+                        if select.select([conn], [], [], LISTEN_TIMEOUT) == ([], [], []):
+                            continue
+                        conn.poll()
+                        while conn.notifies:
+                            self._handle_notification(conn.notifies.pop().payload)
+            except Exception:
+                _logger.exception("QR session cache listener failed, restarting in 5s")
+                self.clear()
+                time.sleep(5)
+
+    def _handle_notification(self, payload):
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            return
+        self.discard(data.get('db'), data.get('tokens') or [])
+
+
+session_cache = SessionCache()
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# 点餐页面静态资源 - 内容哈希 URL + CSS 压缩
+#
+# 原来页面用 ?v={版本号}-{进程启动时间} 做缓存刷新，每次重启 / worker 回收都会让所有顾客
+# 重新下载 JS / CSS。这里按文件内容计算哈希，生成 /qr/assets/{名称}.{哈希}.{扩展名}：
+# - 内容不变 URL 不变，可以 immutable 长期缓存，回访不再下载脚本
+# - 文件修改后哈希变化（按 mtime 检测，不需要重启），页面自动引用新 URL
+# - CSS 返回压缩后的内容；JS 原样返回（手写的 JS 压缩需要区分正则和除号，出错会导致点餐页白屏，
+#   由反向代理 gzip 压缩即可）
+
+import hashlib
+import os
+import re
+import threading
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static', 'src')
+
+# 扩展名 -> (目录, Content-Type)
+ASSET_TYPES = {
+    '.js': ('js', 'application/javascript; charset=utf-8'),
+    '.css': ('css', 'text/css; charset=utf-8'),
+}
+HASH_LENGTH = 12
+URL_PREFIX = '/qr/assets'
+
+_FILENAME_RE = re.compile(r'^(?P<stem>[\w-]+)\.(?P<hash>[0-9a-f]{%d})(?P<ext>\.\w+)$' % HASH_LENGTH)
+
+_CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+_CSS_SPACE_RE = re.compile(r'\s+')
+_CSS_PUNCT_RE = re.compile(r'\s*([{};])\s*')
+
+
+def minify_css(source):
+    """CSS 压缩：删除注释，合并空白，去掉 { } ; 两侧的空白"""
+    text = _CSS_COMMENT_RE.sub('', source)
+    text = _CSS_SPACE_RE.sub(' ', text)
+    text = _CSS_PUNCT_RE.sub(r'\1', text)
+    return text.replace(';}', '}').strip() + '\n'
+
+
+# 扩展名 -> 压缩函数（未列出的原样返回）
+MINIFIERS = {
+    '.css': minify_css,
+}
+
+
+class Asset:
+    """单个静态资源：源文件哈希 + 返回的内容"""
+
+    __slots__ = ('name', 'path', 'mtime', 'hash', 'content', 'content_type')
+
+    def __init__(self, name, path):
+        stem, ext = os.path.splitext(name)
+        with open(path, 'rb') as f:
+            source = f.read()
+        self.name = name
+        self.path = path
+        self.mtime = os.stat(path).st_mtime_ns
+        self.hash = hashlib.sha256(source).hexdigest()[:HASH_LENGTH]
+        minify = MINIFIERS.get(ext)
+        self.content = minify(source.decode('utf-8')).encode('utf-8') if minify else source
+        self.content_type = ASSET_TYPES[ext][1]
+
+    @property
+    def url(self):
+        stem, ext = os.path.splitext(self.name)
+        return f'{URL_PREFIX}/{stem}.{self.hash}{ext}'
+
+    @property
+    def source_url(self):
+        """未压缩的原文件（调试模式使用）"""
+        directory = ASSET_TYPES[os.path.splitext(self.name)[1]][0]
+        return f'/qr_ordering/static/src/{directory}/{self.name}?v={self.hash}'
+
+
+class AssetManifest:
+    """按需构建的资源清单，源文件 mtime 变化时重新构建"""
+
+    def __init__(self, static_dir=STATIC_DIR):
+        self._static_dir = static_dir
+        self._assets = {}
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        stem, ext = os.path.splitext(name)
+        if ext not in ASSET_TYPES or os.path.basename(name) != name:
+            return None
+        path = os.path.join(self._static_dir, ASSET_TYPES[ext][0], name)
+        return path if os.path.isfile(path) else None
+
+    def get(self, name):
+        """返回 Asset，文件不存在时返回 None"""
+        path = self._path(name)
+        if not path:
+            return None
+        mtime = os.stat(path).st_mtime_ns
+        asset = self._assets.get(name)
+        if asset is None or asset.mtime != mtime:
+            with self._lock:
+                asset = self._assets.get(name)
+                if asset is None or asset.mtime != mtime:
+                    asset = Asset(name, path)
+                    self._assets[name] = asset
+        return asset
+
+    def urls(self, names, debug=False):
+        """{名称: URL}，调试模式返回未压缩的原文件"""
+        result = {}
+        for name in names:
+            asset = self.get(name)
+            if asset:
+                result[name] = asset.source_url if debug else asset.url
+        return result
+
+    def resolve(self, filename):
+        """
+        解析 /qr/assets/ 下的文件名
+
+        Returns:
+            (asset, hash_matches)；无法识别时返回 (None, False)
+        """
+        match = _FILENAME_RE.match(filename or '')
+        if not match:
+            return None, False
+        asset = self.get(match['stem'] + match['ext'])
+        if not asset:
+            return None, False
+        return asset, asset.hash == match['hash']
+
+
+asset_manifest = AssetManifest()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# 请求级税率解析缓存
+#
+# 菜单序列化、购物车序列化和 POS 同步原来每一行都要重新执行
+# taxes.filtered(...)、fiscal_position.map_tax 和 compute_all。
+# TaxResolver 在一次请求内缓存：
+# - 每个产品映射后的税（每个产品只做一次 filtered + map_tax）
+# - 每组相同税的 map_tax 结果（不同产品共用同一组税时只映射一次）
+# - compute_all 结果，键为 (税, 单价, 数量)，相同税/价格/数量的行只计算一次
+#
+# 只在一次请求 / 一次同步调用内使用，不跨请求共享，税率配置修改后立即生效。
+
+
+class TaxResolver:
+    """按 (产品, 公司, 财务位置) 缓存税率解析结果"""
+
+    def __init__(self, company, fiscal_position=None, currency=None):
+        self.company = company
+        self.fiscal_position = fiscal_position
+        self.currency = currency
+        self._product_taxes = {}
+        self._mapped_taxes = {}
+        self._needs_product = {}
+        self._results = {}
+
+    @classmethod
+    def for_pos_config(cls, pos_config, currency=None):
+        """使用 POS 配置的公司和默认财务位置"""
+        return cls(pos_config.company_id, pos_config.default_fiscal_position_id, currency)
+
+    def prefetch(self, products):
+        """批量读取产品的税，避免逐个产品查询"""
+        products.mapped('taxes_id')
+        return self
+
+    def get_taxes(self, product):
+        """返回产品在当前公司/财务位置下的税"""
+        taxes = self._product_taxes.get(product.id)
+        if taxes is None:
+            taxes = product.taxes_id.filtered(lambda t: t.company_id == self.company)
+            if self.fiscal_position and taxes:
+                key = tuple(taxes.ids)
+                mapped = self._mapped_taxes.get(key)
+                if mapped is None:
+                    mapped = self.fiscal_position.map_tax(taxes)
+                    self._mapped_taxes[key] = mapped
+                taxes = mapped
+            self._product_taxes[product.id] = taxes
+        return taxes
+
+    def compute(self, product, price_unit, qty=1.0):
+        """
+        计算单行含税/不含税金额
+
+        Returns:
+            (taxes, total_excluded, total_included)
+        """
+        taxes = self.get_taxes(product)
+        if not taxes:
+            subtotal = price_unit * qty
+            return taxes, subtotal, subtotal
+
+        tax_key = tuple(taxes.ids)
+        # Python 代码税可能依赖产品，此时结果不能跨产品共用
+        product_key = product.id if self._depends_on_product(tax_key, taxes) else None
+        key = (tax_key, price_unit, qty, product_key)
+        result = self._results.get(key)
+        if result is None:
+            tax_result = taxes.compute_all(
+                price_unit,
+                currency=self.currency,
+                quantity=qty,
+                product=product,
+            )
+            result = (tax_result['total_excluded'], tax_result['total_included'])
+            self._results[key] = result
+        return (taxes,) + result
+
+    def compute_many(self, items):
+        """
+        批量计算多行金额，税/单价/数量相同的行共用一次 compute_all
+
+        Args:
+            items: 可迭代的 (product, price_unit, qty)
+
+        Returns:
+            list of (taxes, total_excluded, total_included)，顺序与输入一致
+        """
+        return [self.compute(product, price_unit, qty) for product, price_unit, qty in items]
+
+    def _depends_on_product(self, tax_key, taxes):
+        needs_product = self._needs_product.get(tax_key)
+        if needs_product is None:
+            all_taxes = taxes | taxes.mapped('children_tax_ids')
+            needs_product = 'code' in all_taxes.mapped('amount_type')
+            self._needs_product[tax_key] = needs_product
+        return needs_product
@@ -5,13 +5,21 @@ import { Component, useState, onMounted, onWillUnmount } from "@odoo/owl";
 import { rpc } from "@web/core/network/rpc";
 import { _t } from "@web/core/l10n/translation";
 
+// 没有 bus 推送时的轮询间隔
+const POLL_INTERVAL_MS = 2500;
+// 有 bus 推送时的兜底轮询间隔
+const PUSH_FALLBACK_POLL_MS = 30000;
+// 每次认领的最大任务数
+const CLAIM_BATCH_SIZE = 10;
+
 /**
  * POS 打印任务消费者
  * 
  * 功能：
- * 1. 轮询待打印任务
- * 2. 认领任务并调用 YLHC Recorder 打印
- * 3. 回写状态到 Odoo
+ * 1. 接收 bus 推送（QR_PRINT_JOB_AVAILABLE）后立即拉取待打印任务，
+ *    低频轮询仅作为断线兜底
+ * 2. 一次请求原子认领一批任务，调用 YLHC Recorder 打印
+ * 3. 一次请求批量回写状态到 Odoo
  * 4. 显示调试面板（debug=1）
  */
 export class PosPrintConsumer extends Component {
@@ -24,13 +32,19 @@ export class PosPrintConsumer extends Component {
             clientId: this._generateClientId(),
             ylhcRecorderUrl: null,
             ylhcRecorderToken: null,
+            isPushConnected: false,
         });
 
+        // 拉取中再次收到推送时，结束后再拉取一次，避免并发拉取
+        this._pollInFlight = false;
+        this._pollAgain = false;
+
         // 从系统参数或配置中获取 YLHC Recorder 信息
         this._loadYlhcConfig();
 
-        // 启动轮询
+        // 订阅新任务推送，然后启动兜底轮询
         this.pollInterval = null;
+        this._subscribeJobNotifications();
         this.startPolling();
 
         onMounted(() => {
@@ -86,6 +100,25 @@ export class PosPrintConsumer extends Component {
         }
     }
 
+    /**
+     * 订阅新打印任务的 bus 推送
+     */
+    _subscribeJobNotifications() {
+        const data = this.env.pos?.data;
+        if (!data?.connectWebSocket) {
+            console.warn('[POS Print Consumer] Bus not available, falling back to polling');
+            return;
+        }
+        data.connectWebSocket('QR_PRINT_JOB_AVAILABLE', (payload) => {
+            if (payload?.config_id && payload.config_id !== this.env.pos?.config?.id) {
+                return;
+            }
+            this._pollPendingJobs();
+        });
+        this.state.isPushConnected = true;
+        console.log('[POS Print Consumer] Subscribed to QR_PRINT_JOB_AVAILABLE');
+    }
+
     /**
      * 启动轮询
      */
@@ -96,15 +129,16 @@ export class PosPrintConsumer extends Component {
 
         this.state.isPolling = true;
         
-        // 立即执行一次
+        // 立即执行一次（处理启动前积压的任务）
         this._pollPendingJobs();
 
-        // 每 2-3 秒轮询一次
+        // 有推送时只需低频兜底（bus 断线重连期间可能漏掉通知）
+        const interval = this.state.isPushConnected ? PUSH_FALLBACK_POLL_MS : POLL_INTERVAL_MS;
         this.pollInterval = setInterval(() => {
             this._pollPendingJobs();
-        }, 2500);
+        }, interval);
 
-        console.log('[POS Print Consumer] Polling started');
+        console.log(`[POS Print Consumer] Polling started (${interval} ms)`);
     }
 
     /**
@@ -123,6 +157,11 @@ export class PosPrintConsumer extends Component {
      * 轮询待打印任务
      */
     async _pollPendingJobs() {
+        if (this._pollInFlight) {
+            this._pollAgain = true;
+            return;
+        }
+        this._pollInFlight = true;
         try {
             const posConfig = this.env.pos?.config;
             if (!posConfig) {
@@ -130,18 +169,38 @@ export class PosPrintConsumer extends Component {
                 return;
             }
 
-            // 调用 API 获取待打印任务
-            const result = await rpc("/pos/print_jobs/pending", {
+            // 一次请求原子认领一批任务（服务端 SKIP LOCKED，终端之间不会抢同一个任务）
+            const result = await rpc("/pos/print_jobs/claim_next", {
                 config_id: posConfig.id,
-                limit: 10
+                client_id: this.state.clientId,
+                max_jobs: CLAIM_BATCH_SIZE,
             });
 
             if (result.success && result.jobs && result.jobs.length > 0) {
-                console.log(`[POS Print Consumer] Found ${result.jobs.length} pending jobs`);
-                
-                // 处理每个任务
-                for (const jobData of result.jobs) {
-                    await this._processJob(jobData);
+                console.log(`[POS Print Consumer] Claimed ${result.jobs.length} jobs`);
+
+                const doneIds = [];
+                const failed = [];
+                for (const job of result.jobs) {
+                    const error = await this._processJob(job);
+                    if (error) {
+                        failed.push({ job_id: job.id, error_message: error });
+                    } else {
+                        doneIds.push(job.id);
+                    }
+                }
+
+                // 一次请求回写整批结果（失败任务由服务端按指数退避自动重试；
+                // 打印成功的打印机视为已恢复，服务端立即释放它退避中的任务并推送通知）
+                await rpc("/pos/print_jobs/mark_batch", {
+                    client_id: this.state.clientId,
+                    done_ids: doneIds,
+                    failed: failed,
+                });
+
+                // 一次没取完时继续拉取，不等下一次推送
+                if (result.jobs.length >= CLAIM_BATCH_SIZE) {
+                    this._pollAgain = true;
                 }
             }
 
@@ -151,59 +210,34 @@ export class PosPrintConsumer extends Component {
         } catch (error) {
             console.error('[POS Print Consumer] Poll error:', error);
             this.state.error = error.message || 'Poll failed';
+        } finally {
+            this._pollInFlight = false;
+            if (this._pollAgain) {
+                this._pollAgain = false;
+                this._pollPendingJobs();
+            }
         }
     }
 
     /**
-     * 处理单个打印任务
+     * 打印单个已认领的任务
+     *
+     * @param {Object} job - claim_next 返回的任务数据
+     * @returns {Promise<string|null>} - 失败时返回错误信息，成功返回 null
      */
-    async _processJob(jobData) {
+    async _processJob(job) {
         try {
-            console.log(`[POS Print Consumer] Processing job ${jobData.name}`);
-
-            // 1. 认领任务（原子操作）
-            const claimResult = await rpc("/pos/print_jobs/claim", {
-                job_id: jobData.id,
-                client_id: this.state.clientId
-            });
-
-            if (!claimResult.success) {
-                console.warn(`[POS Print Consumer] Failed to claim job ${jobData.name}: ${claimResult.message}`);
-                return; // 任务已被其他客户端认领
-            }
-
-            const claimedJob = claimResult.job;
-            console.log(`[POS Print Consumer] Job ${claimedJob.name} claimed successfully`);
-
-            // 2. 调用 YLHC Recorder 打印
-            const printSuccess = await this._callYlhcRecorder(claimedJob);
-
-            // 3. 回写状态
-            if (printSuccess) {
-                await rpc("/pos/print_jobs/mark_done", {
-                    job_id: claimedJob.id
-                });
-                console.log(`[POS Print Consumer] Job ${claimedJob.name} marked as done`);
-            } else {
-                await rpc("/pos/print_jobs/mark_failed", {
-                    job_id: claimedJob.id,
-                    error_message: 'YLHC Recorder print failed'
-                });
-                console.error(`[POS Print Consumer] Job ${claimedJob.name} marked as failed`);
+            console.log(`[POS Print Consumer] Processing job ${job.name}`);
+            const printSuccess = await this._callYlhcRecorder(job);
+            if (!printSuccess) {
+                console.error(`[POS Print Consumer] Job ${job.name} failed`);
+                return 'YLHC Recorder print failed';
             }
-
+            console.log(`[POS Print Consumer] Job ${job.name} printed`);
+            return null;
         } catch (error) {
-            console.error(`[POS Print Consumer] Failed to process job ${jobData.name}:`, error);
-            
-            // 标记失败
-            try {
-                await rpc("/pos/print_jobs/mark_failed", {
-                    job_id: jobData.id,
-                    error_message: error.message || 'Unknown error'
-                });
-            } catch (markError) {
-                console.error('[POS Print Consumer] Failed to mark job as failed:', markError);
-            }
+            console.error(`[POS Print Consumer] Failed to process job ${job.name}:`, error);
+            return error.message || 'Unknown error';
         }
     }
 
@@ -216,10 +250,11 @@ export class PosPrintConsumer extends Component {
     async _callYlhcRecorder(job) {
         try {
             const url = this.state.ylhcRecorderUrl;
-            const payload = job.print_payload;
+            // claim_next 返回未解析的 JSON 文本，直接作为请求体转发
+            const body = job.print_payload_raw ?? JSON.stringify(job.print_payload);
 
             console.log(`[POS Print Consumer] Calling YLHC Recorder: ${url}`);
-            console.log('[POS Print Consumer] Payload:', payload);
+            console.log(`[POS Print Consumer] Payload: ${body.length} chars`);
 
             // 准备请求头
             const headers = {
@@ -234,7 +269,7 @@ export class PosPrintConsumer extends Component {
             const response = await fetch(url, {
                 method: 'POST',
                 headers: headers,
-                body: JSON.stringify(payload),
+                body: body,
             });
 
             if (!response.ok) {
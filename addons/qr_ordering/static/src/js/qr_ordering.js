@@ -17,7 +17,10 @@
 
     // Build version marker (for debug panel and cache-busting verification)
     // This MUST be set before any other code runs so the boot guard can detect it
-    window.QR_ORDERING_BUILD = '2026-01-08T02:30';
+    // Build 号由页面 script 标签的 data-build 传入（与资源内容哈希对应）
+    window.QR_ORDERING_BUILD = (document.currentScript && document.currentScript.dataset.build) || 'dev';
+    // service worker 地址（系统参数关闭 PWA 时为空）
+    const SERVICE_WORKER_URL = (document.currentScript && document.currentScript.dataset.serviceWorker) || '';
 
     // ==================== 全局错误边界 ====================
     // 捕获所有未处理的错误，确保永不白屏
@@ -106,6 +109,8 @@
             add_to_cart: '加入',
             sold_out: '售罄',
             added: '已加入',
+            cart_queued: '网络不可用，已暂存，恢复后自动同步',
+            cart_synced: '购物车已同步',
             order_submitted: '下单成功',
             order_failed: '下单失败',
             cart_empty: '还没有选择菜品',
@@ -181,6 +186,8 @@
             add_to_cart: '追加',
             sold_out: '売り切れ',
             added: '追加しました',
+            cart_queued: 'オフラインのため一時保存しました。接続後に自動で同期します',
+            cart_synced: 'カートを同期しました',
             order_submitted: '注文しました',
             order_failed: '注文に失敗しました',
             cart_empty: 'まだ料理を選んでいません',
@@ -256,6 +263,8 @@
             add_to_cart: 'Add',
             sold_out: 'Sold Out',
             added: 'Added',
+            cart_queued: 'Offline: saved and will sync when reconnected',
+            cart_synced: 'Cart synced',
             order_submitted: 'Order Placed',
             order_failed: 'Order Failed',
             cart_empty: 'No items selected',
@@ -331,6 +340,7 @@
         selectedCategory: 'all',
         selectedProduct: null,
         isSubmitting: false, // 防止重复提交
+        submitIdempotencyKey: null, // 未收到响应的下单请求的幂等键（重试时复用）
     };
 
     // ==================== OverlayManager 单例管理器 ====================
@@ -478,6 +488,9 @@
         // Load data
         loadInitData();
 
+        // 离线缓存 + 购物车操作排队
+        setupServiceWorker();
+
         // Apply i18n
         applyI18n();
         
@@ -743,6 +756,13 @@
             loadMenu();
         });
 
+        // 页面切到后台时立即提交购物车队列
+        document.addEventListener('visibilitychange', () => {
+            if (document.visibilityState === 'hidden') {
+                flushCartOperations();
+            }
+        });
+
         // Search
         document.getElementById('qr-search-input')?.addEventListener('input', (e) => {
             filterProducts(e.target.value);
@@ -824,7 +844,11 @@
             if (state.accessToken) {
                 params.access_token = state.accessToken;
             }
-            
+            // 购物车操作带幂等键：离线排队后重放不会重复执行
+            if (endpoint.startsWith('cart/') && !params.idempotency_key) {
+                params.idempotency_key = newIdempotencyKey();
+            }
+
             const response = await fetch(`/qr/api/${endpoint}`, {
                 method: 'POST',
                 headers: {
@@ -848,9 +872,67 @@
         }
     }
 
+    function newIdempotencyKey() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`;
+    }
+
+    // ==================== Service Worker ====================
+    function setupServiceWorker() {
+        if (!('serviceWorker' in navigator) || !window.isSecureContext) return;
+
+        if (!SERVICE_WORKER_URL) {
+            // PWA 已关闭：注销之前注册的 service worker
+            navigator.serviceWorker.getRegistrations().then(registrations => {
+                registrations
+                    .filter(r => new URL(r.scope).pathname.startsWith('/qr/'))
+                    .forEach(r => r.unregister());
+            }).catch(() => {});
+            return;
+        }
+
+        navigator.serviceWorker.register(SERVICE_WORKER_URL, { scope: '/qr/' }).catch(error => {
+            console.warn('Service worker registration failed:', error);
+        });
+
+        // 排队的购物车操作重放完成后，以服务端购物车为准
+        navigator.serviceWorker.addEventListener('message', async (event) => {
+            if (event.data && event.data.type === 'qr-cart-replayed') {
+                await refreshCart();
+                updateCartUI();
+                renderCartItems();
+                showToast(t('cart_synced'));
+            }
+        });
+
+        // 不支持 Background Sync 的浏览器（iOS Safari）由页面通知重放
+        window.addEventListener('online', () => {
+            if (navigator.serviceWorker.controller) {
+                navigator.serviceWorker.controller.postMessage({ type: 'qr-replay' });
+            }
+        });
+    }
+
     // 加载超时设置（15秒）
     const LOAD_TIMEOUT_MS = 15000;
 
+    // 页面内嵌的初始化数据（只使用一次，之后刷新走 /qr/api/init）
+    function takeBootstrap() {
+        const el = document.getElementById('qr-bootstrap');
+        if (!el) {
+            return null;
+        }
+        el.remove();
+        try {
+            return JSON.parse(el.textContent);
+        } catch (error) {
+            console.error('Invalid bootstrap data:', error);
+            return null;
+        }
+    }
+
     async function loadInitData() {
         // 设置加载超时
         const timeoutId = setTimeout(() => {
@@ -866,7 +948,7 @@
                 return;
             }
 
-            const result = await apiCall('init');
+            const result = takeBootstrap() || await apiCall('init');
 
             // 清除超时计时器
             clearTimeout(timeoutId);
@@ -948,23 +1030,43 @@
         }
     }
 
+    function cartFromOrder(order) {
+        return order.lines.filter(l => l.state === 'pending').map(l => ({
+            lineId: l.id,
+            productId: l.product_id,
+            name: l.product_name,
+            qty: l.qty,
+            price: l.price_unit,
+            note: l.note,
+        }));
+    }
+
     async function addToCart(productId, qty, note) {
+        // 先提交队列中的操作，保证顺序
+        await flushCartOperations();
         try {
             const result = await apiCall('cart/add', {
                 product_id: productId,
                 qty: qty,
                 note: note,
             });
-            if (result.success) {
+            if (result.success && result.queued) {
+                // 离线排队：先在本地加入，网络恢复后以服务端为准
+                const product = state.products.find(p => p.id === productId) || {};
+                state.cart.push({
+                    lineId: null,
+                    productId: productId,
+                    name: product.name || '',
+                    qty: qty,
+                    price: product.price || 0,
+                    note: note,
+                });
+                updateCartUI();
+                showToast(t('cart_queued'));
+                return true;
+            } else if (result.success) {
                 // Update local cart from response
-                state.cart = result.data.lines.filter(l => l.state === 'pending').map(l => ({
-                    lineId: l.id,
-                    productId: l.product_id,
-                    name: l.product_name,
-                    qty: l.qty,
-                    price: l.price_unit,
-                    note: l.note,
-                }));
+                state.cart = cartFromOrder(result.data);
                 updateCartUI();
                 showToast(t('added'));
                 return true;
@@ -978,27 +1080,134 @@
         }
     }
 
-    async function updateCartItem(lineId, qty) {
+    // ==================== 购物车批量队列 ====================
+    // 连续点击 +/- 时不逐次请求：先本地更新界面，操作合并进队列，
+    // 停止点击 CART_BATCH_DELAY_MS 后一次性提交到 /qr/api/cart/batch
+    const CART_BATCH_DELAY_MS = 350;
+    const cartQueue = {
+        ops: [],
+        waiters: [],
+        timer: null,
+        inFlight: null,
+    };
+
+    function queueCartOperation(op) {
+        const last = cartQueue.ops[cartQueue.ops.length - 1];
+        if (last && op.op === 'add' && last.op === 'add' && last.product_id === op.product_id && !last.note && !op.note) {
+            last.qty += op.qty;
+        } else if (last && op.op === 'update' && last.op === 'update' && last.line_id === op.line_id) {
+            last.qty = op.qty;
+        } else {
+            cartQueue.ops.push(op);
+        }
+        clearTimeout(cartQueue.timer);
+        cartQueue.timer = setTimeout(flushCartOperations, CART_BATCH_DELAY_MS);
+        return new Promise(resolve => cartQueue.waiters.push(resolve));
+    }
+
+    async function flushCartOperations() {
+        clearTimeout(cartQueue.timer);
+        cartQueue.timer = null;
+        // 上一批未返回时等待，保证批次按顺序执行
+        while (cartQueue.inFlight) {
+            await cartQueue.inFlight;
+        }
+        if (cartQueue.ops.length === 0) return true;
+
+        const ops = cartQueue.ops;
+        const waiters = cartQueue.waiters;
+        cartQueue.ops = [];
+        cartQueue.waiters = [];
+
+        cartQueue.inFlight = (async () => {
+            let success = false;
+            try {
+                const result = await apiCall('cart/batch', { operations: ops });
+                success = !!(result && result.success);
+                if (success && result.queued) {
+                    // 离线排队：保留本地状态
+                    showToast(t('cart_queued'));
+                } else if (success) {
+                    // 期间又有新操作时，以下一批的返回为准，避免覆盖本地状态
+                    if (cartQueue.ops.length === 0) {
+                        state.cart = cartFromOrder(result.data);
+                    }
+                } else {
+                    showToast(result?.message || '更新失败');
+                    await refreshCart();
+                }
+            } catch (error) {
+                showToast('更新失败');
+                await refreshCart();
+            }
+            updateCartUI();
+            renderCartItems();
+            return success;
+        })();
+
+        const success = await cartQueue.inFlight;
+        cartQueue.inFlight = null;
+        waiters.forEach(resolve => resolve(success));
+        return success;
+    }
+
+    async function refreshCart() {
+        // 批量操作失败后从服务端重新加载购物车
         try {
-            const result = await apiCall('cart/update', {
-                line_id: lineId,
-                qty: qty,
-            });
-            if (result.success) {
-                state.cart = result.data.lines.filter(l => l.state === 'pending').map(l => ({
-                    lineId: l.id,
-                    productId: l.product_id,
-                    name: l.product_name,
-                    qty: l.qty,
-                    price: l.price_unit,
-                    note: l.note,
-                }));
-                updateCartUI();
-                renderCartItems();
+            const result = await apiCall('order/status');
+            if (result && result.success) {
+                const cartOrder = (result.data.orders || []).find(o => o.state === 'cart');
+                state.cart = cartOrder ? cartFromOrder(cartOrder) : [];
             }
         } catch (error) {
-            showToast('更新失败');
+            console.error('[refreshCart] Error:', error);
+        }
+    }
+
+    function quickAddToCart(productId) {
+        // 本地先 +1，请求合并后提交
+        const item = state.cart.find(i => i.productId === productId && !i.note);
+        if (item) {
+            item.qty += 1;
+        } else {
+            const product = state.products.find(p => p.id === productId) || {};
+            state.cart.push({
+                lineId: null,
+                productId: productId,
+                name: product.name || '',
+                qty: 1,
+                price: product.price || 0,
+                note: '',
+            });
+        }
+        updateCartUI();
+        showToast(t('added'));
+        return queueCartOperation({ op: 'add', product_id: productId, qty: 1 });
+    }
+
+    function updateCartItem(lineId, qty, productId) {
+        const item = lineId
+            ? state.cart.find(i => i.lineId === lineId)
+            : state.cart.find(i => !i.lineId && i.productId === productId);
+        if (!item) return Promise.resolve(false);
+
+        const delta = qty - item.qty;
+        if (qty <= 0) {
+            state.cart = state.cart.filter(i => i !== item);
+        } else {
+            item.qty = qty;
         }
+        updateCartUI();
+        renderCartItems();
+
+        if (!lineId) {
+            // 尚未同步到服务端的行（还没有 line_id），按菜品增减
+            return queueCartOperation({ op: 'add', product_id: productId, qty: delta });
+        }
+        if (qty <= 0) {
+            return queueCartOperation({ op: 'remove', line_id: lineId });
+        }
+        return queueCartOperation({ op: 'update', line_id: lineId, qty: qty });
     }
 
     async function submitOrder() {
@@ -1022,8 +1231,15 @@
         }
 
         try {
+            // 先提交尚未发送的购物车操作
+            if (!await flushCartOperations()) {
+                return;
+            }
             const note = document.getElementById('qr-cart-note')?.value || '';
-            const result = await apiCall('order/submit', { note });
+            // 幂等键在收到响应前保持不变：请求超时后重试不会重复下单
+            state.submitIdempotencyKey = state.submitIdempotencyKey || newIdempotencyKey();
+            const result = await apiCall('order/submit', { note, idempotency_key: state.submitIdempotencyKey });
+            state.submitIdempotencyKey = null;
 
             if (result.success) {
                 // P0-1: 下单成功后清空购物车
@@ -1211,9 +1427,9 @@
                         <div class="qr-cart-item-price">${t('currency')}${subtotal.toFixed(0)} <span class="qr-tax-hint">${t('tax_excluded')}</span></div>
                     </div>
                     <div class="qr-cart-item-qty">
-                        <button class="qr-cart-qty-btn" onclick="QrOrdering.updateCart(${item.lineId}, ${item.qty - 1})">-</button>
+                        <button class="qr-cart-qty-btn" onclick="QrOrdering.updateCart(${item.lineId}, ${item.qty - 1}, ${item.productId})">-</button>
                         <span>${item.qty}</span>
-                        <button class="qr-cart-qty-btn" onclick="QrOrdering.updateCart(${item.lineId}, ${item.qty + 1})">+</button>
+                        <button class="qr-cart-qty-btn" onclick="QrOrdering.updateCart(${item.lineId}, ${item.qty + 1}, ${item.productId})">+</button>
                     </div>
                 </div>
             `;
@@ -2016,7 +2232,7 @@
         },
 
         quickAdd(productId) {
-            addToCart(productId, 1, '');
+            quickAddToCart(productId);
         },
 
         changeQty(delta) {
@@ -2036,8 +2252,8 @@
             });
         },
 
-        updateCart(lineId, qty) {
-            updateCartItem(lineId, qty);
+        updateCart(lineId, qty, productId) {
+            updateCartItem(lineId, qty, productId);
         },
         
         filterHighlight() {
@@ -9,6 +9,8 @@
 
     // Build version
     window.QR_ORDERING_V2_BUILD = '2026-01-05T18:00';
+    // service worker 地址（系统参数关闭 PWA 时为空）
+    const SERVICE_WORKER_URL = (document.currentScript && document.currentScript.dataset.serviceWorker) || '';
 
     // ==================== State Management ====================
     const state = {
@@ -67,6 +69,9 @@
         // Load data
         loadInitData();
 
+        // 离线缓存 + 购物车操作排队
+        setupServiceWorker();
+
         // Dispatch ready event
         window.dispatchEvent(new Event('qr-v2-ready'));
         console.log('[QR V2] Initialized successfully');
@@ -142,6 +147,10 @@
 
     // ==================== API Calls ====================
     async function apiCall(endpoint, data = {}) {
+        // 购物车操作带幂等键：离线排队后重放不会重复执行
+        if (endpoint.startsWith('cart/') && !data.idempotency_key) {
+            data = { ...data, idempotency_key: newIdempotencyKey() };
+        }
         try {
             const response = await fetch(`/qr/api/${endpoint}`, {
                 method: 'POST',
@@ -174,8 +183,63 @@
         }
     }
 
+    function newIdempotencyKey() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`;
+    }
+
+    // ==================== Service Worker ====================
+    function setupServiceWorker() {
+        if (!('serviceWorker' in navigator) || !window.isSecureContext) return;
+
+        if (!SERVICE_WORKER_URL) {
+            // PWA 已关闭：注销之前注册的 service worker
+            navigator.serviceWorker.getRegistrations().then(registrations => {
+                registrations
+                    .filter(r => new URL(r.scope).pathname.startsWith('/qr/'))
+                    .forEach(r => r.unregister());
+            }).catch(() => {});
+            return;
+        }
+
+        navigator.serviceWorker.register(SERVICE_WORKER_URL, { scope: '/qr/' }).catch(error => {
+            console.warn('[QR V2] Service worker registration failed:', error);
+        });
+
+        // 排队的购物车操作重放完成后，以服务端购物车为准
+        navigator.serviceWorker.addEventListener('message', (event) => {
+            if (event.data && event.data.type === 'qr-cart-replayed') {
+                refreshCart();
+            }
+        });
+
+        // 不支持 Background Sync 的浏览器（iOS Safari）由页面通知重放
+        window.addEventListener('online', () => {
+            if (navigator.serviceWorker.controller) {
+                navigator.serviceWorker.controller.postMessage({ type: 'qr-replay' });
+            }
+        });
+    }
+
+    // 页面内嵌的初始化数据（只使用一次，之后刷新走 /qr/api/init）
+    function takeBootstrap() {
+        const el = document.getElementById('qr-bootstrap');
+        if (!el) {
+            return null;
+        }
+        el.remove();
+        try {
+            return JSON.parse(el.textContent);
+        } catch (error) {
+            console.error('Invalid bootstrap data:', error);
+            return null;
+        }
+    }
+
     async function loadInitData() {
-        const result = await apiCall('init', { lang: state.lang });
+        const result = takeBootstrap() || await apiCall('init', { lang: state.lang });
         
         if (result && result.success) {
             state.session = result.data.session;
@@ -534,14 +598,70 @@
     };
 
     // ==================== Cart ====================
-    async function addToCart(productId, qty, note) {
-        const result = await apiCall('cart/add', {
-            product_id: productId,
-            qty: qty,
-            note: note
-        });
+    // 连续点击步进器时先本地更新，合并后一次性提交到 /qr/api/cart/batch
+    const CART_BATCH_DELAY_MS = 350;
+    const cartQueue = {
+        deltas: new Map(),  // "productId|note" -> { productId, note, qty: 累计数量变化 }
+        timer: null,
+        inFlight: null,
+    };
 
-        if (result && result.success) {
+    function addToCart(productId, qty, note) {
+        note = note || '';
+        // 与服务端一致：无备注时累加到已有行，有备注时新增一行
+        const item = note ? null : state.cart.find(i => i.productId === productId);
+        if (item) {
+            item.qty += qty;
+            if (item.qty <= 0) {
+                state.cart = state.cart.filter(i => i !== item);
+            }
+        } else if (qty > 0) {
+            const product = state.menu.products.find(p => p.id === productId) || {};
+            state.cart.push({
+                productId: productId,
+                name: product.name || '',
+                price: product.price || 0,
+                qty: qty,
+                note: note
+            });
+        }
+
+        updateCartUI();
+        renderProductGrid();
+        updateCarouselSteppers();
+
+        const key = `${productId}|${note}`;
+        const pending = cartQueue.deltas.get(key) || { productId: productId, note: note, qty: 0 };
+        pending.qty += qty;
+        cartQueue.deltas.set(key, pending);
+        clearTimeout(cartQueue.timer);
+        cartQueue.timer = setTimeout(flushCartOperations, CART_BATCH_DELAY_MS);
+    }
+
+    async function flushCartOperations() {
+        clearTimeout(cartQueue.timer);
+        cartQueue.timer = null;
+        while (cartQueue.inFlight) {
+            await cartQueue.inFlight;
+        }
+        const operations = [];
+        cartQueue.deltas.forEach(pending => {
+            if (pending.qty !== 0) {
+                operations.push({ op: 'add', product_id: pending.productId, qty: pending.qty, note: pending.note });
+            }
+        });
+        cartQueue.deltas.clear();
+        if (operations.length === 0) return true;
+
+        cartQueue.inFlight = apiCall('cart/batch', { operations: operations });
+        const result = await cartQueue.inFlight;
+        cartQueue.inFlight = null;
+
+        if (result && result.queued) {
+            // 离线排队：保留本地状态，网络恢复后以服务端为准
+            showToast('网络不可用，已暂存，恢复后自动同步');
+        } else if (result && result.success && cartQueue.deltas.size === 0) {
+            // 期间又有新操作时，以下一批的返回为准
             const order = result.data;
             state.cart = order.lines.map(line => ({
                 productId: line.product_id,
@@ -554,7 +674,32 @@
             updateCartUI();
             renderProductGrid();
             updateCarouselSteppers();
+        } else if (!result || !result.success) {
+            // 这批操作没有生效（网络错误或服务端拒绝），本地购物车已不可信，以服务端为准
+            if (result) {
+                showToast(result.message || '更新失败');
+            }
+            await refreshCart();
         }
+        return !!(result && result.success);
+    }
+
+    async function refreshCart() {
+        // 离线操作重放后从服务端重新加载购物车
+        const result = await apiCall('order/status');
+        if (!result || !result.success || cartQueue.deltas.size > 0) return;
+        const cartOrder = (result.data.orders || []).find(o => o.state === 'cart');
+        state.cart = cartOrder ? cartOrder.lines.map(line => ({
+            productId: line.product_id,
+            name: line.product_name,
+            price: line.price_unit,
+            qty: line.qty,
+            note: line.note || ''
+        })) : [];
+
+        updateCartUI();
+        renderProductGrid();
+        updateCarouselSteppers();
     }
 
     function updateCartUI() {
@@ -715,6 +860,11 @@
             return;
         }
 
+        // 先提交尚未发送的购物车操作
+        if (!await flushCartOperations()) {
+            return;
+        }
+
         const result = await apiCall('cart/submit');
         
         if (result && result.success) {
@@ -0,0 +1,312 @@
+/**
+ * QR Ordering - Service Worker
+ * 由 /qr/sw.js 提供，作用域 /qr/
+ *
+ * - /qr/assets/*（内容哈希 URL，内容不变）：缓存优先
+ * - /qr/image/product/*：先返回缓存，后台更新
+ * - /qr/order/<token> 页面、/qr/api/init、/qr/api/menu：网络优先，离线时使用缓存
+ * - /qr/api/cart/*：离线时写入 IndexedDB 队列并返回 { queued: true }，网络恢复后按顺序重放
+ *   （请求自带幂等键，服务端已执行过的操作重放时不会重复执行）
+ * - 下单接口：先重放队列，仍然离线时返回 OFFLINE（下单不排队）
+ */
+
+'use strict';
+
+const CACHE_VERSION = 'v1';
+const SHELL_CACHE = `qr-shell-${CACHE_VERSION}`;
+const IMAGE_CACHE = `qr-images-${CACHE_VERSION}`;
+const DATA_CACHE = `qr-data-${CACHE_VERSION}`;
+const CURRENT_CACHES = [SHELL_CACHE, IMAGE_CACHE, DATA_CACHE];
+
+const MAX_SHELL_ENTRIES = 30;
+const MAX_IMAGE_ENTRIES = 300;
+const MAX_DATA_ENTRIES = 20;
+
+const DB_NAME = 'qr-ordering';
+const QUEUE_STORE = 'cart-queue';
+const SYNC_TAG = 'qr-cart-replay';
+
+const SUBMIT_PATHS = ['/qr/api/order/submit', '/qr/api/order/add_items', '/qr/api/cart/submit'];
+const DATA_PATHS = ['/qr/api/init', '/qr/api/menu'];
+
+// ==================== 生命周期 ====================
+
+self.addEventListener('install', () => {
+    self.skipWaiting();
+});
+
+self.addEventListener('activate', (event) => {
+    event.waitUntil((async () => {
+        const names = await caches.keys();
+        await Promise.all(
+            names.filter(name => name.startsWith('qr-') && !CURRENT_CACHES.includes(name))
+                .map(name => caches.delete(name))
+        );
+        await self.clients.claim();
+    })());
+});
+
+self.addEventListener('sync', (event) => {
+    if (event.tag === SYNC_TAG) {
+        // 仍然离线时抛出，浏览器稍后再次触发
+        event.waitUntil(replayQueue().then(done => {
+            if (!done) throw new Error('offline');
+        }));
+    }
+});
+
+self.addEventListener('message', (event) => {
+    // 页面收到 online 事件时通知重放（不支持 Background Sync 的浏览器，如 iOS Safari）
+    if (event.data && event.data.type === 'qr-replay') {
+        event.waitUntil(replayQueue());
+    }
+});
+
+// ==================== 请求路由 ====================
+
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    const url = new URL(request.url);
+    if (url.origin !== self.location.origin) return;
+    const path = url.pathname;
+
+    if (request.method === 'GET') {
+        if (path.startsWith('/qr/assets/')) {
+            event.respondWith(cacheFirst(request, SHELL_CACHE, MAX_SHELL_ENTRIES));
+        } else if (path.startsWith('/qr/image/product/')) {
+            event.respondWith(staleWhileRevalidate(event, IMAGE_CACHE, MAX_IMAGE_ENTRIES));
+        } else if (path.startsWith('/qr/order/') && request.mode === 'navigate') {
+            event.respondWith(networkFirst(request, request, SHELL_CACHE, MAX_SHELL_ENTRIES));
+        }
+        return;
+    }
+
+    if (request.method !== 'POST') return;
+    if (SUBMIT_PATHS.includes(path)) {
+        event.respondWith(handleSubmit(request));
+    } else if (path.startsWith('/qr/api/cart/')) {
+        event.respondWith(handleCartOperation(request));
+    } else if (DATA_PATHS.includes(path)) {
+        event.respondWith(handleData(request, path));
+    }
+});
+
+// ==================== 缓存策略 ====================
+
+function isCacheable(response) {
+    return response && response.ok && !response.redirected;
+}
+
+async function trimCache(cache, maxEntries) {
+    const keys = await cache.keys();
+    // keys() 按写入顺序返回，删除最早的条目
+    for (let i = 0; i < keys.length - maxEntries; i++) {
+        await cache.delete(keys[i]);
+    }
+}
+
+async function cacheFirst(request, cacheName, maxEntries) {
+    const cache = await caches.open(cacheName);
+    const cached = await cache.match(request);
+    if (cached) return cached;
+
+    const response = await fetch(request);
+    if (isCacheable(response)) {
+        await cache.put(request, response.clone());
+        trimCache(cache, maxEntries);
+    }
+    return response;
+}
+
+async function staleWhileRevalidate(event, cacheName, maxEntries) {
+    const request = event.request;
+    const cache = await caches.open(cacheName);
+    const cached = await cache.match(request);
+    const update = fetch(request).then(async (response) => {
+        if (isCacheable(response)) {
+            await cache.put(request, response.clone());
+            await trimCache(cache, maxEntries);
+        }
+        return response;
+    });
+    if (cached) {
+        event.waitUntil(update.catch(() => null));
+        return cached;
+    }
+    return update;
+}
+
+async function networkFirst(request, cacheKey, cacheName, maxEntries) {
+    const cache = await caches.open(cacheName);
+    try {
+        const response = await fetch(request);
+        if (isCacheable(response)) {
+            await cache.put(cacheKey, response.clone());
+            trimCache(cache, maxEntries);
+        }
+        return response;
+    } catch (error) {
+        const cached = await cache.match(cacheKey);
+        if (cached) return cached;
+        throw error;
+    }
+}
+
+// ==================== 菜单数据 ====================
+
+async function handleData(request, path) {
+    // POST 请求不能直接作为缓存键，按 (接口, 餐桌, 语言) 生成 GET 键
+    let params = {};
+    try {
+        params = (await request.clone().json()).params || {};
+    } catch (error) {
+        // 无法解析时按空参数处理
+    }
+    const query = new URLSearchParams({ table: params.table_token || '', lang: params.lang || '' });
+    const cacheKey = new Request(`${path}?${query}`);
+    const cache = await caches.open(DATA_CACHE);
+
+    try {
+        const response = await fetch(request);
+        if (response.ok) {
+            const text = await response.clone().text();
+            // 只缓存成功的结果（会话过期等错误不缓存）
+            const data = JSON.parse(text);
+            if (data.result && data.result.success) {
+                await cache.put(cacheKey, new Response(text, {
+                    headers: { 'Content-Type': 'application/json' },
+                }));
+                trimCache(cache, MAX_DATA_ENTRIES);
+            }
+        }
+        return response;
+    } catch (error) {
+        const cached = await cache.match(cacheKey);
+        if (cached) return cached;
+        throw error;
+    }
+}
+
+// ==================== 购物车离线队列 ====================
+
+function jsonRpcResult(result) {
+    return new Response(JSON.stringify({ jsonrpc: '2.0', id: null, result: result }), {
+        headers: { 'Content-Type': 'application/json' },
+    });
+}
+
+function openQueueDb() {
+    return new Promise((resolve, reject) => {
+        const request = indexedDB.open(DB_NAME, 1);
+        request.onupgradeneeded = () => {
+            request.result.createObjectStore(QUEUE_STORE, { keyPath: 'id', autoIncrement: true });
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+async function queueTransaction(mode, operation) {
+    const db = await openQueueDb();
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(QUEUE_STORE, mode);
+        const request = operation(tx.objectStore(QUEUE_STORE));
+        tx.oncomplete = () => {
+            db.close();
+            resolve(request.result);
+        };
+        tx.onerror = () => {
+            db.close();
+            reject(tx.error);
+        };
+    });
+}
+
+function enqueue(entry) {
+    return queueTransaction('readwrite', store => store.add(entry));
+}
+
+function listQueue() {
+    return queueTransaction('readonly', store => store.getAll());
+}
+
+function dequeue(id) {
+    return queueTransaction('readwrite', store => store.delete(id));
+}
+
+async function notifyClients(message) {
+    const clients = await self.clients.matchAll({ type: 'window' });
+    clients.forEach(client => client.postMessage(message));
+}
+
+// 重放串行执行，新操作排在已排队的操作之后
+let replayChain = Promise.resolve(true);
+
+function replayQueue() {
+    replayChain = replayChain.then(drainQueue, drainQueue);
+    return replayChain;
+}
+
+/**
+ * 按顺序重放队列中的请求
+ * @returns {Promise<boolean>} 队列已清空返回 true，仍然离线返回 false
+ */
+async function drainQueue() {
+    const entries = await listQueue();
+    if (entries.length === 0) return true;
+
+    let replayed = 0;
+    for (const entry of entries) {
+        let response;
+        try {
+            response = await fetch(entry.url, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: entry.body,
+                credentials: 'same-origin',
+            });
+        } catch (error) {
+            break;
+        }
+        // 网关错误（服务重启中）视为离线，保留在队列中
+        if (response.status >= 500) break;
+        // 其他响应说明服务端已处理：成功的由幂等键去重，失败的（如菜品已提交）不再重试
+        await dequeue(entry.id);
+        replayed += 1;
+    }
+
+    if (replayed) {
+        await notifyClients({ type: 'qr-cart-replayed', count: replayed });
+    }
+    return replayed === entries.length;
+}
+
+async function handleCartOperation(request) {
+    const body = await request.clone().text();
+    if (await replayQueue()) {
+        try {
+            const response = await fetch(request);
+            if (response.status < 500) return response;
+        } catch (error) {
+            // 离线，加入队列
+        }
+    }
+
+    await enqueue({ url: request.url, body: body, created: Date.now() });
+    if (self.registration.sync) {
+        self.registration.sync.register(SYNC_TAG).catch(() => null);
+    }
+    return jsonRpcResult({ success: true, queued: true });
+}
+
+async function handleSubmit(request) {
+    // 下单前必须先把排队的购物车操作同步到服务端
+    if (!await replayQueue()) {
+        return jsonRpcResult({
+            success: false,
+            error: 'OFFLINE',
+            message: '网络不可用，购物车已暂存，请恢复网络后再下单',
+        });
+    }
+    return fetch(request);
+}
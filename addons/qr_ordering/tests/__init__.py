@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+
+from . import test_escpos_renderer
+from . import test_idempotency_key
+from . import test_kitchen_dispatch
+from . import test_menu_version
+from . import test_pos_print_job
+from . import test_printer_routing
+from . import test_session_cache
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+from odoo.addons.point_of_sale.tests.common import TestPoSCommon
+
+
+class QrOrderingCommon(TestPoSCommon):
+    """QR 点餐测试公共数据：POS 配置、QR 餐桌和点餐会话"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.qr_table = cls.env['qr.table'].create({
+            'name': 'QR-T1',
+            'pos_config_id': cls.basic_config.id,
+        })
+        cls.qr_session = cls.env['qr.session'].create({
+            'table_id': cls.qr_table.id,
+        })
+
+    def setUp(self):
+        super().setUp()
+        self.config = self.basic_config
+
+    def _create_pos_order(self):
+        """在当前 POS 会话中创建一个空的 POS 订单（没有开启的会话时先开启）"""
+        pos_session = self.config.current_session_id or self.open_new_session()
+        return self.env['pos.order'].create({
+            'session_id': pos_session.id,
+            'amount_tax': 0.0,
+            'amount_total': 0.0,
+            'amount_paid': 0.0,
+            'amount_return': 0.0,
+        })
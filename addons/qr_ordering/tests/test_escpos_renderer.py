@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import tagged
+from odoo.tests.common import BaseCase
+
+from ..services import escpos_layout
+from ..services.escpos_renderer import KitchenTicket, TicketLine, get_ticket_template
+
+
+@tagged('post_install', '-at_install')
+class TestEscposRenderer(BaseCase):
+    """厨房单字节输出与 POS KDS (OrderChangePrint.vue) 原格式一致"""
+
+    def _ticket(self, **values):
+        return KitchenTicket(**dict({
+            'change_name': 'Order-001',
+            'order_uid': 'Order 00012-001-0001',
+            'table_name': 'A1',
+            'order_time': '12:34',
+            'customer_lines': [],
+            'address_lines': [],
+            'canceled': [],
+            'ordered': [],
+        }, **values))
+
+    def test_gbk_ticket_bytes(self):
+        ticket = self._ticket(table_name='包间1', ordered=[
+            TicketLine(qty=2, name='麻婆豆腐', types=['大份'], note='少辣'),
+            TicketLine(qty=1, name='Café au lait', types=[], note=''),
+        ])
+        expected = b''.join([
+            b'\x1b@', b'\x1bR\x0f', b'\x1ba\x01', b'\x1d!\x00', b'\x1bE\x01',
+            b'Order-001\n', b'Order 00012-001-0001\n',
+            b'\x1bE\x00', b'\x1ba\x00', b'\x1d!\x30', b'\x1bE\x01',
+            # 双倍宽度下 16 列：「包间1」占 5 列，「12:34」占 5 列
+            '包间1      12:34\n'.encode('gbk'),
+            b'\x1d!\x00', b'\x1bE\x00',
+            b'\n', b'\x1ba\x01', b'\x1bE\x01', b'ORDERED\n', b'\x1bE\x00', b'\x1ba\x00',
+            b'\x1d!\x10', '2   麻婆豆腐\n'.encode('gbk'), b'\x1d!\x00',
+            'TYPE: 大份\n'.encode('gbk'), 'NOTE: 少辣\n'.encode('gbk'),
+            b'\x1d!\x10', '1   Café au lait\n'.encode('gbk', errors='replace'), b'\x1d!\x00',
+            b'\x1bd\x03', b'\x1dV\x01',
+        ])
+        self.assertEqual(get_ticket_template('gbk', escpos_layout.DEFAULT_COLUMNS).render(ticket), expected)
+
+    def test_sections_follow_pos_order(self):
+        ticket = self._ticket(
+            customer_lines=['Taro', '090-0000-0000'],
+            address_lines=['Chuo 1-1'],
+            canceled=[TicketLine(qty=1, name='Gyoza', types=[], note='')],
+            ordered=[TicketLine(qty=1, name='Ramen', types=[], note='')],
+        )
+        rendered = get_ticket_template('gbk', 32).render(ticket)
+        positions = [rendered.index(title) for title in (
+            b'CUSTOMER DETAILS\n', b'Taro\n', b'DELIVERY ADDRESS\n', b'Chuo 1-1\n',
+            b'CANCELED\n', b'1   Gyoza\n', b'ORDERED\n', b'1   Ramen\n',
+        )]
+        self.assertEqual(positions, sorted(positions))
+
+    def test_shift_jis_init_and_paper_width(self):
+        ticket = self._ticket(table_name='テーブル3')
+        rendered = get_ticket_template('shift_jis', escpos_layout.columns_for_paper('80mm')).render(ticket)
+        self.assertTrue(rendered.startswith(b'\x1b@\x1bR\x08\x1cC\x01\x1c&'))
+        # 80mm 纸双倍宽度下 24 列：「テーブル3」占 9 列
+        self.assertIn('テーブル3' + ' ' * 10 + '12:34\n', rendered.decode('shift_jis'))
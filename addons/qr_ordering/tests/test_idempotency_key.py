@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import tagged
+
+from .common import QrOrderingCommon
+
+
+@tagged('post_install', '-at_install')
+class TestIdempotencyKey(QrOrderingCommon):
+    """幂等键：重放返回保存的响应，失败后同一个键可以重试"""
+
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+
+    def _run(self, key, result=None, error=None):
+        def func():
+            self.calls.append(key)
+            if error:
+                raise error
+            return dict(result or {'success': True, 'data': {'call': len(self.calls)}})
+        return self.env['qr.idempotency.key']._run(self.qr_session, key, 'cart/add', func)
+
+    def test_replay_returns_stored_response(self):
+        first = self._run('key-1')
+        self.assertEqual(first, {'success': True, 'data': {'call': 1}})
+
+        replay = self._run('key-1')
+        self.assertEqual(self.calls, ['key-1'], "a replay must not run the operation again")
+        self.assertEqual(replay, {'success': True, 'data': {'call': 1}, 'replayed': True})
+
+    def test_failed_call_releases_key(self):
+        failed = self._run('key-1', result={'success': False, 'error': 'PRODUCT_UNAVAILABLE'})
+        self.assertEqual(failed['error'], 'PRODUCT_UNAVAILABLE')
+
+        retried = self._run('key-1')
+        self.assertEqual(len(self.calls), 2)
+        self.assertTrue(retried['success'])
+        self.assertNotIn('replayed', retried)
+
+    def test_exception_releases_key(self):
+        with self.assertRaises(ValueError):
+            self._run('key-1', error=ValueError('boom'))
+
+        retried = self._run('key-1')
+        self.assertEqual(len(self.calls), 2)
+        self.assertTrue(retried['success'])
+
+    def test_claim_without_stored_response_is_in_progress(self):
+        key_id, stored = self.env['qr.idempotency.key']._claim(self.qr_session.id, 'key-1', 'cart/add')
+        self.assertTrue(key_id)
+        self.assertIsNone(stored)
+
+        result = self._run('key-1')
+        self.assertEqual(result['error'], 'REQUEST_IN_PROGRESS')
+        self.assertFalse(self.calls)
+
+    def test_without_key_always_runs(self):
+        self._run(None)
+        self._run(None)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_invalid_key_is_rejected(self):
+        result = self._run('x' * 65)
+        self.assertEqual(result['error'], 'INVALID_IDEMPOTENCY_KEY')
+        self.assertFalse(self.calls)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.tests import tagged
+from odoo.tools import mute_logger
+
+from ..models.qr_kitchen_dispatch import MAX_ATTEMPTS, QrKitchenDispatch
+from .common import QrOrderingCommon
+
+DISPATCH_LOGGER = 'odoo.addons.qr_ordering.models.qr_kitchen_dispatch'
+
+
+@tagged('post_install', '-at_install')
+class TestKitchenDispatch(QrOrderingCommon):
+    """厨房分发队列：同一订单按顺序处理、失败退避、cron 不可用时同步处理"""
+
+    def setUp(self):
+        super().setUp()
+        self.Dispatch = self.env['qr.kitchen.dispatch']
+        self.pos_order = self._create_pos_order()
+        self.cron = self.env.ref('qr_ordering.ir_cron_kitchen_dispatch')
+
+    def _qr_order(self):
+        return self.env['qr.order'].create({'session_id': self.qr_session.id})
+
+    def _job(self, qr_order, **vals):
+        return self.Dispatch.create(dict({
+            'qr_order_id': qr_order.id,
+            'pos_order_id': self.pos_order.id,
+        }, **vals))
+
+    def test_claim_next_keeps_per_order_sequence(self):
+        order_a, order_b = self._qr_order(), self._qr_order()
+        retrying = self._job(order_a, next_attempt_at=fields.Datetime.now() + timedelta(hours=1))
+        later = self._job(order_a)
+        other = self._job(order_b)
+
+        # order_a 的第一条任务还在等待重试，后一条不能先处理；其他订单不受影响
+        self.assertEqual(self.Dispatch._claim_next(), other)
+        other.state = 'done'
+        self.assertFalse(self.Dispatch._claim_next())
+
+        retrying.next_attempt_at = False
+        self.assertEqual(self.Dispatch._claim_next(), retrying)
+        retrying.state = 'done'
+        self.assertEqual(self.Dispatch._claim_next(), later)
+
+    @mute_logger(DISPATCH_LOGGER)
+    def test_failed_dispatch_backs_off_then_fails(self):
+        job = self._job(self._qr_order())
+        with patch.object(QrKitchenDispatch, '_dispatch', side_effect=Exception('printer offline')):
+            job._process()
+            self.assertEqual(job.state, 'pending')
+            self.assertEqual(job.attempt_count, 1)
+            self.assertEqual(job.error_message, 'printer offline')
+            self.assertGreater(job.next_attempt_at, fields.Datetime.now())
+
+            for _attempt in range(MAX_ATTEMPTS - 1):
+                job._process()
+
+        self.assertEqual(job.state, 'failed')
+        self.assertEqual(job.attempt_count, MAX_ATTEMPTS)
+
+    def test_enqueue_defers_to_active_cron(self):
+        with patch.object(QrKitchenDispatch, '_dispatch', autospec=True) as dispatch:
+            job = self.Dispatch._enqueue(self._qr_order(), self.pos_order)
+        dispatch.assert_not_called()
+        self.assertEqual(job.state, 'pending')
+
+    @mute_logger(DISPATCH_LOGGER)
+    def test_enqueue_dispatches_inline_without_cron(self):
+        self.cron.active = False
+        with patch.object(QrKitchenDispatch, '_dispatch', autospec=True) as dispatch:
+            job = self.Dispatch._enqueue(self._qr_order(), self.pos_order)
+        dispatch.assert_called_once_with(job)
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(job.attempt_count, 1)
+
+    @mute_logger(DISPATCH_LOGGER)
+    def test_inline_failure_keeps_job_for_retry(self):
+        self.cron.active = False
+        with patch.object(QrKitchenDispatch, '_dispatch', side_effect=Exception('KDS unavailable')):
+            job = self.Dispatch._enqueue(self._qr_order(), self.pos_order)
+        self.assertEqual(job.state, 'pending')
+        self.assertEqual(job.attempt_count, 1)
+        self.assertEqual(job.error_message, 'KDS unavailable')
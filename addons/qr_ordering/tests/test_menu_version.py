@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import TransactionCase, tagged
+
+from ..services.menu_snapshot import menu_version
+
+
+@tagged('post_install', '-at_install')
+class TestMenuVersion(TransactionCase):
+    """菜单版本号：菜单读取的数据变化时增加，无关字段的写入不变"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.product = cls.env['product.product'].create({
+            'name': 'QR Noodles',
+            'available_in_pos': True,
+            'list_price': 12.0,
+        })
+
+    def assertVersionBumped(self, before):
+        self.assertNotEqual(menu_version(self.env), before)
+
+    def test_menu_field_write_bumps_version(self):
+        before = menu_version(self.env)
+        self.product.product_tmpl_id.qr_sold_out = True
+        self.assertVersionBumped(before)
+
+    def test_unrelated_write_keeps_version(self):
+        before = menu_version(self.env)
+        self.product.default_code = 'QR-NOODLES'
+        self.assertEqual(menu_version(self.env), before)
+
+    def test_unlink_bumps_version(self):
+        tag = self.env['qr.product.tag'].create({'name': 'Spicy'})
+        before = menu_version(self.env)
+        tag.unlink()
+        self.assertVersionBumped(before)
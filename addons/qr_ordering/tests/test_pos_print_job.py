@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta
+
+from odoo import fields
+from odoo.tests import tagged
+
+from .common import QrOrderingCommon
+
+
+@tagged('post_install', '-at_install')
+class TestPosPrintJobQueue(QrOrderingCommon):
+    """打印任务队列：批量认领、租约回收、退避重试、按终端回写结果"""
+
+    def _job(self, printer_name='kitchen_printer'):
+        return self.env['pos.print.job'].create({
+            'pos_config_id': self.config.id,
+            'print_payload': '{}',
+            'printer_name': printer_name,
+        })
+
+    def _claim(self, client_id, max_jobs=10):
+        return self.env['pos.print.job'].claim_next(self.config.id, client_id, max_jobs=max_jobs)
+
+    def _expire_lease(self, jobs):
+        """把认领时间提前到租约之外（模拟认领终端崩溃）"""
+        lease = self.env['pos.print.job']._get_lease_seconds()
+        self.env.cr.execute("""
+            UPDATE pos_print_job
+            SET claimed_at = claimed_at - make_interval(secs => %s + 60)
+            WHERE id IN %s
+        """, (lease, tuple(jobs.ids)))
+        jobs.invalidate_recordset(['claimed_at'])
+
+    def test_claim_next_claims_pending_jobs_once(self):
+        jobs = self._job() | self._job() | self._job()
+
+        first = self._claim('terminal-a', max_jobs=2)
+        self.assertEqual(first.ids, jobs[:2].ids)
+        self.assertEqual(set(first.mapped('state')), {'printing'})
+        self.assertEqual(set(first.mapped('claimed_by')), {'terminal-a'})
+
+        # 另一个终端只能认领剩下的任务
+        second = self._claim('terminal-b')
+        self.assertEqual(second, jobs[2])
+        self.assertEqual(second.claimed_by, 'terminal-b')
+        self.assertFalse(self._claim('terminal-c'))
+
+    def test_claim_next_reclaims_expired_lease_and_counts_attempt(self):
+        expired, held = self._job(), self._job()
+        self._claim('terminal-a')
+        self._expire_lease(expired)
+
+        reclaimed = self._claim('terminal-b')
+        self.assertEqual(reclaimed, expired)
+        self.assertEqual(expired.claimed_by, 'terminal-b')
+        self.assertEqual(expired.retry_count, 1)
+        # 租约未过期的任务仍属于原终端
+        self.assertEqual(held.claimed_by, 'terminal-a')
+        self.assertEqual(held.retry_count, 0)
+
+    def test_expired_lease_at_max_attempts_goes_to_dead_letter(self):
+        job = self._job()
+        self._claim('terminal-a')
+        job.retry_count = self.env['pos.print.job']._get_max_attempts() - 1
+        self._expire_lease(job)
+
+        self.assertFalse(self._claim('terminal-b'))
+        self.env['pos.print.job']._cron_reclaim_expired_claims()
+        self.assertEqual(job.state, 'dead')
+        self.assertEqual(job.retry_count, self.env['pos.print.job']._get_max_attempts())
+
+    def test_failed_job_is_claimed_when_due(self):
+        job = self._job()
+        self._claim('terminal-a')
+        job.action_mark_failed('printer offline')
+        self.assertEqual(job.state, 'failed')
+        self.assertEqual(job.retry_count, 1)
+
+        # 退避时间未到
+        self.assertFalse(self._claim('terminal-b'))
+
+        job.next_attempt_at = fields.Datetime.now() - timedelta(minutes=1)
+        self.assertEqual(self._claim('terminal-b'), job)
+        self.assertEqual(job.state, 'printing')
+        self.assertEqual(job.retry_count, 1)
+
+    def test_mark_batch_ignores_jobs_claimed_by_another_terminal(self):
+        Job = self.env['pos.print.job']
+        reclaimed, own = self._job(), self._job(printer_name='receipt_printer')
+        self._claim('terminal-a')
+        self._expire_lease(reclaimed)
+        self.assertEqual(self._claim('terminal-b'), reclaimed)
+
+        # terminal-a 的租约已过期，它的结果不能覆盖 terminal-b 的认领
+        done_count, failed_count = Job.mark_batch(
+            'terminal-a', done_ids=[reclaimed.id], failed=[{'job_id': own.id, 'error_message': 'paper out'}],
+        )
+        self.assertEqual((done_count, failed_count), (0, 1))
+        self.assertEqual(reclaimed.state, 'printing')
+        self.assertEqual(reclaimed.claimed_by, 'terminal-b')
+        self.assertEqual(own.state, 'failed')
+
+        self.assertEqual(Job.mark_batch('terminal-b', done_ids=[reclaimed.id]), (1, 0))
+        self.assertEqual(reclaimed.state, 'done')
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+from unittest.mock import patch
+
+from odoo.tests import tagged
+
+from .common import QrOrderingCommon
+
+
+@tagged('post_install', '-at_install')
+class TestPrinterRouting(QrOrderingCommon):
+    """打印机路由表：只在路由读取的数据变化时清除缓存"""
+
+    def setUp(self):
+        super().setUp()
+        self.drinks = self.env['pos.category'].create({'name': 'QR Drinks'})
+        self.food = self.env['pos.category'].create({'name': 'QR Food'})
+        self.printer = self.env['pos.printer'].create({
+            'name': 'QR Bar',
+            'product_categories_ids': [(6, 0, self.drinks.ids)],
+        })
+        self.config.printer_ids = [(4, self.printer.id)]
+
+    def _routing(self):
+        return self.env['pos.config']._get_qr_printer_routing(self.config.id)
+
+    def _clear_cache_calls(self, func):
+        with patch.object(type(self.env.registry), 'clear_cache', autospec=True) as clear_cache:
+            func()
+        return clear_cache.call_count
+
+    def test_category_change_refreshes_routing(self):
+        self.assertEqual(self._routing()['categ_printers'].get(self.drinks.id), {self.printer.id})
+        self.printer.product_categories_ids = [(6, 0, self.food.ids)]
+        routing = self._routing()
+        self.assertNotIn(self.drinks.id, routing['categ_printers'])
+        self.assertEqual(routing['categ_printers'].get(self.food.id), {self.printer.id})
+
+    def test_unrelated_write_keeps_cache(self):
+        self.assertEqual(self._clear_cache_calls(lambda: self.printer.write({'proxy_ip': '10.0.0.9'})), 0)
+        self.assertEqual(self._clear_cache_calls(lambda: self.printer.write({'name': 'QR Bar 2'})), 1)
+
+    def test_unlink_clears_only_linked_printers(self):
+        spare = self.env['pos.printer'].create({'name': 'QR Spare'})
+        self.assertEqual(self._clear_cache_calls(spare.unlink), 0)
+        printer_id = self.printer.id
+        self.assertEqual(self._clear_cache_calls(self.printer.unlink), 1)
+        self.assertNotIn(printer_id, [printer[0] for printer in self._routing()['printers']])
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import os
+import select
+from datetime import datetime, timedelta
+
+from odoo.sql_db import db_connect
+from odoo.tests import TransactionCase, tagged
+
+from ..services.session_cache import NOTIFY_CHANNEL, SessionCache
+
+
+@tagged('post_install', '-at_install')
+class TestSessionCacheInvalidation(TransactionCase):
+    """跨 worker 失效：一个 worker 的失效通知能清除另一个 worker 的缓存条目"""
+
+    def _worker(self, token):
+        """模拟一个 worker 的缓存，已缓存 token 对应的会话（不启动监听线程）"""
+        cache = SessionCache()
+        cache._listener_pid = os.getpid()
+        dbname = self.env.cr.dbname
+        cache.put(dbname, token, cache.generation(dbname, token),
+                  1, 1, 'access', 'ordering', datetime.utcnow() + timedelta(hours=1))
+        return cache
+
+    def _get(self, cache, token):
+        return cache.get(self.env.cr.dbname, token, datetime.utcnow())
+
+    def test_invalidate_notifies_after_commit_on_postgres(self):
+        worker_a, worker_b = self._worker('token-1'), self._worker('token-1')
+
+        # 其他 worker 的监听线程在 postgres 库上 LISTEN
+        with db_connect('postgres').cursor() as listen_cr:
+            listen_cr.execute(f'LISTEN {NOTIFY_CHANNEL}')
+            listen_cr.commit()
+            conn = listen_cr._cnx
+
+            worker_a.invalidate(self.env.cr, ['token-1'])
+            self.assertIsNone(self._get(worker_a, 'token-1'))
+            # 提交前不发送；提交后（postcommit）在 postgres 库上发送
+            self.assertIsNotNone(self._get(worker_b, 'token-1'))
+            self.env.cr.postcommit.run()
+
+            delivered = []
+            for _attempt in range(50):
+                select.select([conn], [], [], 0.1)
+                conn.poll()
+                while conn.notifies:
+                    delivered.append(conn.notifies.pop().payload)
+                if delivered:
+                    break
+            self.assertTrue(delivered, "invalidation must be delivered to listeners on the postgres database")
+            for payload in delivered:
+                worker_b._handle_notification(payload)
+
+        self.assertIsNone(self._get(worker_b, 'token-1'))
+
+    def test_invalidations_in_one_transaction_share_one_notification(self):
+        cache = self._worker('token-1')
+        cache.invalidate(self.env.cr, ['token-1'])
+        cache.invalidate(self.env.cr, ['token-2', 'token-1'])
+        self.assertEqual(self.env.cr.postcommit.data[NOTIFY_CHANNEL], {'token-1', 'token-2'})
+        self.env.cr.postcommit.clear()